@@ -0,0 +1,195 @@
+"""This module contains utility functions to compute and compare file checksums in the formats used by
+Google Cloud Storage and the HCA file descriptors.
+"""
+import base64
+import functools
+import hashlib
+import os
+
+import google_crc32c
+
+from pipeline_tools.shared import process_utils
+
+
+# Reversed polynomial of CRC-32C (Castagnoli), used to combine checksums of adjacent byte ranges
+CRC32C_POLYNOMIAL = 0x82F63B78
+
+# Size of the reads used to checksum local files, large enough to amortize the per-call overhead of the hashes
+CHECKSUM_READ_SIZE = 16 * 1024 * 1024
+
+# Number of files checksummed concurrently, one process per core since hashing is CPU bound
+CHECKSUM_WORKERS = os.cpu_count() or 1
+
+
+def crc32c_value(data, crc=0):
+    """Compute (or extend) the CRC-32C checksum of a bytes-like object.
+
+    Args:
+        data (bytes): The bytes to checksum.
+        crc (int): A running checksum to extend, 0 to start a new one.
+
+    Returns:
+        int: The unsigned 32-bit checksum.
+    """
+    return google_crc32c.extend(crc, data)
+
+
+def _gf2_matrix_times(matrix, vector):
+    total = 0
+    index = 0
+    while vector:
+        if vector & 1:
+            total ^= matrix[index]
+        vector >>= 1
+        index += 1
+    return total
+
+
+def _gf2_matrix_square(matrix):
+    return [_gf2_matrix_times(matrix, matrix[n]) for n in range(32)]
+
+
+def crc32c_combine(crc1, crc2, length2):
+    """Combine the checksums of two adjacent byte ranges into the checksum of their concatenation.
+
+    This is the CRC-32C flavour of zlib's crc32_combine, which lets byte ranges be checksummed independently
+    (e.g. by parallel download workers) without re-reading the assembled file.
+
+    Args:
+        crc1 (int): Checksum of the first range.
+        crc2 (int): Checksum of the second range.
+        length2 (int): Length in bytes of the second range.
+
+    Returns:
+        int: The checksum of the first range followed by the second range.
+    """
+    if length2 <= 0:
+        return crc1
+
+    # Operator for one zero bit, then two and four zero bits
+    odd = [CRC32C_POLYNOMIAL] + [1 << n for n in range(31)]
+    even = _gf2_matrix_square(odd)
+    odd = _gf2_matrix_square(even)
+
+    # Apply length2 zero bytes to crc1, squaring the operator for each bit of length2
+    while True:
+        even = _gf2_matrix_square(odd)
+        if length2 & 1:
+            crc1 = _gf2_matrix_times(even, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+
+        odd = _gf2_matrix_square(even)
+        if length2 & 1:
+            crc1 = _gf2_matrix_times(odd, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+
+    return crc1 ^ crc2
+
+
+def crc32c_to_hex(crc):
+    """Format a checksum the way the file descriptors (and `gsutil hash -h`) report it, e.g. 'e598a0f6'."""
+    return '{:08x}'.format(crc)
+
+
+def crc32c_to_base64(crc):
+    """Format a checksum the way Google Cloud Storage object metadata reports it, e.g. '5ZiA9g=='."""
+    return base64.b64encode(crc.to_bytes(4, 'big')).decode('ascii')
+
+
+def crc32c_from_base64(encoded_crc):
+    """Parse a checksum from Google Cloud Storage object metadata into an unsigned 32-bit integer."""
+    return int.from_bytes(base64.b64decode(encoded_crc), 'big')
+
+
+def file_crc32c(path, read_size=8 * 1024 * 1024):
+    """Compute the CRC-32C checksum of a local file.
+
+    Args:
+        path (str): Path of the file.
+        read_size (int): Number of bytes read at a time.
+
+    Returns:
+        int: The unsigned 32-bit checksum.
+    """
+    crc = 0
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(read_size), b''):
+            crc = crc32c_value(data, crc)
+    return crc
+
+
+def compute_checksums(
+    path, sha256=True, crc32c=True, md5=False, read_size=CHECKSUM_READ_SIZE
+):
+    """Compute the size and checksums of a local file in a single read pass.
+
+    Every requested hash is fed the same buffer, so a file is read once however many checksums are needed.
+
+    Args:
+        path (str): Path of the file.
+        sha256 (bool): Whether to compute the sha256 digest.
+        crc32c (bool): Whether to compute the CRC-32C checksum.
+        md5 (bool): Whether to compute the md5 digest.
+        read_size (int): Number of bytes read at a time.
+
+    Returns:
+        dict: The size in bytes under `size`, and the requested checksums as lowercase hex strings under
+            `sha256`, `crc32c` and `md5`, in the formats used by the file descriptors.
+    """
+    hashes = {}
+    if sha256:
+        hashes['sha256'] = hashlib.sha256()
+    if md5:
+        hashes['md5'] = hashlib.md5()
+    crc = 0
+    size = 0
+    with open(path, 'rb', buffering=0) as f:
+        for data in iter(lambda: f.read(read_size), b''):
+            size += len(data)
+            for digest in hashes.values():
+                digest.update(data)
+            if crc32c:
+                crc = crc32c_value(data, crc)
+
+    checksums = {'size': size}
+    for name, digest in hashes.items():
+        checksums[name] = digest.hexdigest()
+    if crc32c:
+        checksums['crc32c'] = crc32c_to_hex(crc)
+    return checksums
+
+
+def compute_checksums_parallel(
+    paths,
+    sha256=True,
+    crc32c=True,
+    md5=False,
+    num_workers=CHECKSUM_WORKERS,
+    read_size=CHECKSUM_READ_SIZE,
+):
+    """Compute the size and checksums of many local files, spread over a pool of processes.
+
+    Args:
+        paths (list): Paths of the files.
+        sha256 (bool): Whether to compute the sha256 digests.
+        crc32c (bool): Whether to compute the CRC-32C checksums.
+        md5 (bool): Whether to compute the md5 digests.
+        num_workers (int): Maximum number of files checksummed concurrently.
+        read_size (int): Number of bytes read at a time.
+
+    Returns:
+        list: The checksums of each file as returned by compute_checksums, in the order of paths.
+    """
+    checksum_fn = functools.partial(
+        compute_checksums, sha256=sha256, crc32c=crc32c, md5=md5, read_size=read_size
+    )
+    paths = list(paths)
+    if num_workers <= 1 or len(paths) <= 1:
+        return [checksum_fn(path) for path in paths]
+    return process_utils.process_map(
+        checksum_fn, paths, num_workers=min(num_workers, len(paths))
+    )
@@ -11,4 +11,8 @@ class SubmissionError(Exception):
 
 
 class UnsupportedPipelineType(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class ChecksumMismatchError(Exception):
+    pass
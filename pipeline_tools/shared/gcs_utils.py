@@ -2,9 +2,34 @@
 """
 import google.auth
 import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud import storage
 from io import BytesIO
 
+from pipeline_tools.shared import checksum_utils, transfer_utils
+from pipeline_tools.shared.exceptions import ChecksumMismatchError
+
+
+# Size of the byte range fetched by each request of a sliced download
+DOWNLOAD_SLICE_SIZE = 64 * 1024 * 1024
+
+# Number of byte ranges fetched concurrently by a sliced download
+DOWNLOAD_WORKERS = 8
+
+# Files of at least this size are sent with a resumable upload, smaller ones in a single request
+RESUMABLE_UPLOAD_THRESHOLD = 8 * 1024 * 1024
+
+# Size of each request of a resumable upload, must be a multiple of 256 KiB
+RESUMABLE_UPLOAD_CHUNK_SIZE = 32 * 1024 * 1024
+
+# Only request the object fields kept in metadata records when listing a prefix
+LIST_BLOB_FIELDS = (
+    'items(name,size,crc32c,md5Hash,contentType,generation,timeCreated,updated),'
+    'nextPageToken'
+)
+
 
 def get_filename_from_gs_link(link):
     """Get the filename corresponding to a google_storage link.
@@ -35,17 +60,19 @@ def parse_bucket_blob_from_gs_link(path):
     return bucket, blob
 
 
-def download_to_buffer(blob):
+def download_to_buffer(blob, start=None, end=None):
     """Return a bytes file-like object readable by requests and REST APIs.
 
     Args:
         blob (google.cloud.storage.Blob): google storage blob
+        start (int): Optional offset of the first byte to download.
+        end (int): Optional offset of the last byte to download.
 
     Returns:
         _io.BufferedIOBase: readable file object
     """
     bytes_buffer = BytesIO()
-    blob.download_to_file(bytes_buffer)
+    blob.download_to_file(bytes_buffer, start=start, end=end)
     bytes_buffer.seek(0)
     return bytes_buffer
 
@@ -75,6 +102,366 @@ def download_gcs_blob(gcs_client, bucket_name, source_blob_name):
     return download_to_buffer(blob)
 
 
+class _RangeWriter(object):
+    """This class implements a file-like object writing a byte range straight into its place in an open file.
+
+        The CRC-32C of the bytes and their count are kept as they are written, so a range is never buffered
+        in memory. Bytes past the end of the range are refused, so they cannot overwrite the next range.
+    """
+
+    def __init__(self, f, length):
+        self.f = f
+        self.length = length
+        self.crc = 0
+        self.size = 0
+
+    def write(self, data):
+        if self.size + len(data) > self.length:
+            raise IOError(
+                'Got more than the {0} bytes of the range'.format(self.length)
+            )
+        self.f.write(data)
+        self.crc = checksum_utils.crc32c_value(data, self.crc)
+        self.size += len(data)
+        return len(data)
+
+
+def _download_slice(blob, destination, start, end):
+    """Download the inclusive byte range [start, end] of a blob into the same range of a preallocated file.
+
+    Args:
+        blob (google.cloud.storage.Blob): google storage blob, pinned to a generation.
+        destination (str): Path to the preallocated local file.
+        start (int): Offset of the first byte of the range.
+        end (int): Offset of the last byte of the range.
+
+    Returns:
+        int: The CRC-32C checksum of the downloaded range.
+    """
+    with open(destination, 'r+b') as f:
+        f.seek(start)
+        writer = _RangeWriter(f, end - start + 1)
+        blob.download_to_file(writer, start=start, end=end)
+
+    if writer.size != writer.length:
+        raise IOError(
+            'Expected {0} bytes for range {1}-{2} of {3}, got {4}'.format(
+                writer.length, start, end, blob.name, writer.size
+            )
+        )
+    return writer.crc
+
+
+def download_gcs_blob_to_file(
+    gcs_client,
+    bucket_name,
+    source_blob_name,
+    destination,
+    num_workers=DOWNLOAD_WORKERS,
+    slice_size=DOWNLOAD_SLICE_SIZE,
+):
+    """Download a blob to a local file using concurrent byte-range requests.
+
+    The destination file is preallocated to the size of the blob and each worker writes its range in place,
+    so a large object is fetched over several connections instead of a single stream. The checksums of the
+    ranges are combined and compared against the crc32c stored in the blob metadata once all ranges are done.
+
+    Args:
+        gcs_client (GoogleCloudStorageClient): A GoogleCloudStorageClient object with a
+            google.cloud.storage.client.Client instance as a lazy-initialized property.
+        bucket_name (str): A string of bucket name.
+        source_blob_name (str): A string of source blob name that to be downloaded.
+        destination (str): Path of the local file to write.
+        num_workers (int): Maximum number of byte ranges to download concurrently.
+        slice_size (int): Size in bytes of each byte range.
+
+    Returns:
+        str: The path of the downloaded file.
+
+    Raises:
+        google.cloud.exceptions.NotFound: if the blob does not exist.
+        ChecksumMismatchError: if the crc32c of the downloaded file does not match the blob metadata.
+    """
+    authenticated_gcs_client = gcs_client.storage_client
+    bucket = authenticated_gcs_client.bucket(bucket_name)
+    blob = bucket.blob(source_blob_name)
+    blob.reload()
+    logging.debug(
+        'bucket: {0}, blob: {1}, size: {2}'.format(
+            bucket_name, source_blob_name, blob.size
+        )
+    )
+
+    # Byte ranges of gzip-encoded blobs do not line up with the decompressed content, so fall back to one stream
+    if blob.content_encoding == 'gzip':
+        blob.download_to_filename(destination)
+        return destination
+
+    size = blob.size
+    with open(destination, 'wb') as f:
+        f.truncate(size)
+
+    ranges = [
+        (start, min(start + slice_size, size) - 1)
+        for start in range(0, size, slice_size)
+    ]
+    # Pin every range to the generation that was just inspected, so an overwrite mid-download cannot mix contents
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        futures = [
+            executor.submit(
+                _download_slice,
+                bucket.blob(source_blob_name, generation=blob.generation),
+                destination,
+                start,
+                end,
+            )
+            for start, end in ranges
+        ]
+        crcs = [future.result() for future in futures]
+
+    crc = 0
+    for (start, end), range_crc in zip(ranges, crcs):
+        crc = checksum_utils.crc32c_combine(crc, range_crc, end - start + 1)
+
+    if blob.crc32c and checksum_utils.crc32c_from_base64(blob.crc32c) != crc:
+        os.remove(destination)
+        raise ChecksumMismatchError(
+            'crc32c of gs://{0}/{1} is {2}, downloaded file has {3}'.format(
+                bucket_name,
+                source_blob_name,
+                blob.crc32c,
+                checksum_utils.crc32c_to_base64(crc),
+            )
+        )
+    return destination
+
+
+def upload_file(gcs_client, source, destination):
+    """Upload a local file to a blob in a single attempt.
+
+    Files of at least RESUMABLE_UPLOAD_THRESHOLD bytes are sent with a resumable upload, smaller ones in a
+    single request.
+
+    Args:
+        gcs_client (GoogleCloudStorageClient): A GoogleCloudStorageClient object with a
+            google.cloud.storage.client.Client instance as a lazy-initialized property.
+        source (str): Path of the local file to upload.
+        destination (str): gs:// link of the object to write.
+
+    Returns:
+        dict: The metadata record of the uploaded object, as returned by get_blob_metadata_record.
+    """
+    bucket_name, blob_name = parse_bucket_blob_from_gs_link(destination)
+    size = os.path.getsize(source)
+    chunk_size = (
+        RESUMABLE_UPLOAD_CHUNK_SIZE if size >= RESUMABLE_UPLOAD_THRESHOLD else None
+    )
+    blob = gcs_client.storage_client.bucket(bucket_name).blob(
+        blob_name, chunk_size=chunk_size
+    )
+    blob.upload_from_filename(source)
+    record = get_blob_metadata_record(bucket_name, blob)
+    # The upload response may omit the size of the object, but it is known here
+    record['size'] = size
+    return record
+
+
+def copy_blob(gcs_client, source, destination):
+    """Copy an object to another gs:// link without downloading it, in a single attempt.
+
+    The copy is made with rewrite calls, so large objects and copies across locations or storage classes are
+    completed in several server-side steps.
+
+    Args:
+        gcs_client (GoogleCloudStorageClient): A GoogleCloudStorageClient object with a
+            google.cloud.storage.client.Client instance as a lazy-initialized property.
+        source (str): gs:// link of the object to copy.
+        destination (str): gs:// link of the object to write.
+
+    Returns:
+        dict: The metadata record of the new object, as returned by get_blob_metadata_record.
+    """
+    source_bucket_name, source_blob_name = parse_bucket_blob_from_gs_link(source)
+    bucket_name, blob_name = parse_bucket_blob_from_gs_link(destination)
+    source_blob = gcs_client.storage_client.bucket(source_bucket_name).blob(
+        source_blob_name
+    )
+    blob = gcs_client.storage_client.bucket(bucket_name).blob(blob_name)
+
+    token, _, _ = blob.rewrite(source_blob)
+    while token is not None:
+        token, _, _ = blob.rewrite(source_blob, token=token)
+    return get_blob_metadata_record(bucket_name, blob)
+
+
+def upload_files(
+    gcs_client,
+    transfers,
+    num_workers=transfer_utils.TRANSFER_WORKERS,
+    max_attempts=transfer_utils.TRANSFER_MAX_ATTEMPTS,
+):
+    """Upload local files to Google Cloud Storage concurrently.
+
+    Small files (e.g. metadata JSONs) are sent in a single request while large ones use resumable uploads.
+    Each file is retried with exponential backoff; a file that still fails is recorded in the summary rather
+    than aborting the other uploads, so callers must check the `failed` count.
+
+    Args:
+        gcs_client (GoogleCloudStorageClient): A GoogleCloudStorageClient object with a
+            google.cloud.storage.client.Client instance as a lazy-initialized property.
+        transfers (list): A list of (local path, gs:// destination) tuples. Like gsutil cp, a destination
+            ending with '/' means "into this directory".
+        num_workers (int): Maximum number of files uploaded concurrently.
+        max_attempts (int): Maximum number of attempts for each file.
+
+    Returns:
+        dict: A summary with the number of files, succeeded and failed uploads, total bytes and seconds,
+            and the per-file results under `transfers`, in the order of the input.
+    """
+    # Make sure the lazy property storage_client is initialized before it is shared by the workers
+    gcs_client.storage_client
+
+    transfers = [
+        (source, destination + os.path.basename(source))
+        if destination.endswith('/')
+        else (source, destination)
+        for source, destination in transfers
+    ]
+    return transfer_utils.run_transfers(
+        transfers,
+        lambda source, destination: upload_file(gcs_client, source, destination)[
+            'size'
+        ],
+        num_workers=num_workers,
+        max_attempts=max_attempts,
+    )
+
+
+def _isoformat(timestamp):
+    return timestamp.isoformat() if timestamp else None
+
+
+def get_blob_metadata_record(bucket_name, blob):
+    """Extract the metadata needed to describe or compare an object into a JSON-serializable dict.
+
+    Args:
+        bucket_name (str): A string of bucket name.
+        blob (google.cloud.storage.Blob): google storage blob with its properties loaded.
+
+    Returns:
+        dict: The gs:// link of the object under `name`, and its size, crc32c and md5_hash (base64 encoded,
+            as reported by GCS), content_type, generation and time_created/updated ISO-8601 timestamps.
+    """
+    return {
+        'name': 'gs://{0}/{1}'.format(bucket_name, blob.name),
+        'size': int(blob.size) if blob.size is not None else None,
+        'crc32c': blob.crc32c,
+        'md5_hash': blob.md5_hash,
+        'content_type': blob.content_type,
+        'generation': int(blob.generation) if blob.generation is not None else None,
+        'time_created': _isoformat(blob.time_created),
+        'updated': _isoformat(blob.updated),
+    }
+
+
+class BlobMetadataCache(object):
+    """This class implements an in-memory cache of object metadata records, keyed by gs:// link.
+
+        Prefixes listed during this run are remembered, so lookups under them are answered from memory,
+        including for objects that do not exist. A cache can be shared by concurrent transfers.
+    """
+
+    def __init__(self):
+        self.records = {}
+        self.listed_prefixes = set()
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        """Return the cached record of an object, or None if it is unknown."""
+        return self.records.get(path)
+
+    def is_listed(self, path):
+        """Whether the object falls under a prefix listed during this run, so its record (or absence) is current."""
+        return any(path.startswith(prefix) for prefix in self.listed_prefixes)
+
+    def update(self, records, listed_prefix=None):
+        """Add records to the cache, keeping the latest generation of each object.
+
+        Args:
+            records (iterable): Metadata records as returned by get_blob_metadata_record.
+            listed_prefix (str): gs:// prefix the records are a complete listing of, if any. Cached objects
+                under it which are not in records have been deleted and are dropped.
+        """
+        with self.lock:
+            if listed_prefix is not None:
+                self.records = {
+                    path: record
+                    for path, record in self.records.items()
+                    if not path.startswith(listed_prefix)
+                }
+                self.listed_prefixes.add(listed_prefix)
+
+            for record in records:
+                cached = self.records.get(record['name'])
+                if cached and (cached['generation'] or 0) > (record['generation'] or 0):
+                    continue
+                self.records[record['name']] = record
+
+
+def list_blob_metadata(gcs_client, gs_prefix, cache=None):
+    """List the metadata of every object under a prefix with paged bulk calls.
+
+    One list request returns up to 1000 objects, so this replaces a per-file `gsutil ls -l` or stat call.
+
+    Args:
+        gcs_client (GoogleCloudStorageClient): A GoogleCloudStorageClient object with a
+            google.cloud.storage.client.Client instance as a lazy-initialized property.
+        gs_prefix (str): gs:// link of the prefix to list, e.g. gs://bucket/staging/data/
+        cache (BlobMetadataCache): Optional cache to refresh with the listing.
+
+    Returns:
+        dict: Metadata records as returned by get_blob_metadata_record, keyed by gs:// link.
+    """
+    bucket_name, prefix = parse_bucket_blob_from_gs_link(gs_prefix)
+    bucket = gcs_client.storage_client.bucket(bucket_name)
+
+    records = {}
+    for blob in bucket.list_blobs(prefix=prefix, fields=LIST_BLOB_FIELDS):
+        record = get_blob_metadata_record(bucket_name, blob)
+        records[record['name']] = record
+    logging.debug('Listed {0} objects under {1}'.format(len(records), gs_prefix))
+
+    if cache is not None:
+        cache.update(records.values(), listed_prefix=gs_prefix)
+    return records
+
+
+def get_blob_metadata(gcs_client, gs_path, cache=None):
+    """Get the metadata of a single object, answering from the cache when its prefix has been listed.
+
+    Args:
+        gcs_client (GoogleCloudStorageClient): A GoogleCloudStorageClient object with a
+            google.cloud.storage.client.Client instance as a lazy-initialized property.
+        gs_path (str): gs:// link of the object.
+        cache (BlobMetadataCache): Optional cache to read from and refresh.
+
+    Returns:
+        dict: The metadata record as returned by get_blob_metadata_record, or None if the object does not exist.
+    """
+    if cache is not None and cache.is_listed(gs_path):
+        return cache.get(gs_path)
+
+    bucket_name, blob_name = parse_bucket_blob_from_gs_link(gs_path)
+    blob = gcs_client.storage_client.bucket(bucket_name).get_blob(blob_name)
+    if blob is None:
+        return None
+
+    record = get_blob_metadata_record(bucket_name, blob)
+    if cache is not None:
+        cache.update([record])
+    return record
+
+
 class LazyProperty(object):
     """This class implements a decorator for lazy-initializing class properties.
 
@@ -0,0 +1,197 @@
+"""This module contains utility functions to read selected values out of large JSON files, such as Cromwell workflow
+metadata, without loading the whole document.
+
+Paths are tuples of object keys and array indices, e.g. ('calls', 'Optimus.OptimusLoomGeneration', 0, 'inputs'),
+where '*' matches any key or index. The file is memory-mapped and scanned with compiled regular expressions: values
+off the requested paths are skipped without being decoded, and only the values at the end of a path are decoded
+with the json module, so memory and parse time scale with what is extracted rather than with the file size.
+"""
+import json
+import mmap
+import re
+
+
+# Wildcard matching any object key or array index in a path
+WILDCARD = '*'
+
+# Marks a path ending, below which the whole value is decoded
+_WHOLE_VALUE = True
+
+_WHITESPACE = re.compile(rb'[ \t\n\r]*')
+_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"')
+_SCALAR = re.compile(rb'[^,:\]}\s]+')
+# Strings are matched whole so that brackets inside them are not counted
+_CONTAINER_TOKEN = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{}]')
+
+
+def build_selector(paths):
+    """Merge paths into a tree of the keys to descend into.
+
+    Args:
+        paths (list): Tuples of object keys, array indices or WILDCARD.
+
+    Returns:
+        dict: Nested dicts keyed by path element, with True where a path ends.
+    """
+    selector = {}
+    for path in paths:
+        if not path:
+            return _WHOLE_VALUE
+        node = selector
+        for element in path[:-1]:
+            child = node.get(element)
+            if child is _WHOLE_VALUE:
+                break
+            node = node.setdefault(element, {})
+        else:
+            node[path[-1]] = _WHOLE_VALUE
+    return selector
+
+
+def _merge_selectors(first, second):
+    if first is None or second is None:
+        return first if second is None else second
+    if first is _WHOLE_VALUE or second is _WHOLE_VALUE:
+        return _WHOLE_VALUE
+    merged = dict(first)
+    for element, child in second.items():
+        merged[element] = _merge_selectors(merged.get(element), child)
+    return merged
+
+
+def _child_selector(selector, element):
+    return _merge_selectors(selector.get(element), selector.get(WILDCARD))
+
+
+class _SelectiveReader(object):
+    """Walks a JSON document in a buffer, decoding only the values selected by a selector tree."""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def _skip_whitespace(self, position):
+        return _WHITESPACE.match(self.buffer, position).end()
+
+    def _expect(self, position, token):
+        position = self._skip_whitespace(position)
+        if self.buffer[position : position + 1] != token:
+            raise ValueError(
+                'Expecting {0!r} at byte {1} of the JSON document'.format(
+                    token.decode(), position
+                )
+            )
+        return position + 1
+
+    def skip_value(self, position):
+        """Return the position just past the value starting at position, without decoding it."""
+        first = self.buffer[position : position + 1]
+        if first == b'"':
+            match = _STRING.match(self.buffer, position)
+        elif first in (b'{', b'['):
+            depth = 0
+            for match in _CONTAINER_TOKEN.finditer(self.buffer, position):
+                token = match.group()[:1]
+                if token in (b'{', b'['):
+                    depth += 1
+                elif token in (b'}', b']'):
+                    depth -= 1
+                    if not depth:
+                        return match.end()
+            match = None
+        else:
+            match = _SCALAR.match(self.buffer, position)
+        if not match:
+            raise ValueError(
+                'Invalid JSON value at byte {0} of the JSON document'.format(position)
+            )
+        return match.end()
+
+    def _decode_key(self, position):
+        match = _STRING.match(self.buffer, position)
+        if not match:
+            raise ValueError(
+                'Expecting an object key at byte {0} of the JSON document'.format(
+                    position
+                )
+            )
+        key = match.group()
+        if b'\\' in key:
+            return json.loads(key.decode('utf-8')), match.end()
+        return key[1:-1].decode('utf-8'), match.end()
+
+    def read_value(self, position, selector):
+        """Return the selected part of the value starting at position and the position just past it."""
+        position = self._skip_whitespace(position)
+        first = self.buffer[position : position + 1]
+        if selector is _WHOLE_VALUE or first not in (b'{', b'['):
+            end = self.skip_value(position)
+            return json.loads(self.buffer[position:end].decode('utf-8')), end
+        if first == b'{':
+            return self._read_object(position + 1, selector)
+        return self._read_array(position + 1, selector)
+
+    def _read_object(self, position, selector):
+        selected = {}
+        position = self._skip_whitespace(position)
+        if self.buffer[position : position + 1] == b'}':
+            return selected, position + 1
+        while True:
+            key, position = self._decode_key(self._skip_whitespace(position))
+            position = self._skip_whitespace(self._expect(position, b':'))
+            child = _child_selector(selector, key)
+            if child is None:
+                position = self.skip_value(position)
+            else:
+                selected[key], position = self.read_value(position, child)
+            position = self._skip_whitespace(position)
+            separator = self.buffer[position : position + 1]
+            if separator == b'}':
+                return selected, position + 1
+            position = self._expect(position, b',')
+
+    def _read_array(self, position, selector):
+        # A wildcard keeps the whole array as a list, otherwise the selected elements are keyed by index
+        selected = [] if WILDCARD in selector else {}
+        position = self._skip_whitespace(position)
+        if self.buffer[position : position + 1] == b']':
+            return selected, position + 1
+        index = 0
+        while True:
+            position = self._skip_whitespace(position)
+            child = _child_selector(selector, index)
+            if child is None:
+                position = self.skip_value(position)
+            elif isinstance(selected, list):
+                value, position = self.read_value(position, child)
+                selected.append(value)
+            else:
+                selected[index], position = self.read_value(position, child)
+            position = self._skip_whitespace(position)
+            if self.buffer[position : position + 1] == b']':
+                return selected, position + 1
+            position = self._expect(position, b',')
+            index += 1
+
+
+def read_json_paths(json_path, paths):
+    """Read the values at the given paths out of a JSON file, skipping everything else.
+
+    Args:
+        json_path (str): Path of the JSON file.
+        paths (list): Tuples of object keys, array indices or WILDCARD, e.g. [('inputs', WILDCARD), ('start',)].
+
+    Returns:
+        The document pruned to the selected paths: objects only keep the selected keys, arrays selected with
+            WILDCARD are lists and arrays selected by index are dicts keyed by index, so lookups such as
+            metadata['calls'][name][0] work as on the full document. Missing paths are left out.
+    """
+    selector = build_selector(paths)
+    with open(json_path, 'rb') as f:
+        if selector is _WHOLE_VALUE:
+            return json.load(f)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            reader = _SelectiveReader(buffer)
+            value, position = reader.read_value(0, selector)
+            if reader._skip_whitespace(position) != len(buffer):
+                raise ValueError('Extra data after the JSON document')
+            return value
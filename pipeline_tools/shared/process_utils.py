@@ -0,0 +1,32 @@
+"""This module contains utility functions to spread work over a pool of worker processes.
+"""
+import multiprocessing
+
+
+def process_map(fn, items, num_workers):
+    """Apply fn to every item in a pool of worker processes, returning the results in the order of items.
+
+    Workers are spawned rather than forked. A process that has loaded native libraries with their own threads,
+    like the numba functions compiled when loompy is imported, cannot be forked safely: the children inherit
+    those threads' locks in an unusable state and hang on exit. The pool is closed and joined once every result
+    is in, or terminated if a call raised, so no worker outlives the call.
+
+    Args:
+        fn (function): Picklable function of one argument, e.g. a module-level function or a partial of one.
+        items (iterable): Picklable arguments to call fn with.
+        num_workers (int): Number of worker processes.
+
+    Returns:
+        list: The result of fn for each item.
+    """
+    items = list(items)
+    pool = multiprocessing.get_context("spawn").Pool(num_workers)
+    try:
+        results = pool.map(fn, items)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return results
@@ -0,0 +1,488 @@
+"""This module contains storage backends which give the submission tools one interface to read, write, list and
+stat objects, whatever the storage behind a URL is.
+
+Backends are selected by URL scheme with get_storage_backend: gs:// links use Google Cloud Storage, while file://
+URLs and plain paths use a local directory tree. This lets the same code stage outputs to a bucket, or to a
+scratch disk for offline runs and benchmarks.
+
+Object metadata is described by the same records as gcs_utils.get_blob_metadata_record, with the object URL under
+`name` and base64 encoded crc32c and md5_hash.
+"""
+import abc
+import base64
+import datetime
+import mimetypes
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from pipeline_tools.shared import checksum_utils, gcs_utils, transfer_utils
+from pipeline_tools.shared.exceptions import ChecksumMismatchError
+
+
+# OAuth 2.0 scope requested when a backend has to create its own Google Cloud Storage client
+GCS_READ_WRITE_SCOPE = 'https://www.googleapis.com/auth/devstorage.read_write'
+
+# Size of the reads used to checksum local files
+LOCAL_READ_SIZE = 8 * 1024 * 1024
+
+
+class StorageBackend(abc.ABC):
+    """This class defines the operations every storage backend implements.
+
+        URLs passed to a backend always name a single object (no trailing '/'), except for the prefix of list.
+        Byte ranges are inclusive of both ends, like HTTP and Google Cloud Storage ranges.
+    """
+
+    scheme = None
+
+    @abc.abstractmethod
+    def read(self, url):
+        """Return the content of an object as bytes."""
+
+    @abc.abstractmethod
+    def read_range(self, url, start, end):
+        """Return the bytes from offset start to offset end (inclusive) of an object."""
+
+    @abc.abstractmethod
+    def write(self, url, data):
+        """Create or replace an object with the given bytes, returning its metadata record."""
+
+    @abc.abstractmethod
+    def upload(self, local_path, url):
+        """Create or replace an object with the content of a local file, returning its metadata record."""
+
+    @abc.abstractmethod
+    def download(self, url, local_path):
+        """Write the content of an object to a local file."""
+
+    @abc.abstractmethod
+    def list(self, prefix):
+        """Return the metadata records of every object whose URL starts with prefix, keyed by URL."""
+
+    @abc.abstractmethod
+    def stat(self, url):
+        """Return the metadata record of an object, or None if it does not exist."""
+
+
+class GCSStorageBackend(StorageBackend):
+    """This class implements a storage backend for gs:// links on top of gcs_utils.
+
+        Metadata records are kept in a gcs_utils.BlobMetadataCache, so once a prefix has been listed, stat calls
+        under it do not make any request.
+    """
+
+    scheme = 'gs'
+
+    def __init__(self, gcs_client=None, cache=None):
+        """
+        Args:
+            gcs_client (GoogleCloudStorageClient): Client to use, by default one with application default
+                credentials and read/write scope.
+            cache (gcs_utils.BlobMetadataCache): Metadata cache to use, by default an in-memory one.
+        """
+        self.gcs_client = gcs_client or gcs_utils.GoogleCloudStorageClient(
+            key_location=None, scopes=[GCS_READ_WRITE_SCOPE]
+        )
+        self.cache = cache if cache is not None else gcs_utils.BlobMetadataCache()
+
+    def _blob(self, url):
+        bucket_name, blob_name = gcs_utils.parse_bucket_blob_from_gs_link(url)
+        return self.gcs_client.storage_client.bucket(bucket_name).blob(blob_name)
+
+    def read(self, url):
+        return gcs_utils.download_to_buffer(self._blob(url)).getvalue()
+
+    def read_range(self, url, start, end):
+        blob = self._blob(url)
+        return gcs_utils.download_to_buffer(blob, start=start, end=end).getvalue()
+
+    def write(self, url, data):
+        bucket_name, _ = gcs_utils.parse_bucket_blob_from_gs_link(url)
+        blob = self._blob(url)
+        blob.upload_from_string(data)
+        record = gcs_utils.get_blob_metadata_record(bucket_name, blob)
+        # The upload response may omit the size of the object, but it is known here
+        record['size'] = len(data)
+        self.cache.update([record])
+        return record
+
+    def upload(self, local_path, url):
+        record = gcs_utils.upload_file(self.gcs_client, local_path, url)
+        self.cache.update([record])
+        return record
+
+    def copy(self, source, url):
+        """Copy another gs:// object to url on the server side, returning the metadata record of the copy."""
+        record = gcs_utils.copy_blob(self.gcs_client, source, url)
+        self.cache.update([record])
+        return record
+
+    def download(self, url, local_path):
+        bucket_name, blob_name = gcs_utils.parse_bucket_blob_from_gs_link(url)
+        gcs_utils.download_gcs_blob_to_file(
+            self.gcs_client, bucket_name, blob_name, local_path
+        )
+
+    def list(self, prefix):
+        return gcs_utils.list_blob_metadata(self.gcs_client, prefix, cache=self.cache)
+
+    def stat(self, url):
+        return gcs_utils.get_blob_metadata(self.gcs_client, url, cache=self.cache)
+
+
+class LocalRecord(dict):
+    """This class implements the metadata record of a local file, whose checksums are only computed when read.
+
+        Listing a directory or comparing sizes then does not read every file. The crc32c and md5_hash of the
+        file are computed together, in one read, the first time either of them is looked up.
+    """
+
+    CHECKSUM_FIELDS = ('crc32c', 'md5_hash')
+
+    def __init__(self, path, **fields):
+        super().__init__(**fields)
+        self.path = path
+
+    def __missing__(self, key):
+        if key not in self.CHECKSUM_FIELDS:
+            raise KeyError(key)
+        checksums = checksum_utils.compute_checksums(
+            self.path, sha256=False, md5=True, read_size=LOCAL_READ_SIZE
+        )
+        self['crc32c'] = checksum_utils.crc32c_to_base64(int(checksums['crc32c'], 16))
+        self['md5_hash'] = base64.b64encode(bytes.fromhex(checksums['md5'])).decode(
+            'ascii'
+        )
+        return self[key]
+
+    def get(self, key, default=None):
+        return self[key] if key in self.CHECKSUM_FIELDS else super().get(key, default)
+
+
+class LocalStorageBackend(StorageBackend):
+    """This class implements a storage backend for file:// URLs and plain paths on a local filesystem.
+
+        Writes go through a temporary file in the destination directory which is then renamed into place, so a
+        reader never sees a partially written object. The generation of an object is its modification time in
+        nanoseconds, and its checksums are computed from its content the first time they are read.
+    """
+
+    scheme = 'file'
+
+    @staticmethod
+    def _path(url):
+        return url[len('file://') :] if url.startswith('file://') else url
+
+    @staticmethod
+    def _record(url, path):
+        stat_result = os.stat(path)
+        modified = datetime.datetime.fromtimestamp(
+            stat_result.st_mtime, tz=datetime.timezone.utc
+        ).isoformat()
+        return LocalRecord(
+            path,
+            name=url,
+            size=stat_result.st_size,
+            content_type=mimetypes.guess_type(path)[0],
+            generation=stat_result.st_mtime_ns,
+            time_created=modified,
+            updated=modified,
+        )
+
+    def _write_into_place(self, url, write_fn):
+        path = self._path(url)
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        file_descriptor, temporary_path = tempfile.mkstemp(
+            dir=directory, prefix='.{}.'.format(os.path.basename(path))
+        )
+        try:
+            with os.fdopen(file_descriptor, 'wb') as f:
+                write_fn(f)
+            os.replace(temporary_path, path)
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+        return self._record(url, path)
+
+    def read(self, url):
+        with open(self._path(url), 'rb') as f:
+            return f.read()
+
+    def read_range(self, url, start, end):
+        with open(self._path(url), 'rb') as f:
+            f.seek(start)
+            return f.read(end - start + 1)
+
+    def write(self, url, data):
+        return self._write_into_place(url, lambda f: f.write(data))
+
+    def upload(self, local_path, url):
+        def copy(f):
+            with open(local_path, 'rb') as source:
+                shutil.copyfileobj(source, f, LOCAL_READ_SIZE)
+
+        return self._write_into_place(url, copy)
+
+    def download(self, url, local_path):
+        shutil.copyfile(self._path(url), local_path)
+
+    def list(self, prefix):
+        # Prefixes are plain string prefixes like in GCS, so walk the deepest directory containing all matches
+        path_prefix = self._path(prefix)
+        url_root = prefix[: len(prefix) - len(path_prefix)]
+        directory = os.path.dirname(path_prefix) or '.'
+
+        records = {}
+        for root, _, files in os.walk(directory):
+            for file_name in files:
+                path = os.path.join(root, file_name)
+                if directory == '.' and not path_prefix.startswith('./'):
+                    path = os.path.relpath(path)
+                if path.startswith(path_prefix):
+                    url = url_root + path
+                    records[url] = self._record(url, path)
+        return records
+
+    def stat(self, url):
+        path = self._path(url)
+        if not os.path.isfile(path):
+            return None
+        return self._record(url, path)
+
+
+def _url_scheme(url):
+    return url.split('://', 1)[0] if '://' in url else LocalStorageBackend.scheme
+
+
+def get_storage_backend(url, gcs_client=None):
+    """Return the storage backend for the scheme of a URL.
+
+    Args:
+        url (str): A gs:// link, file:// URL or local path.
+        gcs_client (GoogleCloudStorageClient): Client to use for gs:// links, by default one with application
+            default credentials.
+
+    Returns:
+        StorageBackend: The backend able to handle the URL.
+
+    Raises:
+        ValueError: if the URL scheme is not supported.
+    """
+    scheme = _url_scheme(url)
+    if scheme == GCSStorageBackend.scheme:
+        return GCSStorageBackend(gcs_client)
+    if scheme == LocalStorageBackend.scheme:
+        return LocalStorageBackend()
+    raise ValueError('Unsupported storage URL scheme: {}'.format(url))
+
+
+def copy_object(source_backend, source, destination_backend, destination):
+    """Copy one object between storage backends and verify its checksum.
+
+    Local sources are uploaded directly and the crc32c of the stored object is compared with the one of the
+    local file. Copies between gs:// links are made on the server side and the crc32c of both objects are
+    compared. Other remote sources are downloaded (with the backend's own checksum validation), through a
+    temporary file when the destination is remote too.
+
+    Args:
+        source_backend (StorageBackend): Backend of the source.
+        source (str): URL of the object to copy.
+        destination_backend (StorageBackend): Backend of the destination.
+        destination (str): URL of the object to write.
+
+    Returns:
+        int: The number of bytes copied.
+
+    Raises:
+        ChecksumMismatchError: if the stored object does not have the checksum of the source file.
+    """
+    if isinstance(source_backend, LocalStorageBackend):
+        source_path = source_backend._path(source)
+        record = destination_backend.upload(source_path, destination)
+        if record['crc32c']:
+            expected_crc = checksum_utils.file_crc32c(source_path)
+            if checksum_utils.crc32c_from_base64(record['crc32c']) != expected_crc:
+                raise ChecksumMismatchError(
+                    'crc32c of {0} is {1}, {2} has {3}'.format(
+                        destination,
+                        record['crc32c'],
+                        source,
+                        checksum_utils.crc32c_to_base64(expected_crc),
+                    )
+                )
+        return record['size']
+
+    if isinstance(source_backend, GCSStorageBackend) and isinstance(
+        destination_backend, GCSStorageBackend
+    ):
+        record = destination_backend.copy(source, destination)
+        source_record = source_backend.stat(source)
+        if record['crc32c'] != source_record['crc32c']:
+            raise ChecksumMismatchError(
+                'crc32c of {0} is {1}, {2} has {3}'.format(
+                    destination, record['crc32c'], source, source_record['crc32c']
+                )
+            )
+        return record['size']
+
+    if isinstance(destination_backend, LocalStorageBackend):
+        destination_path = destination_backend._path(destination)
+        os.makedirs(os.path.dirname(destination_path) or '.', exist_ok=True)
+        source_backend.download(source, destination_path)
+        return os.path.getsize(destination_path)
+
+    with tempfile.TemporaryDirectory() as scratch_directory:
+        scratch_path = os.path.join(scratch_directory, 'object')
+        source_backend.download(source, scratch_path)
+        return copy_object(
+            LocalStorageBackend(), scratch_path, destination_backend, destination
+        )
+
+
+def _list_destinations(transfers, backends):
+    """List every destination directory once, returning the metadata records of existing destinations.
+
+    Destinations without a directory, e.g. relative paths in the working directory, are stat'ed one by one
+    rather than listing an empty prefix, which would walk the whole working directory.
+    """
+    prefixes = set()
+    records = {}
+    for _, destination in transfers:
+        prefix = destination[: destination.rfind('/') + 1]
+        if prefix:
+            prefixes.add(prefix)
+        else:
+            record = backends[_url_scheme(destination)].stat(destination)
+            if record:
+                records[destination] = record
+
+    for prefix in sorted(prefixes):
+        records.update(backends[_url_scheme(prefix)].list(prefix))
+    return records
+
+
+def is_unchanged(source_backend, source, destination_record):
+    """Whether a destination object already has the size and crc32c of its source.
+
+    The sizes are compared first, so neither a local source nor a local destination is read unless the sizes
+    match.
+
+    Args:
+        source_backend (StorageBackend): Backend of the source.
+        source (str): URL of the source object.
+        destination_record (dict): Metadata record of the destination object, or None if it does not exist.
+
+    Returns:
+        bool: True if the destination does not need to be copied again.
+    """
+    if not destination_record:
+        return False
+
+    if isinstance(source_backend, LocalStorageBackend):
+        source_path = source_backend._path(source)
+        source_size = os.path.getsize(source_path)
+    else:
+        source_record = source_backend.stat(source)
+        if not source_record:
+            return False
+        source_size = source_record['size']
+    if source_size != destination_record['size'] or not destination_record['crc32c']:
+        return False
+
+    if isinstance(source_backend, LocalStorageBackend):
+        source_crc = checksum_utils.file_crc32c(source_path)
+    else:
+        source_crc = checksum_utils.crc32c_from_base64(source_record['crc32c'])
+    return checksum_utils.crc32c_from_base64(destination_record['crc32c']) == source_crc
+
+
+def copy_files(
+    transfers,
+    gcs_client=None,
+    num_workers=transfer_utils.TRANSFER_WORKERS,
+    max_attempts=transfer_utils.TRANSFER_MAX_ATTEMPTS,
+    skip_unchanged=False,
+):
+    """Copy objects between any supported storage, concurrently and with retries.
+
+    One backend is created per URL scheme and shared by all transfers, so credentials are loaded once.
+
+    With skip_unchanged, copies behave like rsync: the destination directories are listed in bulk first, and
+    files whose destination already has the same size and crc32c are skipped. This makes re-running a partially
+    failed staging only move the files that are missing or changed.
+
+    Args:
+        transfers (list): A list of (source URL, destination URL) tuples.
+        gcs_client (GoogleCloudStorageClient): Client to use for gs:// links, by default one with application
+            default credentials.
+        num_workers (int): Maximum number of files copied concurrently.
+        max_attempts (int): Maximum number of attempts for each file.
+        skip_unchanged (bool): Whether to skip files already present at the destination with the same checksum.
+
+    Returns:
+        dict: The summary returned by transfer_utils.run_transfers, where `skipped` counts the skipped files
+            and each per-file result has a `skipped` flag.
+    """
+    backends = {}
+    for transfer in transfers:
+        for url in transfer:
+            scheme = _url_scheme(url)
+            if scheme not in backends:
+                backends[scheme] = get_storage_backend(url, gcs_client)
+                # Initialize the lazy client before it is shared by the workers
+                if isinstance(backends[scheme], GCSStorageBackend):
+                    backends[scheme].gcs_client.storage_client
+
+    if skip_unchanged:
+        destination_records = _list_destinations(transfers, backends)
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            unchanged = list(
+                executor.map(
+                    lambda transfer: is_unchanged(
+                        backends[_url_scheme(transfer[0])],
+                        transfer[0],
+                        destination_records.get(transfer[1]),
+                    ),
+                    transfers,
+                )
+            )
+    else:
+        unchanged = [False] * len(transfers)
+
+    summary = transfer_utils.run_transfers(
+        [transfer for transfer, skip in zip(transfers, unchanged) if not skip],
+        lambda source, destination: copy_object(
+            backends[_url_scheme(source)],
+            source,
+            backends[_url_scheme(destination)],
+            destination,
+        ),
+        num_workers=num_workers,
+        max_attempts=max_attempts,
+    )
+
+    # Report skipped files in place, so the per-file results stay in the order of the input
+    copied = iter(summary['transfers'])
+    results = []
+    for (source, destination), skip in zip(transfers, unchanged):
+        if skip:
+            result = {
+                'source': source,
+                'destination': destination,
+                'bytes': 0,
+                'seconds': 0.0,
+                'attempts': 0,
+                'error': None,
+            }
+        else:
+            result = next(copied)
+        result['skipped'] = skip
+        results.append(result)
+
+    summary['files'] = len(transfers)
+    summary['skipped'] = sum(unchanged)
+    summary['transfers'] = results
+    return summary
@@ -1,8 +1,40 @@
 #!/usr/bin/env python3
 
-import subprocess
 import argparse
 import json
+import os
+import sys
+
+from pipeline_tools.shared import storage_backends, transfer_utils
+
+# Staging bucket sub-directory receiving the files listed by each argument
+STAGING_DIRECTORIES = [
+    ('analysis_files_metadata_jsons', 'metadata/analysis_file/'),
+    ('analysis_process_jsons', 'metadata/analysis_process/'),
+    ('analysis_protocol_jsons', 'metadata/analysis_protocol/'),
+    ('analysis_files_descriptors_jsons', 'descriptors/analysis_file/'),
+    ('links_jsons', 'links/'),
+    ('data_files', 'data/'),
+    ('reference_metadata_jsons', 'metadata/reference_file/'),
+    ('reference_file_descriptor_jsons', 'descriptors/reference_file/'),
+]
+
+
+def build_transfer_plan(file_lists, staging_bucket):
+    """Build the list of copies needed to stage every adapter output.
+
+    Args:
+        file_lists (dict): Paths of the files to stage, keyed by argument name of STAGING_DIRECTORIES.
+        staging_bucket (str): URL of the staging area, ending with '/'.
+
+    Returns:
+        transfer_plan (list): (source, destination) tuples, in the order of STAGING_DIRECTORIES.
+    """
+    transfer_plan = []
+    for argument, directory in STAGING_DIRECTORIES:
+        for file in file_lists.get(argument, []):
+            transfer_plan.append((file, f'{staging_bucket}{directory}{os.path.basename(file)}'))
+    return transfer_plan
 
 
 def main():
@@ -42,69 +74,52 @@ def main():
     parser.add_argument('--staging-bucket',
                         dest='staging_bucket',
                         help="Path to staging bucket")
+    parser.add_argument('--num-workers',
+                        dest='num_workers',
+                        type=int,
+                        default=transfer_utils.TRANSFER_WORKERS,
+                        help="Number of files copied concurrently")
+    parser.add_argument('--max-attempts',
+                        dest='max_attempts',
+                        type=int,
+                        default=transfer_utils.TRANSFER_MAX_ATTEMPTS,
+                        help="Number of attempts for each file before it is reported as failed")
+    parser.add_argument('--skip-existing',
+                        dest='skip_existing',
+                        action='store_true',
+                        help="Skip files already staged with the same size and crc32c, e.g. when re-running after a failure")
+    parser.add_argument('--summary-file',
+                        dest='summary_file',
+                        default='copy_summary.json',
+                        help="Path of the JSON summary of the copies to write")
 
     args = parser.parse_args()
 
-    analysis_files_metadata_jsons = args.analysis_files_metadata_jsons
-    analysis_process_jsons = args.analysis_process_jsons
-    analysis_protocol_jsons = args.analysis_protocol_jsons
-    analysis_files_descriptors_jsons = args.analysis_files_descriptors_jsons
-    links_jsons = args.links_jsons
-    data_files = args.data_files
-    reference_metadata_jsons = args.reference_metadata_jsons
-    reference_file_descriptor_jsons = args.reference_file_descriptor_jsons
-    staging_bucket = args.staging_bucket
-
     # File paths are written to files then load into json lists
     # Some SS2 runs have thousands of files and can not all be passed as arguments
-
-    with open(analysis_files_metadata_jsons) as f:
-        analysis_files_metadata_jsons_list = json.load(f)
-        for file in analysis_files_metadata_jsons_list:
-            subprocess.run('gsutil cp {0} {1}metadata/analysis_file/'.format(file, staging_bucket),
-                           shell=True)
-
-    with open(analysis_process_jsons) as f:
-        analysis_process_jsons_list = json.load(f)
-        for file in analysis_process_jsons_list:
-            subprocess.run('gsutil cp {0} {1}metadata/analysis_process/'.format(file, staging_bucket),
-                           shell=True)
-
-    with open(analysis_protocol_jsons) as f:
-        analysis_protocol_jsons_list = json.load(f)
-        for file in analysis_protocol_jsons_list:
-            subprocess.run('gsutil cp {0} {1}metadata/analysis_protocol/'.format(file, staging_bucket),
-                           shell=True)
-
-    with open(analysis_files_descriptors_jsons) as f:
-        analysis_files_descriptors_jsons_list = json.load(f)
-        for file in analysis_files_descriptors_jsons_list:
-            subprocess.run('gsutil cp {0} {1}descriptors/analysis_file/'.format(file, staging_bucket),
-                           shell=True)
-
-    with open(links_jsons) as f:
-        links_jsons_list = json.load(f)
-        for file in links_jsons_list:
-            subprocess.run('gsutil cp {0} {1}links/'.format(file, staging_bucket),
-                           shell=True)
-
-    with open(data_files) as f:
-        data_files_list = json.load(f)
-        for file in data_files_list:
-            subprocess.run('gsutil cp {0} {1}data/'.format(file, staging_bucket),
-                           shell=True)
-
-    with open(reference_metadata_jsons) as f:
-        reference_metadata_jsons_list = json.load(f)
-        for file in reference_metadata_jsons_list:
-            subprocess.run('gsutil cp {0} {1}metadata/reference_file/'.format(file, staging_bucket),
-                           shell=True)
-
-    with open(reference_file_descriptor_jsons) as f:
-        reference_file_descriptor_jsons_list = json.load(f)
-        for file in reference_file_descriptor_jsons_list:
-            subprocess.run('gsutil cp {0} {1}descriptors/reference_file/'.format(file, staging_bucket),
-                           shell=True)
+    file_lists = {}
+    for argument, _ in STAGING_DIRECTORIES:
+        list_file = getattr(args, argument)
+        if list_file:
+            with open(list_file) as f:
+                file_lists[argument] = json.load(f)
+
+    # Copy everything from one process, sharing credentials and connections across a pool of workers
+    transfer_plan = build_transfer_plan(file_lists, args.staging_bucket)
+    print(f'Copying {len(transfer_plan)} files to {args.staging_bucket}...')
+    summary = storage_backends.copy_files(transfer_plan,
+                                          num_workers=args.num_workers,
+                                          max_attempts=args.max_attempts,
+                                          skip_unchanged=args.skip_existing)
+    transfer_utils.write_summary(summary, args.summary_file)
+
+    print(f"Copied {summary['succeeded']} of {summary['files']} files ({summary['bytes']} bytes) "
+          f"in {summary['seconds']:.1f}s, skipped {summary['skipped']} unchanged files")
+    if summary['failed']:
+        for transfer in summary['transfers']:
+            if transfer['error']:
+                print(f"Failed to copy {transfer['source']} to {transfer['destination']}: {transfer['error']}")
+        sys.exit(f"{summary['failed']} files could not be copied, see {args.summary_file}")
 
 
 if __name__ == '__main__':
@@ -140,7 +140,8 @@ class AnalysisFile():
         """Get JSON info for bam and loom analysis files and save"""
         outputs = self.outputs
         for output in self.outputs:
-            if outputs[output].endswith(".loom"):
+            # A project matrix merged as HDF5 rather than loom (merge_looms --output-format h5) is described the same way
+            if outputs[output].endswith(".loom") or (self.project_level and outputs[output].endswith(".h5")):
                 # Generate loom output
                 self.loom_output = {
                     "provenance": {
@@ -219,6 +220,58 @@ class AnalysisFile():
         return self.workspace_version
 
 
+def build_ss2_analysis_files(input_uuids, ss2_bam_files, ss2_bai_files, workspace_version):
+    """Create the AnalysisFile of many SS2 intermediate runs, one per input uuid and bam/bai pair
+
+    Args:
+        input_uuids (list): Input file UUIDs from the HCA Data Browser, one per run.
+        ss2_bam_files (list): Localized paths of the intermediate bam files, in the order of input_uuids.
+        ss2_bai_files (list): Localized paths of the intermediate bai files, in the order of input_uuids.
+        workspace_version (str): Workspace version value i.e. timestamp for workspace.
+
+    Returns:
+        analysis_files (list): An AnalysisFile per input uuid, in the same order.
+    """
+    if not len(input_uuids) == len(ss2_bam_files) == len(ss2_bai_files):
+        raise ValueError(
+            f"Expected as many bam and bai files as input uuids, got {len(input_uuids)} input uuids, "
+            f"{len(ss2_bam_files)} bam files and {len(ss2_bai_files)} bai files")
+
+    return [
+        AnalysisFile(input_uuid, None, "ss2", workspace_version, False, ss2_bam_file, ss2_bai_file)
+        for input_uuid, ss2_bam_file, ss2_bai_file in zip(input_uuids, ss2_bam_files, ss2_bai_files)
+    ]
+
+
+def write_analysis_files(analysis_files, output_dir="."):
+    """Write outputs.json with the outputs of every AnalysisFile, then each output's analysis_file json
+
+    Args:
+        analysis_files (list): AnalysisFile objects to write the outputs of.
+        output_dir (str): Directory to write the json files to.
+
+    Returns:
+        outputs (list): The analysis_file json written to outputs.json, in the order of analysis_files.
+    """
+    outputs = []
+    file_names = []
+    for analysis_file in analysis_files:
+        for output in analysis_file.get_outputs_json():
+            outputs.append(output)
+            file_save_id = output["provenance"]["document_id"]
+            file_names.append(f"{file_save_id}_{analysis_file.work_version}.json")
+
+    print("Writing outputs.json to disk...")
+    with open(os.path.join(output_dir, "outputs.json"), "w") as f:
+        json.dump(outputs, f, indent=2, sort_keys=True)
+
+    print(f"Writing {len(outputs)} analysis_file output(s) to disk...")
+    for output, file_name in zip(outputs, file_names):
+        with open(os.path.join(output_dir, file_name), "w") as f:
+            json.dump(output, f, indent=2, sort_keys=True)
+    return outputs
+
+
 # Entry point for unit tests
 def test_build_analysis_file(
     input_uuid,
@@ -240,36 +293,43 @@ def test_build_analysis_file(
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--pipeline_type", required=True, help="Type of pipeline(SS2 or Optimus)")
-    parser.add_argument("--input_uuid", required=True, help="Input file UUID from the HCA Data Browser")
+    parser.add_argument("--input_uuid", required=False, help="Input file UUID from the HCA Data Browser")
     parser.add_argument("--workspace_version", required=True, help="Workspace version value i.e. timestamp for workspace")
     parser.add_argument("--project_level", required=True, type=lambda x: bool(strtobool(x)), help="Boolean representing project level vs intermediate level")
-    parser.add_argument("--input_file", required=False, help="Path to metadata.json for intermediate level, path to merged loom file for project level")
+    parser.add_argument("--input_file", required=False, help="Path to metadata.json for intermediate level, path to merged loom (or h5) file for project level")
     parser.add_argument("--ss2_bam_file", required=False, help="Localized path to intermediate ss2 bam file")
     parser.add_argument("--ss2_bai_file", required=False, help="Localized path to intermediate ss2 bai file")
+    parser.add_argument("--input_uuids", required=False, help="Path to a JSON array of input file UUIDs, to describe many ss2 runs at once")
+    parser.add_argument("--ss2_bam_files", required=False, help="Path to a JSON array of localized intermediate ss2 bam files, in the order of --input_uuids")
+    parser.add_argument("--ss2_bai_files", required=False, help="Path to a JSON array of localized intermediate ss2 bai files, in the order of --input_uuids")
 
     args = parser.parse_args()
 
-    analysis_file = AnalysisFile(
-        args.input_uuid,
-        args.input_file,
-        args.pipeline_type,
-        args.workspace_version,
-        args.project_level,
-        args.ss2_bam_file,
-        args.ss2_bai_file
-    )
+    # File lists are written to files then loaded into json lists
+    # SS2 projects have thousands of cells and their files can not all be passed as arguments
+    if args.input_uuids:
+        if args.pipeline_type.lower() != "ss2" or args.project_level or not (args.ss2_bam_files and args.ss2_bai_files):
+            parser.error("--input_uuids requires --ss2_bam_files and --ss2_bai_files, for intermediate level SS2 runs")
+        file_lists = []
+        for list_file in [args.input_uuids, args.ss2_bam_files, args.ss2_bai_files]:
+            with open(list_file) as f:
+                file_lists.append(json.load(f))
+        analysis_files = build_ss2_analysis_files(*file_lists, args.workspace_version)
+    elif args.input_uuid:
+        analysis_files = [AnalysisFile(
+            args.input_uuid,
+            args.input_file,
+            args.pipeline_type,
+            args.workspace_version,
+            args.project_level,
+            args.ss2_bam_file,
+            args.ss2_bai_file
+        )]
+    else:
+        parser.error("either --input_uuid or --input_uuids is required")
 
     # Write analysis file for each file type
-    print("Writing outputs.json to disk...")
-    analysis_file_json = analysis_file.get_outputs_json()
-    with open("outputs.json", "w") as f:
-        json.dump(analysis_file_json, f, indent=2, sort_keys=True)
-
-    print("Writing analysis_file output(s) to disk...")
-    for output in analysis_file_json:
-        file_save_id = output["provenance"]["document_id"]
-        with open(f"{file_save_id}_{analysis_file.work_version}.json", "w") as f:
-            json.dump(output, f, indent=2, sort_keys=True)
+    write_analysis_files(analysis_files)
 
 
 if __name__ == "__main__":
@@ -1,13 +1,55 @@
 #!/usr/bin/env python
 import argparse
+import collections
+import functools
 import json
 import os
 import re
+from pipeline_tools.shared import process_utils
 from pipeline_tools.shared.schema_utils import SCHEMAS
 from pipeline_tools.shared.submission import format_map
 from pipeline_tools.shared.exceptions import UnsupportedPipelineType
 from distutils.util import strtobool
 
+# Cromwell calls of the single sample SS2 subworkflow, scattered over the samples of a multi sample run
+SS2_CALL_TYPES = ['MultiSampleSmartSeq2.sc_pe', 'MultiSampleSmartSeq2.sc_se']
+
+# Number of parsed metadata.json kept in memory by load_workflow_metadata
+WORKFLOW_METADATA_CACHE_SIZE = 4
+
+_workflow_metadata_cache = collections.OrderedDict()
+
+
+def load_workflow_metadata(input_file, paths=None):
+    """Load workflow metadata, reusing the result of an earlier load of the same unchanged file.
+
+    Loads are cached by real path, modification time and size of the file, and by the paths read, so
+    AnalysisProcess documents built from the same metadata.json in one run share a single parse. A cached
+    complete load also answers requests for selected paths. The returned metadata is shared and must not be
+    modified.
+
+    Args:
+        input_file (str): Path to file containing metadata json for the workflow.
+        paths (list): Optional paths of the values to read, see format_map.get_workflow_metadata.
+
+    Returns:
+        metadata (dict): A dict consisting of Cromwell workflow metadata information.
+    """
+    stat_result = os.stat(input_file)
+    file_key = (os.path.realpath(input_file), stat_result.st_mtime_ns, stat_result.st_size)
+    paths_key = tuple(paths) if paths is not None else None
+
+    for key in [(file_key, None), (file_key, paths_key)]:
+        if key in _workflow_metadata_cache:
+            _workflow_metadata_cache.move_to_end(key)
+            return _workflow_metadata_cache[key]
+
+    metadata = format_map.get_workflow_metadata(input_file, paths)
+    _workflow_metadata_cache[(file_key, paths_key)] = metadata
+    if len(_workflow_metadata_cache) > WORKFLOW_METADATA_CACHE_SIZE:
+        _workflow_metadata_cache.popitem(last=False)
+    return metadata
+
 
 class AnalysisProcess():
     """AnalysisProcess class implements the creation of a  json analysis process for Optimus and SS2 pipeline outputs
@@ -89,6 +131,7 @@ class AnalysisProcess():
         self.pipeline_type = pipeline_type
         self.project_level = project_level
         self.workspace_version = workspace_version
+        self.workflow_metadata = None
 
     def __analysis_process__(self):
         return {
@@ -149,18 +192,27 @@ class AnalysisProcess():
         return format_map.get_workflow_inputs(workflow_metadata["inputs"], input_fields)
 
     def __metadata__(self):
+        """Return the metadata of the run being described, loading it on the first call only"""
+
+        if self.workflow_metadata is None:
+            self.workflow_metadata = self.__load_metadata__()
+        return self.workflow_metadata
 
-        metadata = format_map.get_workflow_metadata(self.input_file)
+    def __load_metadata__(self):
 
         # Return the unique metadata.json for optimus
         if self.pipeline_type.lower() == "optimus":
-            return metadata
+            return load_workflow_metadata(self.input_file)
 
         # SS2 only has one metadata.json, if intermediate run then return the subworkflow task
         # If project level run then return AggregateLoom metadata
+        # Only the needed call is read out of the metadata.json of all samples
         if self.pipeline_type.lower() == "ss2":
             if not self.project_level:
+                metadata = load_workflow_metadata(
+                    self.input_file, [("calls", call_type, self.ss2_index) for call_type in SS2_CALL_TYPES])
                 return metadata["calls"][format_map.get_call_type(metadata)][self.ss2_index]
+            metadata = load_workflow_metadata(self.input_file, [("calls", "MultiSampleSmartSeq2.AggregateLoom", 0)])
             return metadata["calls"]["MultiSampleSmartSeq2.AggregateLoom"][0]
 
         raise UnsupportedPipelineType("Pipeline must be optimus or ss2")
@@ -221,6 +273,87 @@ class AnalysisProcess():
         return self.workspace_version
 
 
+def write_analysis_process(analysis_process, output_dir="."):
+    """Write the analysis_process json, named after its process id and workspace version, and return its path"""
+
+    # Get the JSON content to be written
+    analysis_process_json = analysis_process.get_json()
+
+    # Determine file name
+    analysis_process_filename = os.path.join(
+        output_dir,
+        f"{analysis_process.process_id}"
+        f"_{analysis_process.workspace_version}"
+        f".json"
+    )
+
+    with open(f'{analysis_process_filename}', 'w') as f:
+        json.dump(analysis_process_json, f, indent=2, sort_keys=True)
+    return analysis_process_filename
+
+
+def _get_ss2_shards(input_file):
+    """Return the intermediate run metadata of every SS2 sample, read from metadata.json (or the cache)"""
+
+    metadata = load_workflow_metadata(input_file, [("calls", call_type, "*") for call_type in SS2_CALL_TYPES])
+    return metadata["calls"][format_map.get_call_type(metadata)]
+
+
+def _write_ss2_analysis_process(input_uuid, input_file, workspace_version, references, output_dir, shard):
+    """Write the analysis_process json of one SS2 sample, given as its ss2_index and intermediate run metadata"""
+
+    ss2_index, workflow_metadata = shard
+    analysis_process = AnalysisProcess(
+        input_uuid,
+        input_file,
+        "SS2",
+        workspace_version,
+        references,
+        False,
+        ss2_index
+    )
+    # The metadata of the sample comes from the caller, so metadata.json is not parsed again here
+    analysis_process.workflow_metadata = workflow_metadata
+    return {
+        "ss2_index" : ss2_index,
+        "process_id" : analysis_process.process_id,
+        "file" : write_analysis_process(analysis_process, output_dir)
+    }
+
+
+def write_ss2_analysis_processes(
+    input_uuid,
+    input_file,
+    workspace_version,
+    references=[],
+    output_dir=".",
+        num_workers=os.cpu_count()):
+    """Write the intermediate analysis_process json of every sample of a SS2 multi sample run
+
+    The metadata.json is parsed once, in the calling process, and each worker of a pool of processes is sent
+    only the metadata of the samples whose documents it writes.
+
+    Args:
+        input_uuid (str): Input uuid recorded on every AnalysisProcess.
+        input_file (str): Path to the metadata.json of the multi sample run.
+        workspace_version (str): Workspace version value i.e. timestamp for workspace.
+        references (list): File paths of the reference genome fasta.
+        output_dir (str): Directory to write the analysis_process json files to.
+        num_workers (int): Maximum number of processes writing documents.
+
+    Returns:
+        manifest (list): The ss2_index, process_id and written file of every sample, in ss2_index order.
+    """
+    shards = list(enumerate(_get_ss2_shards(input_file)))
+    write_shard = functools.partial(
+        _write_ss2_analysis_process, input_uuid, input_file, workspace_version, references, output_dir)
+
+    num_workers = min(num_workers, len(shards))
+    if num_workers <= 1:
+        return [write_shard(shard) for shard in shards]
+    return process_utils.process_map(write_shard, shards, num_workers=num_workers)
+
+
 # Entry point for unit tests
 def test_build_analysis_process(
     input_uuid,
@@ -250,9 +383,27 @@ def main():
     parser.add_argument("--references", required=False, nargs="+", help="File path for the reference genome fasta")
     parser.add_argument("--project_level", required=True, type=lambda x: bool(strtobool(x)), help="Boolean representing project level vs intermediate level")
     parser.add_argument("--ss2_index", required=False, type=int, help="The index of the ss2 scatter task, need to grab intermediate run data from metadata.json")
+    parser.add_argument("--ss2_all_shards", action="store_true", help="Write the intermediate analysis_process of every ss2 scatter task in one run, instead of --ss2_index")
+    parser.add_argument("--num_workers", type=int, default=os.cpu_count(), help="Number of processes writing documents with --ss2_all_shards")
+    parser.add_argument("--manifest_file", default="analysis_process_manifest.json", help="Path of the JSON list of documents written with --ss2_all_shards")
 
     args = parser.parse_args()
 
+    if args.ss2_all_shards:
+        if args.pipeline_type.lower() != "ss2" or args.project_level:
+            parser.error("--ss2_all_shards only applies to intermediate level SS2 runs")
+
+        print('Writing analysis_process.json of every SS2 sample to disk...')
+        manifest = write_ss2_analysis_processes(
+            args.input_uuid,
+            args.input_file,
+            args.workspace_version,
+            args.references or [],
+            num_workers=args.num_workers)
+        with open(args.manifest_file, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        return
+
     analysis_process = AnalysisProcess(
         args.input_uuid,
         args.input_file,
@@ -263,20 +414,9 @@ def main():
         args.ss2_index
     )
 
-    # Get the JSON content to be written
-    analysis_process_json = analysis_process.get_json()
-
-    # Determine file name
-    analysis_process_filename = (
-        f"{analysis_process.process_id}"
-        f"_{analysis_process.workspace_version}"
-        f".json"
-    )
-
     # Write analysis_process to file
     print('Writing analysis_process.json to disk...')
-    with open(f'{analysis_process_filename}', 'w') as f:
-        json.dump(analysis_process_json, f, indent=2, sort_keys=True)
+    write_analysis_process(analysis_process)
 
 
 if __name__ == "__main__":
@@ -1,12 +1,16 @@
 #!/usr/bin/env python
 import argparse
+import csv
 import json
-import mimetypes
 import os
 
+from pipeline_tools.shared import checksum_utils
 from pipeline_tools.shared.schema_utils import SCHEMAS
 from pipeline_tools.shared.submission import format_map
 
+# Per-file values of a create_file_descriptor manifest
+MANIFEST_FIELDS = ['file_path', 'size', 'sha256', 'crc32c', 'input_uuid', 'creation_time']
+
 
 class Descriptor():
     """Descriptor class implements the creation of a json file descriptor for Optimus and SS2 pipeline outputs
@@ -28,10 +32,10 @@ class Descriptor():
         }
 
     See https://schema.humancellatlas.org/system/2.0.0/file_descriptor for full spec
-    """
 
-    # Add additional custom mimetypes
-    [mimetypes.add_type(entry[0], entry[1]) for entry in format_map.MIME_FORMATS]
+    The size, sha256 and crc32c can be left as None, in which case they are computed from the file at file_path
+    in a single read.
+    """
 
     # All descriptors will share these schema attributes
     describedBy = SCHEMAS["FILE_DESCRIPTOR"]["describedBy"]
@@ -52,11 +56,9 @@ class Descriptor():
         # Grab timestamp that adheres to schema
         file_version = format_map.convert_datetime(creation_time)
 
-        # Grab the mimetype of the file thats been submitted
-        content_type = mimetypes.guess_type(file_path)[0] or 'application/unknown'
-
-        # Get the type of file currently being processed
-        entity_type = format_map.get_entity_type(file_path)
+        # Get the type of file currently being processed and the mimetype of the file thats been submitted
+        _, entity_type, content_type = format_map.classify(file_path)
+        content_type = content_type or 'application/unknown'
 
         # Grab the extension of the file thats been submitted
         file_extension = os.path.splitext(file_path)[1]
@@ -73,6 +75,16 @@ class Descriptor():
         file_entity_id = format_map.get_uuid5(f"{input_uuid}{entity_type}{file_extension}")
         file_id = format_map.get_uuid5(file_entity_id)
 
+        # Compute any checksum that was not supplied, reading the file only once for all of them
+        if size is None or sha256 is None or crc32c is None:
+            checksums = checksum_utils.compute_checksums(
+                file_path,
+                sha256=sha256 is None,
+                crc32c=crc32c is None)
+            size = checksums['size'] if size is None else size
+            sha256 = checksums.get('sha256', sha256)
+            crc32c = checksums.get('crc32c', crc32c)
+
         self.size = int(size)
         self.crc32c = crc32c
         self.sha256 = sha256
@@ -154,39 +166,115 @@ def test_build_file_descriptor(
     return test_file_descriptor.get_json()
 
 
+def read_manifest(manifest_path):
+    """Read the files to describe from a manifest
+
+    The manifest is either JSON lines or a TSV with a header row, each line giving the file_path, input_uuid and
+    creation_time of one file, and optionally its size, sha256 and crc32c. Missing or empty values are None.
+
+    Args:
+        manifest_path (str): Path of the .jsonl or .tsv manifest.
+
+    Returns:
+        entries (list): A dict for each file, in the order of the manifest.
+    """
+    with open(manifest_path) as f:
+        if manifest_path.endswith('.tsv'):
+            rows = list(csv.DictReader(f, delimiter='\t'))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    entries = []
+    for row in rows:
+        # TSV cells are never missing but can be empty, while a size of 0 is a legitimate value
+        entry = {field : None if row.get(field) in (None, '') else row.get(field) for field in MANIFEST_FIELDS}
+        if entry['size'] is not None:
+            entry['size'] = int(entry['size'])
+        entries.append(entry)
+    return entries
+
+
+def build_descriptors(entries, pipeline_type, workspace_version, num_workers=checksum_utils.CHECKSUM_WORKERS):
+    """Build the descriptors of many files, computing missing checksums in parallel
+
+    Args:
+        entries (list): Dicts with the MANIFEST_FIELDS of each file, as returned by read_manifest.
+        pipeline_type (str): Type of pipeline (SS2 or Optimus).
+        workspace_version (str): Workspace version value i.e. timestamp for workspace.
+        num_workers (int): Number of processes computing checksums.
+
+    Returns:
+        descriptors (list): A Descriptor for each entry, in the same order.
+    """
+    # Checksum every file with a missing value up front, so the reads are spread over a pool of processes
+    # instead of happening one at a time in Descriptor
+    incomplete = [entry for entry in entries if None in (entry['size'], entry['sha256'], entry['crc32c'])]
+    for entry in incomplete:
+        if '://' in entry['file_path']:
+            raise ValueError(f"Cannot compute checksums of remote file {entry['file_path']}: "
+                             "give its size, sha256 and crc32c in the manifest, or a local copy as file_path")
+    checksums = checksum_utils.compute_checksums_parallel(
+        [entry['file_path'] for entry in incomplete],
+        num_workers=num_workers)
+    computed = {id(entry) : checksum for entry, checksum in zip(incomplete, checksums)}
+
+    descriptors = []
+    for entry in entries:
+        values = dict(entry)
+        for field in ['size', 'sha256', 'crc32c']:
+            if values[field] is None:
+                values[field] = computed[id(entry)][field]
+        descriptors.append(Descriptor(
+            values['size'],
+            values['sha256'],
+            values['crc32c'],
+            values['input_uuid'],
+            values['file_path'],
+            pipeline_type,
+            values['creation_time'],
+            workspace_version))
+    return descriptors
+
+
+def write_descriptor(file_descriptor, output_dir='.'):
+    """Write the descriptor json, named after its entity id and workspace version, and return its path"""
+    descriptor_json_filename = os.path.join(
+        output_dir, f"{file_descriptor.entity_id}_{file_descriptor.work_version}.json")
+    with open(descriptor_json_filename, 'w') as f:
+        json.dump(file_descriptor.get_json(), f, indent=2, sort_keys=True)
+    return descriptor_json_filename
+
+
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--size", required=True, type=int, help="size of the file in Mb")
-    parser.add_argument('--sha256', required=True, help='sha256 of the file.')
-    parser.add_argument('--crc32c', required=True, help='crc32c of the file.')
+    parser.add_argument("--size", type=int, help="size of the file in bytes, computed from the file if not given")
+    parser.add_argument('--sha256', help='sha256 of the file, computed from the file if not given.')
+    parser.add_argument('--crc32c', help='crc32c of the file, computed from the file if not given.')
     parser.add_argument('--pipeline_type', required=True, help='Type of pipeline (SS2 or Optimus)')
-    parser.add_argument('--file_path', required=True, help='Path to the loom/bam file to describe.')
-    parser.add_argument('--input_uuid', required=True, help='Input file UUID from the HCA Data Browser.')
-    parser.add_argument('--creation_time', required=True, help='Time of file creation, as reported by "gsutil ls -l"',)
+    parser.add_argument('--file_path', help='Path to the loom/bam file to describe.')
+    parser.add_argument('--input_uuid', help='Input file UUID from the HCA Data Browser.')
+    parser.add_argument('--creation_time', help='Time of file creation, as reported by "gsutil ls -l"',)
     parser.add_argument('--workspace_version', required=True, help='Workspace version value i.e. timestamp for workspace')
+    parser.add_argument('--manifest', help='JSON lines or TSV manifest of files to describe in one run, instead of --file_path')
+    parser.add_argument('--num_workers', type=int, default=checksum_utils.CHECKSUM_WORKERS, help='Number of processes computing missing checksums')
+    parser.add_argument('--output_dir', default='.', help='Directory to write the descriptor files to')
 
     args = parser.parse_args()
 
-    # Create file descriptor object
-    file_descriptor = Descriptor(
-        args.size,
-        args.sha256,
-        args.crc32c,
-        args.input_uuid,
-        args.file_path,
-        args.pipeline_type,
-        args.creation_time,
-        args.workspace_version)
-
-    # Get the JSON content to be written
-    descriptor_json = file_descriptor.get_json()
+    if args.manifest:
+        entries = read_manifest(args.manifest)
+    elif args.file_path and args.input_uuid and args.creation_time:
+        entries = [{field : getattr(args, field) for field in MANIFEST_FIELDS}]
+    else:
+        parser.error('either --manifest or --file_path, --input_uuid and --creation_time are required')
 
-    # Generate filename based on UUID and version
-    descriptor_json_filename = f"{file_descriptor.entity_id}_{file_descriptor.work_version}.json"
+    # Create file descriptor objects
+    descriptors = build_descriptors(entries, args.pipeline_type, args.workspace_version, args.num_workers)
 
-    print(f"Writing {file_descriptor.extension} descriptor file to disk...")
-    with open(descriptor_json_filename, 'w') as f:
-        json.dump(descriptor_json, f, indent=2, sort_keys=True)
+    os.makedirs(args.output_dir, exist_ok=True)
+    for file_descriptor in descriptors:
+        print(f"Writing {file_descriptor.extension} descriptor file to disk...")
+        write_descriptor(file_descriptor, args.output_dir)
 
 
 if __name__ == '__main__':
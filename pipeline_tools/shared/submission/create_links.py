@@ -1,10 +1,13 @@
 #!/usr/bin/env python
 import argparse
+import copy
+import functools
 import json
 import os
 import re
 
 
+from pipeline_tools.shared import process_utils
 from pipeline_tools.shared.submission import format_map
 from pipeline_tools.shared.schema_utils import SCHEMAS
 from distutils.util import strtobool
@@ -64,6 +67,13 @@ class LinksFile():
 
     # Regex to grab uuids from file paths
     uuid_regex = r"([a-z0-9]{8}-[a-z0-9]{4}-[a-z0-9]{4}-[a-z0-9]{4}-[a-z0-9]{12})"
+    uuid_pattern = re.compile(uuid_regex)
+
+    # SS2 attributes holding one value per sample, which are split between links file shards
+    per_sample_attributes = [
+        "input_uuids", "ss2_bam", "ss2_bai", "ss2_fastq1", "ss2_fastq2", "analysis_process_list_path",
+        "analysis_protocol_list_path", "bam_hashes", "bai_hashes", "process_ids", "protocol_ids"
+    ]
 
     def __init__(
         self,
@@ -82,11 +92,16 @@ class LinksFile():
         ss2_bai="",
         ss2_fastq1="",
         ss2_fastq2="",
-            project_level=False):
+        project_level=False,
+            links_per_shard=None):
 
         print(input_uuids)
         print(pipeline_type)
 
+        # Each shard holds at least one sample and its part of the project link
+        if links_per_shard is not None and links_per_shard < 2:
+            raise ValueError(f"links_per_shard must be at least 2, got {links_per_shard}")
+
         # Create UUID to save the file as
         file_prehash = f"{file_name_string}"
         subgraph_uuid = format_map.get_uuid5(file_prehash)
@@ -107,6 +122,7 @@ class LinksFile():
         self.workspace_version = workspace_version
         self.analysis_process_path = analysis_process_path
         self.analysis_protocol_path = analysis_protocol_path
+        self.links_per_shard = links_per_shard
 
         # If pipelinetype is optimus then input uuids come from a list
         # If pipeline type is SS2 then read the list from a file
@@ -142,6 +158,12 @@ class LinksFile():
             with open(ss2_fastq2) as f:
                 self.ss2_fastq2 = json.load(f)
 
+            # Compute the per-sample file hashes and parse the per-sample process and protocol ids once
+            # Every link indexes into these lists, so building the links is linear in the number of samples
+            self.bam_hashes, self.bai_hashes = self.__compute_hashes__()
+            self.process_ids = [self.__parse_uuid__(path) for path in self.analysis_process_list_path]
+            self.protocol_ids = [self.__parse_uuid__(path) for path in self.analysis_protocol_list_path]
+
     def __links_file_optimus__(self):
         """Links file json for Optimus, will contain only a single 'links' object in the list"""
 
@@ -179,10 +201,13 @@ class LinksFile():
         Returns:
             links (array[object]) : List of links object for SS2 run"""
 
-        links = []
+        return list(self.__iter_ss2_links__())
+
+    def __iter_ss2_links__(self):
+        """Yield the links objects for a run of SS2 one at a time, the intermediate links followed by the project link"""
 
         for index in range(len(self.input_uuids)):
-            links_element = {
+            yield {
                 "process_type": self.process_type,
                 "link_type": self.link_type,
                 "process_id": self.__process_id__(index),
@@ -190,14 +215,9 @@ class LinksFile():
                 "outputs": self.__ss2_intermediate_outputs__(index),
                 "protocols": self.__protocols__(index)
             }
-            links.append(links_element)
 
         # Build the project link of all the intermediate bams and output loom
-        project_link = self.__ss2_project_link__()
-
-        links.append(project_link)
-
-        return links
+        yield self.__ss2_project_link__()
 
     def __ss2_project_link__(self):
         """Gets the project level link for an SS2 run where the inputs are the intermediate bam/bai files and output is project loom"""
@@ -272,15 +292,13 @@ class LinksFile():
         Returns:
             intermediate_output (array[obj]): Array of output files (analysis files) for the intermediate SS2 run"""
 
-        bam_hashes, bai_hashes = self.__hashes__()
-
         intermediate_output = [
             {
-                "output_id": bam_hashes[index],
+                "output_id": self.bam_hashes[index],
                 "output_type": "analysis_file"
             },
             {
-                "output_id": bai_hashes[index],
+                "output_id": self.bai_hashes[index],
                 "output_type": "analysis_file"
             }
         ]
@@ -288,6 +306,11 @@ class LinksFile():
         return intermediate_output
 
     def __hashes__(self):
+        """For SS2 return the bam and bai file hashes computed when the links file was created"""
+
+        return self.bam_hashes, self.bai_hashes
+
+    def __compute_hashes__(self):
         """For SS2 convert bam and bai file name to their correct hashes and return"""
 
         bam_hashes = []
@@ -332,8 +355,8 @@ class LinksFile():
         return [
             {
                 "protocol_type" : "analysis_protocol",
-                "protocol_id" : re.findall(self.uuid_regex, self.analysis_protocol_path)[-1] if index == ""
-                else re.findall(self.uuid_regex, self.analysis_protocol_list_path[index])[-1]
+                "protocol_id" : self.__parse_uuid__(self.analysis_protocol_path) if index == ""
+                else self.protocol_ids[index]
             }
         ]
 
@@ -348,9 +371,14 @@ class LinksFile():
             process_id (string): process id in the form 151fe264-c670-4c77-a47c-530ff6b3127b"""
 
         if index == "" :
-            return re.findall(self.uuid_regex, self.analysis_process_path)[-1]
+            return self.__parse_uuid__(self.analysis_process_path)
+
+        return self.process_ids[index]
+
+    def __parse_uuid__(self, path):
+        """Gets the last uuid in a metadata file path, e.g. the process id of analysis_process/<uuid>_<version>.json"""
 
-        return re.findall(self.uuid_regex, self.analysis_process_list_path[index])[-1]
+        return self.uuid_pattern.findall(path)[-1]
 
     def get_json(self):
 
@@ -359,6 +387,114 @@ class LinksFile():
 
         return self.__links_file_ss2__()
 
+    @property
+    def link_count(self):
+        """Number of links objects in the project, one per SS2 sample plus the project link"""
+
+        if self.pipeline_type.lower() == "optimus":
+            return 1
+        return len(self.input_uuids) + 1
+
+    @property
+    def samples_per_shard(self):
+        """Number of SS2 samples in each links file shard, leaving room for the shard's part of the project link"""
+
+        return self.links_per_shard - 1
+
+    @property
+    def shard_count(self):
+        """Number of links files the project is split into, one unless links_per_shard is exceeded"""
+
+        if not self.links_per_shard or self.link_count <= self.links_per_shard:
+            return 1
+        return -(-len(self.input_uuids) // self.samples_per_shard)
+
+    def shard_uuid(self, shard_index):
+        """Gets the subgraph uuid of a links file shard, derived from the file_name_string and the shard number
+        An unsharded project keeps the subgraph uuid of the file_name_string alone"""
+
+        if self.shard_count == 1:
+            return self.subgraph_uuid
+        return format_map.get_uuid5(f"{self.file_name_string};shard={shard_index}")
+
+    def shard_file_name(self, shard_index):
+        return f'{self.shard_uuid(shard_index)}_{self.version}_{self.project}.json'
+
+    def shard(self, shard_index):
+        """Gets an unsharded copy of the links file holding only the SS2 samples of one shard
+
+        The copy has the subgraph uuid of the shard, and its project link only lists the intermediate bam and bai
+        files of these samples as inputs, so the size of every links file is bounded by links_per_shard.
+
+        Args:
+            shard_index (int): Index of the shard
+
+        Returns:
+            links_shard (LinksFile): The links file of the shard, which is small to pickle to a worker process"""
+
+        if self.shard_count == 1:
+            return self
+
+        start = shard_index * self.samples_per_shard
+        stop = start + self.samples_per_shard
+        links_shard = copy.copy(self)
+        for attribute in self.per_sample_attributes:
+            setattr(links_shard, attribute, getattr(self, attribute)[start:stop])
+
+        # Single end runs have a single empty fastq2 for all samples
+        if self.ss2_fastq2[0] == "":
+            links_shard.ss2_fastq2 = self.ss2_fastq2
+
+        links_shard.subgraph_uuid = self.shard_uuid(shard_index)
+        links_shard.links_per_shard = None
+        return links_shard
+
+    def iter_links(self, shard_index=None):
+        """Yield the links objects of the links file, or of a single shard of it, one at a time"""
+
+        if self.pipeline_type.lower() == "optimus":
+            yield from self.__links_file_optimus__()["links"]
+        elif shard_index is None or self.shard_count == 1:
+            yield from self.__iter_ss2_links__()
+        else:
+            yield from self.shard(shard_index).iter_links()
+
+    def write_json(self, f, indent=2, shard_index=None):
+        """Write the links file json to an open file, one links object at a time
+
+        The output is byte-identical to json.dump(self.get_json(), f, indent=indent, sort_keys=True), but only a
+        single links object is held in memory at once, so memory stays flat however many samples a project has.
+
+        Args:
+            f (file): File object open for writing text
+            indent (int): Number of spaces to indent each level by
+            shard_index (int): Only write the links objects of this shard
+        """
+
+        header = {
+            "describedBy" : self.describedBy,
+            "schema_type" : self.schema_type,
+            "schema_version" : self.schema_version,
+            "links" : None
+        }
+        padding = " " * indent
+
+        f.write("{")
+        for key_index, key in enumerate(sorted(header)):
+            f.write(("," if key_index else "") + f"\n{padding}{json.dumps(key)}: ")
+            if key != "links":
+                f.write(json.dumps(header[key]))
+                continue
+
+            # Each link is dumped on its own and shifted two levels in, matching the nesting json.dump would give it
+            link_count = 0
+            for link in self.iter_links(shard_index):
+                link_json = json.dumps(link, indent=indent, sort_keys=True)
+                f.write(("," if link_count else "[") + f"\n{padding * 2}" + link_json.replace("\n", f"\n{padding * 2}"))
+                link_count += 1
+            f.write(f"\n{padding}]" if link_count else "[]")
+        f.write("\n}")
+
     @property
     def version(self):
         return self.workspace_version
@@ -372,6 +508,34 @@ class LinksFile():
         return self.project_id
 
 
+def _write_links_file(links_file, output_dir):
+    path = os.path.join(output_dir, links_file.shard_file_name(0))
+    with open(path, 'w') as f:
+        links_file.write_json(f)
+    return path
+
+
+def write_links_files(links_file, output_dir=".", num_workers=os.cpu_count()):
+    """Write every links file shard of a project, in parallel when there is more than one
+
+    Each worker is only sent the samples of the shard it writes, as returned by LinksFile.shard.
+
+    Args:
+        links_file (LinksFile): Links of the project, split into shards of links_file.links_per_shard links objects.
+        output_dir (str): Directory to write the links files to.
+        num_workers (int): Number of processes writing shards.
+
+    Returns:
+        paths (list): The written links files, in shard order.
+    """
+    write_shard = functools.partial(_write_links_file, output_dir=output_dir)
+    shards = (links_file.shard(shard_index) for shard_index in range(links_file.shard_count))
+
+    if num_workers <= 1 or links_file.shard_count <= 1:
+        return [write_shard(links_shard) for links_shard in shards]
+    return process_utils.process_map(write_shard, shards, num_workers=min(num_workers, links_file.shard_count))
+
+
 # Entry point for unit tests
 def test_build_links_file(
     project_id,
@@ -414,6 +578,8 @@ def main():
     parser.add_argument('--ss2_bai', required=False, help="Localized path to array of bai files for the ss2 runs, used to build the file hashes")
     parser.add_argument('--ss2_fastq1', required=False, help="Localized path to array of fastq1 UUIDS for ss2 runs")
     parser.add_argument('--ss2_fastq2', required=False, help="Localized path to array of fastq2 UUIDSfor ss2 runs")
+    parser.add_argument('--links_per_shard', required=False, type=int, help="Split SS2 projects with more links objects than this into several links files")
+    parser.add_argument('--num_workers', required=False, type=int, default=os.cpu_count(), help="Number of processes writing links file shards")
 
     args = parser.parse_args()
 
@@ -433,15 +599,13 @@ def main():
         args.ss2_bai,
         args.ss2_fastq1,
         args.ss2_fastq2,
-        args.project_level
+        args.project_level,
+        args.links_per_shard
     )
 
-    links_file_json = links_file.get_json()
-
-    # Write links to file
-    print("Writing links file to disk...")
-    with open(f'{links_file.uuid}_{links_file.version}_{links_file.project}.json', 'w') as f:
-        json.dump(links_file_json, f, indent=2, sort_keys=True)
+    # Write links to file, streaming one links object at a time
+    print(f"Writing {links_file.shard_count} links file(s) to disk...")
+    write_links_files(links_file, num_workers=args.num_workers)
 
 
 if __name__ == '__main__':
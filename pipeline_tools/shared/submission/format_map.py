@@ -1,8 +1,13 @@
 import arrow
+import calendar
+import functools
+import mimetypes
 import uuid
 import re
 import json
 
+from pipeline_tools.shared import json_utils
+
 EXTENSION_TO_FORMAT = {
     "[.]bam$": "bam",
     "[.]loom$": "loom",
@@ -33,10 +38,68 @@ MIME_FORMATS = [
     ('application/octet-stream', '.bam'),
     ('application/octet-stream', '.bai'),
     ('application/octet-stream', '.fa'),
-    ('application/octet-stream', '.fasta')]
+    ('application/octet-stream', '.fasta'),
+    ('application/x-hdf5', '.h5')]
+
+# Entity type of the files of each format, any other format is "unknown"
+FORMAT_TO_ENTITY_TYPE = {
+    "fasta": "reference_file",
+    "bam": "analysis_file",
+    "loom": "analysis_file",
+    "bai": "analysis_file",
+    "h5": "analysis_file",
+}
 
 NAMESPACE = uuid.UUID('c6591d1d-27bc-4c94-bd54-1b51f8a2456c')
 
+# Regex metacharacters, other than "." and a trailing "$", that keep a pattern out of the literal suffix index
+REGEX_METACHARACTERS = set('^*+?{}[]()|\\$')
+
+
+def build_format_index(extension_to_format):
+    """Compile the EXTENSION_TO_FORMAT patterns into lookup tables, so classifying a path is a few dict lookups
+
+    Patterns are "[c]literal$" suffixes, "[c]literal" substrings (e.g. .zarr directories, which also match the
+    files inside them), or arbitrary regexes which are kept as precompiled patterns. The "." of multi-part
+    suffixes such as ".csv.gz" is taken literally. Each pattern keeps its position in EXTENSION_TO_FORMAT as its
+    priority, so a path matching several patterns gets the same format as with a scan of the dict.
+
+    Args:
+        extension_to_format (dict): Regex patterns mapped to file formats, in priority order.
+
+    Returns:
+        suffixes (dict): (priority, format) keyed by literal suffix.
+        substrings (list): (priority, literal, format) tuples.
+        regexes (list): (priority, compiled pattern, format) tuples.
+    """
+    suffixes, substrings, regexes = {}, [], []
+    for priority, (pattern, file_format) in enumerate(extension_to_format.items()):
+        literal = re.sub(r'^\[(.)\]', r'\1', pattern)
+        anchored = literal.endswith('$')
+        if anchored:
+            literal = literal[:-1]
+        if REGEX_METACHARACTERS.intersection(literal):
+            regexes.append((priority, re.compile(pattern), file_format))
+        elif anchored:
+            suffixes.setdefault(literal, (priority, file_format))
+        else:
+            substrings.append((priority, literal, file_format))
+    return suffixes, substrings, regexes
+
+
+FORMAT_SUFFIXES, FORMAT_SUBSTRINGS, FORMAT_REGEXES = build_format_index(EXTENSION_TO_FORMAT)
+
+# Reversed suffixes as one alternation in priority order, so that matching it at the start of a reversed path finds
+# the best suffix in a single anchored match. Like "$", suffixes also match before a trailing newline.
+FORMAT_SUFFIX_FORMATS = sorted(FORMAT_SUFFIXES.values())
+REVERSED_FORMAT_SUFFIXES = re.compile('\n?(?:{})'.format('|'.join(
+    '({})'.format(re.escape(suffix[::-1])) for suffix in sorted(FORMAT_SUFFIXES, key=FORMAT_SUFFIXES.get))))
+
+# Mime types of the descriptors are those known to mimetypes, including the system mime.types files, with the
+# custom types of the pipeline outputs added
+for mime_type, extension in MIME_FORMATS:
+    mimetypes.add_type(mime_type, extension)
+
 
 def get_uuid5(value_to_hash):
     return str(uuid.uuid5(NAMESPACE, value_to_hash))
@@ -72,26 +135,73 @@ def get_analysis_workflow_id(analysis_output_path):
 def get_entity_type(path):
     """Returns the type of file being processed based on the path"""
 
-    format = get_file_format(path)
-
-    if(format == "fasta"):
-        return "reference_file"
-
-    elif(format == "bam" or format == "loom" or format == "bai"):
-        return "analysis_file"
-    return "unknown"
+    return FORMAT_TO_ENTITY_TYPE.get(get_file_format(path), "unknown")
 
 
 def get_file_format(path):
     """Returns the file type of the file at the given path, according to EXTENSION_TO_FORMAT"""
 
-    for ext in EXTENSION_TO_FORMAT:
-        if re.search(ext, path):
-            file_format = EXTENSION_TO_FORMAT[ext]
-            return file_format
+    file_format = _get_file_format(path)
+    if file_format == 'unknown':
+        print('Warning: no known format in the format_map matches file {}'.format(path))
+    return file_format
+
+
+def _get_file_format(path):
+    match = REVERSED_FORMAT_SUFFIXES.match(path[::-1])
+    best = FORMAT_SUFFIX_FORMATS[match.lastindex - 1] if match else None
+    for priority, literal, file_format in FORMAT_SUBSTRINGS:
+        if literal in path and (best is None or priority < best[0]):
+            best = (priority, file_format)
+    for priority, pattern, file_format in FORMAT_REGEXES:
+        if (best is None or priority < best[0]) and pattern.search(path):
+            best = (priority, file_format)
+    return best[1] if best else 'unknown'
+
+
+@functools.lru_cache(maxsize=None)
+def _get_mime_type(suffixes):
+    return mimetypes.guess_type('file' + suffixes)[0]
+
+
+def classify(path):
+    """Returns the format, entity type and mime type of the file at the given path in one lookup
+
+    Args:
+        path (str): Path or URL of the file.
+
+    Returns:
+        tuple: The format as given by get_file_format, the entity type as given by get_entity_type, and the mime
+            type as guessed by mimetypes with MIME_FORMATS added, or None if it is not known.
+    """
+    file_format = get_file_format(path)
+    # The mime type only depends on the extensions of the file name, which repeat across outputs
+    file_name = path[path.rfind('/') + 1:]
+    dot = file_name.find('.', 1)
+    mime_type = _get_mime_type(file_name[dot:]) if dot > 0 else None
+    return file_format, FORMAT_TO_ENTITY_TYPE.get(file_format, "unknown"), mime_type
+
+
+def classify_paths(paths):
+    """Classify many paths at once, looking each distinct path up only once
+
+    Args:
+        paths (list): Paths or URLs of the files.
+
+    Returns:
+        list: The (format, entity type, mime type) of each path as returned by classify, in the order of paths.
+    """
+    classifications = {path : classify(path) for path in dict.fromkeys(paths)}
+    return [classifications[path] for path in paths]
+
 
-    print('Warning: no known format in the format_map matches file {}'.format(path))
-    return 'unknown'
+# The timestamp shapes emitted by Cromwell, e.g. 2021-07-14T16:01:45.123Z or 2021-07-14T16:01:45.123-04:00, which
+# format_timestamp normalizes without arrow. Fractions of more than 6 digits are rounded by arrow, so they fall back.
+CROMWELL_TIMESTAMP_REGEX = re.compile(
+    r'(\d{4})-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])'
+    r'T((?:[01]\d|2[0-3]):[0-5]\d:[0-5]\d)(?:\.(\d{1,6}))?'
+    r'(?:Z|[+-](?:[01]\d|2[0-3]):?[0-5]\d)?$'
+)
 
 
 def format_timestamp(timestamp):
@@ -104,6 +214,12 @@ def format_timestamp(timestamp):
 
     """
     if timestamp:
+        # Like arrow, keep the wall time of timestamps with an offset and truncate the fraction to milliseconds
+        match = CROMWELL_TIMESTAMP_REGEX.match(timestamp)
+        if match:
+            year, month, day, time, fraction = match.groups()
+            if day <= '28' or int(day) <= calendar.monthrange(int(year), int(month))[1]:
+                return '{}-{}-{}T{}.{}Z'.format(year, month, day, time, ((fraction or '') + '000')[:3])
         d = arrow.get(timestamp)
         formatted_date = d.format('YYYY-MM-DDTHH:mm:ss.SSS')
         return '{}Z'.format(formatted_date)
@@ -145,15 +261,19 @@ def get_workflow_inputs(inputs, input_fields):
     return return_inputs
 
 
-def get_workflow_metadata(metadata_json):
+def get_workflow_metadata(metadata_json, paths=None):
     """Load workflow metadata from a JSON file.
 
     Args:
         metadata_json (str): Path to file containing metadata json for the workflow.
+        paths (list): Optional paths of the values to read, e.g. [('inputs', '*'), ('start',)], see
+            json_utils.read_json_paths. Everything else is skipped without being loaded.
 
     Returns:
         metadata (dict): A dict consisting of Cromwell workflow metadata information.
     """
+    if paths is not None:
+        return json_utils.read_json_paths(metadata_json, paths)
     with open(metadata_json) as f:
         metadata = json.load(f)
     return metadata
@@ -162,6 +282,8 @@ def get_workflow_metadata(metadata_json):
 def get_workflow_tasks(workflow_metadata):
     """Creates array of Cromwell workflow's task metadata for analysis_process.
 
+    Only the first shard of each call is described, see iter_workflow_tasks to walk every shard.
+
     Args:
         workflow_metadata (dict): A dict representing the workflow metadata.
 
@@ -169,34 +291,86 @@ def get_workflow_tasks(workflow_metadata):
         sorted_output_tasks (list): Sorted array of dicts representing task metadata in the format required for
                                     the analysis json.
     """
-    calls = workflow_metadata['calls']
+    sorted_output_tasks = list(iter_sorted_workflow_tasks(workflow_metadata, first_shard_only=True))
+    return sorted_output_tasks
 
-    output_tasks = []
-    for long_task_name in calls:
-        task_name = long_task_name.split('.')[-1]
-        task = calls[long_task_name][0]
 
-        if task.get('subWorkflowMetadata'):
-            output_tasks.extend(
-                get_workflow_tasks(task['subWorkflowMetadata'])
-            )  # recursively parse tasks
+def iter_workflow_tasks(workflow_metadata, first_shard_only=False):
+    """Yields the metadata of every task call of a Cromwell workflow and its sub-workflows, one at a time.
+
+    Calls are walked depth first in the order of the metadata, without recursion, so neither the nesting of
+    sub-workflows nor the number of shards is limited by the interpreter or held in memory at once.
+
+    Args:
+        workflow_metadata (dict): A dict representing the workflow metadata.
+        first_shard_only (bool): Whether to only describe the first entry of each call, as get_workflow_tasks does.
+            Otherwise every shard and attempt is described, with its shard_index and attempt. Tasks of a
+            sub-workflow that is not scattered itself take the shard_index of the enclosing scattered call.
+
+    Yields:
+        task (dict): Task metadata in the format required for the analysis json.
+    """
+    for task_name, call, shard_index in _iter_workflow_calls(workflow_metadata, first_shard_only):
+        yield _get_task_record(task_name, call, shard_index, first_shard_only)
+
+
+def iter_sorted_workflow_tasks(workflow_metadata, first_shard_only=False):
+    """Yields the task metadata of iter_workflow_tasks sorted by task name, ties kept in workflow order.
+
+    Only the task names and references to the calls are sorted, the task records are built as they are yielded.
+
+    Args:
+        workflow_metadata (dict): A dict representing the workflow metadata.
+        first_shard_only (bool): Whether to only describe the first entry of each call.
+
+    Yields:
+        task (dict): Task metadata in the format required for the analysis json.
+    """
+    calls = sorted(_iter_workflow_calls(workflow_metadata, first_shard_only), key=lambda call: call[0])
+    for task_name, call, shard_index in calls:
+        yield _get_task_record(task_name, call, shard_index, first_shard_only)
+
+
+def _iter_workflow_calls(workflow_metadata, first_shard_only):
+    """Yields (task_name, call, shard_index) for every task call, using an explicit stack of the workflows being
+    walked."""
+    stack = [_iter_calls(workflow_metadata, first_shard_only, -1)]
+    while stack:
+        task_name, call, shard_index = next(stack[-1], (None, None, None))
+        if call is None:
+            stack.pop()
+        elif call.get('subWorkflowMetadata'):
+            stack.append(_iter_calls(call['subWorkflowMetadata'], first_shard_only, shard_index))
         else:
-            runtime = task['runtimeAttributes']
-            out_task = {
-                'task_name': task_name,
-                'cpus': int(runtime['cpu']),
-                'memory': runtime['memory'],
-                'disk_size': runtime['disks'],
-                'docker_image': runtime['docker'],
-                'zone': runtime['zones'],
-                'start_time': format_timestamp(task['start']),
-                'stop_time': format_timestamp(task['end']),
-                'log_out': task['stdout'],
-                'log_err': task['stderr'],
-            }
-            output_tasks.append(out_task)
-    sorted_output_tasks = sorted(output_tasks, key=lambda k: k['task_name'])
-    return sorted_output_tasks
+            yield task_name, call, shard_index
+
+
+def _iter_calls(workflow_metadata, first_shard_only, parent_shard_index):
+    for long_task_name, shards in workflow_metadata['calls'].items():
+        task_name = long_task_name.split('.')[-1]
+        for call in shards[:1] if first_shard_only else shards:
+            shard_index = call.get('shardIndex', -1)
+            yield task_name, call, parent_shard_index if shard_index == -1 else shard_index
+
+
+def _get_task_record(task_name, task, shard_index, first_shard_only):
+    runtime = task['runtimeAttributes']
+    out_task = {
+        'task_name': task_name,
+        'cpus': int(runtime['cpu']),
+        'memory': runtime['memory'],
+        'disk_size': runtime['disks'],
+        'docker_image': runtime['docker'],
+        'zone': runtime['zones'],
+        'start_time': format_timestamp(task['start']),
+        'stop_time': format_timestamp(task['end']),
+        'log_out': task['stdout'],
+        'log_err': task['stderr'],
+    }
+    if not first_shard_only:
+        out_task['shard_index'] = shard_index
+        out_task['attempt'] = task.get('attempt')
+    return out_task
 
 
 def get_call_type(workflow_metadata):
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+import argparse
+import arrow
+import base64
+import json
+import os
+
+from pipeline_tools.shared import checksum_utils, storage_backends
+
+
+def format_creation_time(timestamp):
+    """Normalize an object creation time to the format of get-bucket-date, which convert_datetime leaves unchanged
+
+    Args:
+        timestamp (str): ISO-8601 creation time of the object, e.g. 2021-07-08T17:22:45.120000+00:00
+
+    Returns:
+        str: The UTC time truncated to seconds, e.g. 2021-07-08T17:22:45.000000Z
+    """
+    return arrow.get(timestamp).to('UTC').format('YYYY-MM-DDTHH:mm:ss') + '.000000Z'
+
+
+def get_manifest_entry(record, prefix, input_uuid=None, local_dir=None):
+    """Turn an object metadata record into a create-file-descriptor manifest entry
+
+    Args:
+        record (dict): Metadata record of the object, as returned by gcs_utils.get_blob_metadata_record.
+        prefix (str): The listed prefix, ending with '/'.
+        input_uuid (str): Optional input uuid of the described files.
+        local_dir (str): Directory holding local copies of the objects, to use as file_path so that
+            create-file-descriptor can compute the sha256 that object metadata does not provide. Without it
+            file_path is the object URL, which create-file-descriptor cannot read.
+
+    Returns:
+        entry (dict): The file_path, size, crc32c and md5 (hex), content_type, creation_time and input_uuid.
+    """
+    file_path = record['name']
+    if local_dir:
+        file_path = os.path.join(local_dir, record['name'][len(prefix) :])
+
+    crc32c = record['crc32c']
+    if crc32c:
+        crc32c = checksum_utils.crc32c_to_hex(checksum_utils.crc32c_from_base64(crc32c))
+    md5 = record['md5_hash']
+    if md5:
+        md5 = base64.b64decode(md5).hex()
+    creation_time = record['time_created']
+    if creation_time:
+        creation_time = format_creation_time(creation_time)
+
+    entry = {
+        "file_path": file_path,
+        "size": record['size'],
+        "crc32c": crc32c or None,
+        "md5": md5 or None,
+        "content_type": record['content_type'],
+        "creation_time": creation_time or None,
+    }
+    if input_uuid:
+        entry['input_uuid'] = input_uuid
+    return entry
+
+
+def build_manifest(records, prefix, input_uuid=None, local_dir=None):
+    """Build the manifest entries of every listed object, skipping directory placeholders, sorted by name"""
+    return [
+        get_manifest_entry(records[name], prefix, input_uuid, local_dir)
+        for name in sorted(records)
+        if not name.endswith('/')
+    ]
+
+
+def main():
+    description = """Lists a bucket prefix once and writes a create-file-descriptor manifest of its objects"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        '--prefix',
+        dest='prefix',
+        required=True,
+        help="gs:// (or local) prefix to list, e.g. gs://bucket/outputs/",
+    )
+    parser.add_argument(
+        '--input_uuid', dest='input_uuid', help="Input uuid to record for every object"
+    )
+    parser.add_argument(
+        '--local_dir',
+        dest='local_dir',
+        required=True,
+        help="Directory holding local copies of the objects, used as their file_path so that "
+        "create-file-descriptor can compute their sha256",
+    )
+    parser.add_argument(
+        '--output',
+        dest='output',
+        default='descriptor_manifest.jsonl',
+        help="Path of the JSON lines manifest to write",
+    )
+
+    args = parser.parse_args()
+
+    # A single paged list call returns the size, checksums and creation time of every object
+    records = storage_backends.get_storage_backend(args.prefix).list(args.prefix)
+    manifest = build_manifest(records, args.prefix, args.input_uuid, args.local_dir)
+
+    print(f"Writing {len(manifest)} manifest entries to {args.output}...")
+    with open(args.output, 'w') as f:
+        for entry in manifest:
+            f.write(json.dumps(entry, sort_keys=True) + '\n')
+
+
+if __name__ == '__main__':
+    main()
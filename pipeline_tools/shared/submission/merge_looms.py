@@ -1,10 +1,257 @@
 #!/usr/bin/env python
 import argparse
+import h5py
 import loompy
 import numpy as np
+import os
+import scipy.sparse
+import shutil
+import tempfile
+
+from pipeline_tools.shared import process_utils
+
+
+# Cells with fewer UMIs than this are filtered out of the merged loom
+MIN_UMIS = 100
+
+# Global attributes of the input looms that are merged into the set of their values
+SET_JOINED_ATTRS = [
+    "expression_data_type",
+    "optimus_output_schema_version",
+    "pipeline_version",
+    "input_id_metadata_field",
+    "input_name_metadata_field"
+]
+
+# Global attributes of the input looms that are merged in input order
+LIST_JOINED_ATTRS = ["input_id", "input_name"]
+
+# Global attributes of the project metadata that are merged into the set of their values
+PROJECT_SET_JOINED_ATTRS = [
+    "library_preparation_protocol.library_construction_approach",
+    "donor_organism.genus_species",
+    "specimen_from_organism.organ"
+]
+
+# Bytes the merged matrix takes per count, it is written as float64
+OUTPUT_ITEMSIZE = 8
+
+# Separator of the values of a joined global attribute
+ATTR_SEPARATOR = ", "
+
+# Memory budget in MiB of appends to an existing loom without one, they are always streamed in batches
+DEFAULT_APPEND_MEMORY_MB = 1024
+
+# Formats the merged matrix can be written in
+OUTPUT_FORMATS = ["loom", "h5"]
+
+# Values per chunk of the datasets of h5 output, 1 MiB of float64 counts, and their compression
+H5_CHUNK_SIZE = 2 ** 17
+H5_COMPRESSION = "gzip"
+H5_COMPRESSION_LEVEL = 4
+
+
+def get_filtered_cells(ds):
+    """Get the indices of the cells of a loom that pass the UMI filter"""
+
+    # filter out cells with low counts n_molecules > 1
+    return np.where(ds.ca["n_molecules"] >= MIN_UMIS)[0]
+
+
+def get_filtered_col_attrs(ds, cells, index):
+    """Get the column attributes of the filtered cells of a loom, with cell names suffixed by the loom index
+    The cell names of partial merges, whose index is None, are already suffixed and are kept as they are"""
+
+    col_attrs = {key: values[cells] for key, values in ds.ca.items()}
+    if index is not None:
+        col_attrs["cell_names"] = col_attrs["cell_names"] + "-" + str(index)
+    return col_attrs
+
+
+def get_cells_per_batch(ds, max_memory_mb):
+    """Get the number of cells of a loom whose dense counts fit in the memory budget, counting the window of columns
+    read, the filtered cells picked out of it and the output buffer they are copied to"""
+
+    bytes_per_cell = ds.shape[0] * (2 * ds.layers[""].dtype.itemsize + OUTPUT_ITEMSIZE)
+    return max(1, int(max_memory_mb * 2 ** 20) // bytes_per_cell)
+
+
+def iter_filtered_counts(ds, cells, batch_size):
+    """Yield the dense counts of the filtered cells of a loom, reading windows of batch_size columns at a time"""
+
+    for start in range(0, ds.shape[1], batch_size):
+        selection = cells[(cells >= start) & (cells < start + batch_size)] - start
+        if len(selection):
+            yield ds.layers[""][:, start:start + batch_size][:, selection]
+
+
+def check_same_genes(row_attrs, loom_row_attrs, loom_file):
+    """Raise a ValueError if the genes of a loom are not those of the looms it is merged with, in the same order"""
+
+    if not np.array_equal(row_attrs["ensembl_ids"], loom_row_attrs["ensembl_ids"]):
+        raise ValueError(f"The genes of {loom_file} differ from those of the other looms, or are in another order")
+
+
+def read_filtered_loom(loom_file, index):
+    """Read the cells of an input loom that pass the UMI filter
+
+    Args:
+        loom_file (str): Path to the input loom file
+        index (int): Position of the loom in the inputs, appended to its cell names to avoid collisions, or None to
+            keep the cell names of a partial merge
+
+    Returns:
+        matrix (scipy.sparse.csc_matrix): Counts of the filtered cells, genes by cells
+        row_attrs (dict): Row attributes of the loom
+        col_attrs (dict): Column attributes of the filtered cells, with suffixed cell names
+        global_attrs (dict): The SET_JOINED_ATTRS and LIST_JOINED_ATTRS values of the loom
+    """
+    print(loom_file)
+    with loompy.connect(loom_file, mode="r") as ds:
+        global_attrs = {key: ds.attrs[key] for key in SET_JOINED_ATTRS + LIST_JOINED_ATTRS}
+        row_attrs = dict(ds.ra.items())
+        cells = get_filtered_cells(ds)
+        col_attrs = get_filtered_col_attrs(ds, cells, index)
+        matrix = ds.sparse(cols=cells).tocsc()
+
+    return matrix, row_attrs, col_attrs, global_attrs
+
+
+def _read_filtered_loom(arguments):
+    return read_filtered_loom(*arguments)
+
+
+def read_filtered_looms(input_loom_files, num_workers=os.cpu_count(), indices=None):
+    """Read the filtered cells of every input loom, in parallel when there is more than one
+
+    Args:
+        input_loom_files (list): Paths to the input loom files
+        num_workers (int): Maximum number of processes reading input looms, at most one is started per input loom
+        indices (list): Index of every input loom passed to read_filtered_loom, defaults to its position in the inputs
+
+    Returns:
+        list: The read_filtered_loom result of every input loom, in input order
+    """
+    if indices is None:
+        indices = range(len(input_loom_files))
+    arguments = list(zip(input_loom_files, indices))
+    if num_workers <= 1 or len(arguments) <= 1:
+        return [read_filtered_loom(*argument) for argument in arguments]
+
+    # Each worker starts a fresh interpreter importing loompy, so never start more than there are inputs
+    return process_utils.process_map(_read_filtered_loom, arguments, num_workers=min(num_workers, len(arguments)))
+
+
+class H5MatrixWriter():
+    """Writes a merged genes by cells matrix to HDF5 in compressed sparse column (CSC) layout
+
+    Readers slicing cells only read the chunks holding those columns, rather than the genes by 64 cell tiles of a
+    loom. The file holds:
+
+        /matrix/data, /matrix/indices, /matrix/indptr   CSC arrays of the counts, with the gene index of each count
+        /matrix attribute shape                         [genes, cells]
+        /row_attrs/<name>, /col_attrs/<name>            the row and column attributes of the merged loom
+        file attributes                                 the global attributes of the merged loom
+
+    Every dataset is chunked in H5_CHUNK_SIZE values and compressed with shuffle and H5_COMPRESSION. Columns are
+    appended as they are merged, so the matrix never has to be held whole.
+    """
+
+    def __init__(self, path):
+        self.file = h5py.File(path, "w")
+        self.matrix = self.file.create_group("matrix")
+        self.data = self.__create_dataset__(self.matrix, "data", np.zeros(0, dtype=np.float64))
+        self.indices = self.__create_dataset__(self.matrix, "indices", np.zeros(0, dtype=np.int32))
+        self.indptr = self.__create_dataset__(self.matrix, "indptr", np.zeros(1, dtype=np.int64))
+        self.shape = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __create_dataset__(self, group, name, values):
+        """Create a resizable, chunked and compressed dataset of the values"""
+
+        if values.dtype.kind in ("O", "U"):
+            values = values.astype(str).astype(object)
+            dtype = h5py.string_dtype()
+        else:
+            dtype = values.dtype
+        return group.create_dataset(
+            name,
+            data=values,
+            dtype=dtype,
+            maxshape=(None,),
+            chunks=(H5_CHUNK_SIZE,),
+            shuffle=True,
+            compression=H5_COMPRESSION,
+            compression_opts=H5_COMPRESSION_LEVEL
+        )
+
+    def __append__(self, dataset, values):
+        start = dataset.shape[0]
+        dataset.resize((start + len(values),))
+        dataset[start:] = values
+
+    def add_columns(self, matrix, row_attrs):
+        """Append columns of counts to the matrix
+
+        Args:
+            matrix (numpy.ndarray or scipy.sparse matrix): Counts of the cells to append, genes by cells
+            row_attrs (dict): Row attributes of the matrix, written with the first columns
+        """
+        if self.shape is None:
+            self.shape = [matrix.shape[0], 0]
+            row_attrs_group = self.file.create_group("row_attrs")
+            for key, values in row_attrs.items():
+                self.__create_dataset__(row_attrs_group, key, np.asarray(values))
+
+        columns = scipy.sparse.csc_matrix(matrix)
+        self.__append__(self.indptr, columns.indptr[1:].astype(np.int64) + self.data.shape[0])
+        self.__append__(self.data, columns.data.astype(self.data.dtype))
+        self.__append__(self.indices, columns.indices.astype(np.int32))
+        self.shape[1] += matrix.shape[1]
+
+    def write_attrs(self, col_attrs, global_attrs):
+        """Write the column attributes of every cell and the global attributes"""
+
+        col_attrs_group = self.file.create_group("col_attrs")
+        for key, values in col_attrs.items():
+            self.__create_dataset__(col_attrs_group, key, np.asarray(values))
+        for key, value in global_attrs.items():
+            self.file.attrs[key] = value
+
+    def close(self):
+        if self.shape is not None:
+            self.matrix.attrs["shape"] = self.shape
+        self.file.close()
 
 
 class MergeLooms():
+    """Merge library level looms into a project level loom
+
+    By default the filtered cells of every input are read straight into sparse column blocks, by a pool of processes,
+    which are stacked in input order and written to the output loom in a single loompy.create, so the data is written
+    once and no intermediate loom is needed.
+
+    With a memory budget (max_memory_mb), the inputs are instead streamed one at a time, in batches of as many cells
+    as fit in the budget, into the output loom, so peak memory no longer grows with the number of cells in the project.
+
+    Large projects can be merged as a tree: subsets of the library looms are merged into partial looms independently,
+    each with suffix_offset set to the position of its first library in the project, and the partial looms are then
+    merged in order with combine_partials, which keeps their cell names and joins their global attributes, giving the
+    same loom as merging every library at once.
+
+    New libraries can be appended to an existing merged loom (append): only their filtered cells are read and streamed
+    in batches onto the end of a copy of the loom, their cell names are suffixed after the libraries already merged and
+    the global attributes are joined with those of the loom, giving the same loom as merging every library at once.
+    The copy replaces the loom once the append succeeds, so a failed append leaves the loom as it was.
+
+    The merged matrix is written as a loom, or with output_format "h5" as HDF5 in the chunked and compressed CSC layout
+    of H5MatrixWriter, with the same row, column and global attributes.
+    """
 
     def __init__(
         self,
@@ -14,7 +261,13 @@ class MergeLooms():
         organ,
         project_id,
         project_name,
-            output_loom_file):
+        output_loom_file,
+        num_workers=os.cpu_count(),
+        max_memory_mb=None,
+        suffix_offset=0,
+        combine_partials=False,
+        append=False,
+            output_format="loom"):
 
         self.input_loom_files = input_loom_files
         self.library = ", ".join(set(library))
@@ -23,70 +276,214 @@ class MergeLooms():
         self.project_id = project_id
         self.project_name = project_name
         self.output_loom_file = output_loom_file
+        self.combine_partials = combine_partials
+        self.output_format = output_format
 
-        expression_data_type_list = []
-        optimus_output_schema_version_list = []
-        pipeline_versions_list = []
-        input_id_metadata_field_list = []
-        input_name_metadata_field_list = []
-        input_id_list = []
-        input_name_list = []
-
-        with loompy.new("intermediate.loom") as dsout:
-            for i in range(len(self.input_loom_files)):
-                loom_file = self.input_loom_files[i]
-                print(loom_file)
-                with loompy.connect(loom_file) as ds:
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output format {output_format}, expected one of {', '.join(OUTPUT_FORMATS)}")
+        if append and output_format != "loom":
+            raise ValueError("Only loom output can be appended to")
+
+        # Cells of partial merges already carry the suffix of the library they came from
+        if combine_partials:
+            self.suffixes = [None] * len(input_loom_files)
+        else:
+            self.suffixes = list(range(suffix_offset, suffix_offset + len(input_loom_files)))
+
+        if append:
+            self.__append__(max_memory_mb or DEFAULT_APPEND_MEMORY_MB)
+        elif max_memory_mb:
+            self.__merge_in_batches__(max_memory_mb, self.output_loom_file)
+        else:
+            self.__merge_in_memory__(num_workers)
+
+    def __merge_in_memory__(self, num_workers):
+        """Read the filtered cells of every input into memory and write the output loom at once"""
+
+        matrices = []
+        col_attrs_list = []
+        global_attrs_list = []
+        row_attrs = None
+
+        looms = read_filtered_looms(self.input_loom_files, num_workers, self.suffixes)
+        for loom_file, (matrix, loom_row_attrs, col_attrs, global_attrs) in zip(self.input_loom_files, looms):
+
+            # check that the ordering is the same for the matrices being combined
+            if row_attrs is None:
+                row_attrs = loom_row_attrs
+            else:
+                check_same_genes(row_attrs, loom_row_attrs, loom_file)
 
-                    # add global attributes for this file to the running list of global attributes
-                    expression_data_type_list.append(ds.attrs["expression_data_type"])
-                    optimus_output_schema_version_list.append(ds.attrs["optimus_output_schema_version"])
-                    pipeline_versions_list.append(ds.attrs["pipeline_version"])
-                    input_id_metadata_field_list.append(ds.attrs["input_id_metadata_field"])
-                    input_name_metadata_field_list.append(ds.attrs["input_name_metadata_field"])
-                    input_id_list.append(ds.attrs["input_id"])
-                    input_name_list.append(ds.attrs["input_name"])
+            matrices.append(matrix)
+            col_attrs_list.append(col_attrs)
+            global_attrs_list.append(global_attrs)
+
+        if self.output_format == "h5":
+            with H5MatrixWriter(self.output_loom_file) as writer:
+                writer.add_columns(scipy.sparse.hstack(matrices, format="csc"), row_attrs)
+                writer.write_attrs(self.__concatenate_col_attrs__(col_attrs_list), self.__global_attrs__(global_attrs_list))
+            return
+
+        # Write out the loom file with the stacked sparse matrix and the global attributes
+        loompy.create(
+            self.output_loom_file,
+            scipy.sparse.hstack(matrices, format="csc"),
+            row_attrs,
+            self.__concatenate_col_attrs__(col_attrs_list),
+            file_attrs=self.__global_attrs__(global_attrs_list)
+        )
+
+    def __append__(self, max_memory_mb):
+        """Append the inputs to a copy of the output loom in its directory, which then replaces the loom"""
+
+        fd, appended_loom_file = tempfile.mkstemp(
+            suffix=".loom", dir=os.path.dirname(os.path.abspath(self.output_loom_file)))
+        os.close(fd)
+        try:
+            shutil.copy2(self.output_loom_file, appended_loom_file)
+            self.__merge_in_batches__(max_memory_mb, appended_loom_file, append=True)
+            os.replace(appended_loom_file, self.output_loom_file)
+        except BaseException:
+            os.remove(appended_loom_file)
+            raise
+
+    def __merge_in_batches__(self, max_memory_mb, output_file, append=False):
+        """Stream the filtered cells of the inputs into the output loom in batches that fit in max_memory_mb
+
+        Filtered cells are copied into a buffer of batch size columns across inputs, which is written whenever it is
+        full, so the output matrix is chunked as for a single write. Column attributes, which take memory proportional
+        to the number of cells rather than cells by genes, are collected as the inputs are read and written once at the
+        end, so that adding a batch does not rewrite them.
+
+        Args:
+            max_memory_mb (float): Memory budget of the batches in MiB
+            output_file (str): Path to the output to write
+            append (bool): Append to the existing loom at output_file rather than create it
+        """
+
+        col_attrs_list = []
+        global_attrs_list = []
+        existing_attrs = None
+        row_attrs = None
+        batch = None
+        filled = 0
+
+        with self.__open_output__(output_file, append) as dsout:
+            if append:
+                existing_attrs = {key: dsout.attrs[key] for key in dsout.attrs.keys()}
+                row_attrs = dict(dsout.ra.items())
+                batch = np.empty((dsout.shape[0], get_cells_per_batch(dsout, max_memory_mb)), dtype=np.float64)
+
+                # Continue the cell name suffixes after the libraries already in the loom
+                if not self.combine_partials:
+                    suffix_offset = len(existing_attrs["input_id"].split(ATTR_SEPARATOR))
+                    self.suffixes = list(range(suffix_offset, suffix_offset + len(self.input_loom_files)))
+
+                col_attrs_list.append(dict(dsout.ca.items()))
+
+            # Take the column attributes out of the loom, so that add_columns leaves them alone, and write them
+            # back with those of the new cells at the end
+            if append:
+                for key in list(dsout.ca.keys()):
+                    del dsout.ca[key]
+
+            for i, loom_file in enumerate(self.input_loom_files):
+                print(loom_file)
+                with loompy.connect(loom_file, mode="r") as ds:
+                    global_attrs_list.append({key: ds.attrs[key] for key in SET_JOINED_ATTRS + LIST_JOINED_ATTRS})
 
                     # check that the ordering is the same for the matrices being combined
-                    if dsout.shape[0] != 0:
-                        assert(np.array_equal(dsout.ra["ensembl_ids"], ds.ra["ensembl_ids"]))
+                    if row_attrs is None:
+                        row_attrs = dict(ds.ra.items())
+                        batch = np.empty((ds.shape[0], get_cells_per_batch(ds, max_memory_mb)), dtype=np.float64)
+                    else:
+                        check_same_genes(row_attrs, ds.ra, loom_file)
+
+                    cells = get_filtered_cells(ds)
+                    col_attrs_list.append(get_filtered_col_attrs(ds, cells, self.suffixes[i]))
+
+                    for counts in iter_filtered_counts(ds, cells, batch.shape[1]):
+                        copied = 0
+                        while copied < counts.shape[1]:
+                            count = min(batch.shape[1] - filled, counts.shape[1] - copied)
+                            batch[:, filled:filled + count] = counts[:, copied:copied + count]
+                            filled += count
+                            copied += count
+                            if filled == batch.shape[1]:
+                                self.__add_columns__(dsout, batch, row_attrs)
+                                filled = 0
+
+            if filled:
+                self.__add_columns__(dsout, batch[:, :filled], row_attrs)
+
+            col_attrs = self.__concatenate_col_attrs__(col_attrs_list)
+            global_attrs = self.__global_attrs__(global_attrs_list, existing_attrs)
+            if self.output_format == "h5":
+                dsout.write_attrs(col_attrs, global_attrs)
+            else:
+                for key, values in col_attrs.items():
+                    dsout.ca[key] = values
+                for key, value in global_attrs.items():
+                    dsout.attrs[key] = value
+
+    def __open_output__(self, output_file, append):
+        """Open the output to stream batches of cells into, the existing loom when appending"""
+
+        if self.output_format == "h5":
+            return H5MatrixWriter(output_file)
+        if append:
+            return loompy.connect(output_file)
+        return loompy.new(output_file)
+
+    def __add_columns__(self, dsout, matrix, row_attrs):
+        """Append a batch of cells to the output opened by __open_output__"""
+
+        if self.output_format == "h5":
+            dsout.add_columns(matrix, row_attrs)
+        else:
+            dsout.add_columns({"": matrix}, {}, row_attrs=row_attrs)
 
-                    # filter out cells with low counts n_molecules > 1
-                    UMIs = ds.ca['n_molecules']
-                    cells = np.where(UMIs >= 100)[0]
-                    for (ix, selection, view) in ds.scan(items=cells, axis=1):
-                        view.ca['cell_names'] = view.ca['cell_names'] + "-" + str(i)
-                        dsout.add_columns(view.layers, col_attrs=view.ca, row_attrs=view.ra)
+    def __concatenate_col_attrs__(self, col_attrs_list):
+        """Concatenate the column attributes of the filtered cells of the inputs, in input order"""
 
-        # add global attributes for this file to the running list of global attributes
-        ds = loompy.connect("intermediate.loom")
+        return {
+            key: np.concatenate([attrs[key] for attrs in col_attrs_list])
+            for key in col_attrs_list[0]
+        }
 
-        row_attrs = ds.ra[:]
-        col_attrs = ds.ca[:]
-        sp = ds.sparse()
+    def __global_attrs__(self, global_attrs_list, existing_attrs=None):
+        """Build the global attributes of the merged loom from the project metadata and those of the input looms
 
-        # Write out a new loom file with the sparse matrix
-        loompy.create(self.output_loom_file, sp, row_attrs, col_attrs)
+        Args:
+            global_attrs_list (list): Global attributes of the input looms, in input order
+            existing_attrs (dict): Global attributes of the loom appended to, which come before those of the inputs
+        """
 
-        ds.close()
+        global_attrs = {
+            "library_preparation_protocol.library_construction_approach": self.library,
+            "donor_organism.genus_species": self.species,
+            "specimen_from_organism.organ": self.organ,
+            "project.provenance.document_id": self.project_id,
+            "project.project_core.project_name": self.project_name
+        }
 
-        # add the global atributes to the loom file
-        ds = loompy.connect(self.output_loom_file)
+        # Partial merges and the loom appended to hold joined values
+        inputs = [(attrs, self.combine_partials) for attrs in global_attrs_list]
+        if existing_attrs is not None:
+            inputs.insert(0, (existing_attrs, True))
+            for key in PROJECT_SET_JOINED_ATTRS:
+                global_attrs[key] = ATTR_SEPARATOR.join(
+                    set(existing_attrs[key].split(ATTR_SEPARATOR)) | set(global_attrs[key].split(ATTR_SEPARATOR))
+                )
 
-        ds.attrs["library_preparation_protocol.library_construction_approach"] = self.library
-        ds.attrs["donor_organism.genus_species"] = self.species
-        ds.attrs["specimen_from_organism.organ"] = self.organ
-        ds.attrs["project.provenance.document_id"] = self.project_id
-        ds.attrs["project.project_core.project_name"] = self.project_name
-        ds.attrs["expression_data_type"] = ", ".join(set(expression_data_type_list))
-        ds.attrs["optimus_output_schema_version"] = ", ".join(set(optimus_output_schema_version_list))
-        ds.attrs["pipeline_version"] = ", ".join(set(pipeline_versions_list))
-        ds.attrs["input_id_metadata_field"] = ", ".join(set(input_id_metadata_field_list))
-        ds.attrs["input_name_metadata_field"] = ", ".join(set(input_name_metadata_field_list))
-        ds.attrs["input_id"] = ", ".join(input_id_list)
-        ds.attrs["input_name"] = ", ".join(input_name_list)
+        for key in SET_JOINED_ATTRS:
+            global_attrs[key] = ATTR_SEPARATOR.join(set(
+                value for attrs, joined in inputs for value in (attrs[key].split(ATTR_SEPARATOR) if joined else [attrs[key]])
+            ))
+        for key in LIST_JOINED_ATTRS:
+            global_attrs[key] = ATTR_SEPARATOR.join(attrs[key] for attrs, joined in inputs)
 
-        ds.close()
+        return global_attrs
 
 
 def main():
@@ -125,6 +522,33 @@ def main():
                         dest='output_loom_file',
                         required=True,
                         help="Path to output loom file")
+    parser.add_argument('--num-workers',
+                        dest='num_workers',
+                        type=int,
+                        default=os.cpu_count(),
+                        help="Number of processes reading input loom files")
+    parser.add_argument('--max-memory-mb',
+                        dest='max_memory_mb',
+                        type=int,
+                        help="Memory budget in MiB, stream the inputs into the output loom in batches of cells that fit in it")
+    parser.add_argument('--suffix-offset',
+                        dest='suffix_offset',
+                        type=int,
+                        default=0,
+                        help="Position of the first input loom in the project, for partial merges of a tree merge")
+    parser.add_argument('--combine-partials',
+                        dest='combine_partials',
+                        action='store_true',
+                        help="The input looms are partial merges, combine them keeping their cell names")
+    parser.add_argument('--append',
+                        dest='append',
+                        action='store_true',
+                        help="Append the input looms to the existing merged --output-loom-file in place, instead of creating it")
+    parser.add_argument('--output-format',
+                        dest='output_format',
+                        choices=OUTPUT_FORMATS,
+                        default="loom",
+                        help="Format of the merged matrix, loom or h5 (chunked and compressed CSC layout)")
 
     args = parser.parse_args()
 
@@ -135,7 +559,13 @@ def main():
         args.organ,
         args.project_id,
         args.project_name,
-        args.output_loom_file
+        args.output_loom_file,
+        args.num_workers,
+        args.max_memory_mb,
+        args.suffix_offset,
+        args.combine_partials,
+        args.append,
+        args.output_format
     )
 
 
@@ -1,19 +1,30 @@
 import argparse
-import json
 from pipeline_tools.shared.submission import format_map
 
 
+# Values read from the Cromwell metadata, the rest of the file is skipped
+OPTIMUS_METADATA_PATHS = [
+    ('inputs', 'ref_genome_fasta'),
+    ('calls', 'Optimus.OptimusLoomGeneration', 0, 'inputs', 'pipeline_version'),
+]
+
+SS2_METADATA_PATHS = [
+    ('inputs', 'genome_ref_fasta'),
+    ('calls', 'MultiSampleSmartSeq2.AggregateLoom', 0, 'inputs', 'pipeline_version'),
+    ('calls', 'MultiSampleSmartSeq2.sc_pe', 0, 'outputs', 'pipeline_version_out'),
+    ('calls', 'MultiSampleSmartSeq2.sc_se', 0, 'outputs', 'pipeline_version_out'),
+]
+
+
 def parse_optimus_metadata(metadata_json):
-    with open(metadata_json, 'r') as f:
-        metadata = json.load(f)
+    metadata = format_map.get_workflow_metadata(metadata_json, paths=OPTIMUS_METADATA_PATHS)
     ref_fasta_path = metadata['inputs']['ref_genome_fasta']
     pipeline_version = metadata['calls']['Optimus.OptimusLoomGeneration'][0]['inputs']['pipeline_version']
     return ref_fasta_path, pipeline_version
 
 
 def parse_SS2_metadata(metadata_json):
-    with open(metadata_json, 'r') as f:
-        metadata = json.load(f)
+    metadata = format_map.get_workflow_metadata(metadata_json, paths=SS2_METADATA_PATHS)
 
     # find reference fasta path in metadata.json
     ref_fasta_path = metadata['inputs']['genome_ref_fasta']
@@ -0,0 +1,128 @@
+"""This module contains utility functions to run many file transfers concurrently with retries, and to summarize
+their outcome in a machine-readable form.
+"""
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from google.api_core import exceptions as api_exceptions
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+
+
+# Number of files transferred concurrently
+TRANSFER_WORKERS = 16
+
+# Number of attempts made for each file before a transfer is reported as failed
+TRANSFER_MAX_ATTEMPTS = 5
+
+
+def is_retryable_transfer_error(error):
+    """Local file errors and client errors other than timeouts and rate limiting will not succeed on retry."""
+    if isinstance(
+        error,
+        (FileNotFoundError, IsADirectoryError, NotADirectoryError, PermissionError),
+    ):
+        return False
+    if isinstance(error, api_exceptions.ClientError):
+        return error.code in (408, 429)
+    return True
+
+
+@retry(reraise=True)
+def _attempt_transfer(transfer_fn, source, destination, attempts):
+    """Call transfer_fn once, counting each call in attempts['count']."""
+    attempts['count'] += 1
+    return transfer_fn(source, destination)
+
+
+def _run_transfer(transfer_fn, source, destination, max_attempts):
+    """Run one transfer and report the outcome instead of raising, so one failure does not abort the batch.
+
+    Args:
+        transfer_fn (function): Called as transfer_fn(source, destination), returns the number of bytes sent.
+        source (str): The source of the transfer.
+        destination (str): The destination of the transfer.
+        max_attempts (int): Maximum number of attempts.
+
+    Returns:
+        dict: The source, destination, bytes sent, seconds spent, number of attempts and error (None on success).
+    """
+    attempts = {'count': 0}
+    result = {
+        'source': source,
+        'destination': destination,
+        'bytes': 0,
+        'seconds': 0.0,
+        'attempts': 0,
+        'error': None,
+    }
+    start = time.time()
+    try:
+        result['bytes'] = _attempt_transfer.retry_with(
+            retry=retry_if_exception(is_retryable_transfer_error),
+            wait=wait_exponential(multiplier=1, max=60),
+            stop=stop_after_attempt(max_attempts),
+        )(transfer_fn, source, destination, attempts)
+    except Exception as e:
+        logging.warning(
+            'Failed to transfer {0} to {1}: {2!r}'.format(source, destination, e)
+        )
+        result['error'] = repr(e)
+    result['seconds'] = time.time() - start
+    result['attempts'] = attempts['count']
+    return result
+
+
+def run_transfers(
+    transfers,
+    transfer_fn,
+    num_workers=TRANSFER_WORKERS,
+    max_attempts=TRANSFER_MAX_ATTEMPTS,
+):
+    """Run transfers on a bounded pool of threads, retrying each one with exponential backoff.
+
+    A transfer that still fails after max_attempts is recorded in the summary rather than aborting the others,
+    so callers must check the `failed` count.
+
+    Args:
+        transfers (list): A list of (source, destination) tuples.
+        transfer_fn (function): Called as transfer_fn(source, destination), returns the number of bytes sent.
+        num_workers (int): Maximum number of transfers running concurrently.
+        max_attempts (int): Maximum number of attempts for each transfer.
+
+    Returns:
+        dict: A summary with the number of files, succeeded and failed transfers, total bytes and seconds,
+            and the per-file results under `transfers`, in the order of the input.
+    """
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        results = list(
+            executor.map(
+                lambda transfer: _run_transfer(
+                    transfer_fn, transfer[0], transfer[1], max_attempts
+                ),
+                transfers,
+            )
+        )
+
+    failed = [result for result in results if result['error']]
+    summary = {
+        'files': len(results),
+        'succeeded': len(results) - len(failed),
+        'failed': len(failed),
+        'bytes': sum(result['bytes'] for result in results),
+        'seconds': time.time() - start,
+        'transfers': results,
+    }
+    logging.info(
+        'Transferred {0} of {1} files ({2} bytes) in {3:.1f}s'.format(
+            summary['succeeded'], summary['files'], summary['bytes'], summary['seconds']
+        )
+    )
+    return summary
+
+
+def write_summary(summary, summary_file):
+    """Write a transfer summary to a JSON file."""
+    with open(summary_file, 'w') as f:
+        json.dump(summary, f, indent=2, sort_keys=True)
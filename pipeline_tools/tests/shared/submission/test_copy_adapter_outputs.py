@@ -0,0 +1,86 @@
+import json
+import pytest
+import unittest.mock as mock
+
+from pipeline_tools.shared.submission import copy_adapter_outputs
+
+
+@pytest.fixture
+def adapter_outputs(tmpdir):
+    """Write one file per output type, and the JSON lists of paths passed to copy-adapter-outputs."""
+    arguments = []
+    for argument, _ in copy_adapter_outputs.STAGING_DIRECTORIES:
+        output = tmpdir.join('outputs', '{}.json'.format(argument))
+        output.write('{}', ensure=True)
+        file_list = tmpdir.join('{}_list.json'.format(argument))
+        file_list.write(json.dumps([str(output)]))
+        arguments.extend(['--{}'.format(argument), str(file_list)])
+    return arguments
+
+
+class TestCopyAdapterOutputs(object):
+    def test_build_transfer_plan(self):
+        plan = copy_adapter_outputs.build_transfer_plan(
+            {
+                'links_jsons': ['/cromwell_root/links.json'],
+                'data_files': ['/cromwell_root/a.bam', '/cromwell_root/a.loom'],
+            },
+            'gs://bucket/staging/',
+        )
+        assert plan == [
+            ('/cromwell_root/links.json', 'gs://bucket/staging/links/links.json'),
+            ('/cromwell_root/a.bam', 'gs://bucket/staging/data/a.bam'),
+            ('/cromwell_root/a.loom', 'gs://bucket/staging/data/a.loom'),
+        ]
+
+    def test_main_stages_every_output_and_writes_summary(self, adapter_outputs, tmpdir):
+        staging = str(tmpdir.join('staging')) + '/'
+        summary_file = str(tmpdir.join('summary.json'))
+        argv = ['copy-adapter-outputs', '--staging-bucket', staging]
+        argv += ['--summary-file', summary_file] + adapter_outputs
+        with mock.patch('sys.argv', argv):
+            copy_adapter_outputs.main()
+
+        for argument, directory in copy_adapter_outputs.STAGING_DIRECTORIES:
+            staged = tmpdir.join('staging', directory, '{}.json'.format(argument))
+            assert staged.read() == '{}'
+        with open(summary_file) as f:
+            summary = json.load(f)
+        assert summary['files'] == len(copy_adapter_outputs.STAGING_DIRECTORIES)
+        assert summary['failed'] == 0
+
+    def test_main_exits_with_error_on_failed_copies(self, adapter_outputs, tmpdir):
+        tmpdir.join('outputs', 'links_jsons.json').remove()
+        staging = str(tmpdir.join('staging')) + '/'
+        summary_file = str(tmpdir.join('summary.json'))
+        argv = ['copy-adapter-outputs', '--staging-bucket', staging]
+        argv += ['--summary-file', summary_file] + adapter_outputs
+        with mock.patch('sys.argv', argv), pytest.raises(SystemExit):
+            copy_adapter_outputs.main()
+
+        with open(summary_file) as f:
+            summary = json.load(f)
+        assert summary['failed'] == 1
+        assert not tmpdir.join('staging', 'links', 'links_jsons.json').exists()
+
+    def test_main_skip_existing_reruns_only_changed_files(
+        self, adapter_outputs, tmpdir
+    ):
+        staging = str(tmpdir.join('staging')) + '/'
+        summary_file = str(tmpdir.join('summary.json'))
+        argv = ['copy-adapter-outputs', '--staging-bucket', staging]
+        argv += ['--summary-file', summary_file] + adapter_outputs
+        with mock.patch('sys.argv', argv):
+            copy_adapter_outputs.main()
+
+        tmpdir.join('outputs', 'links_jsons.json').write('{"links": []}')
+        with mock.patch('sys.argv', argv + ['--skip-existing']):
+            copy_adapter_outputs.main()
+
+        with open(summary_file) as f:
+            summary = json.load(f)
+        assert summary['skipped'] == len(copy_adapter_outputs.STAGING_DIRECTORIES) - 1
+        assert summary['succeeded'] == 1
+        assert tmpdir.join('staging', 'links', 'links_jsons.json').read() == (
+            '{"links": []}'
+        )
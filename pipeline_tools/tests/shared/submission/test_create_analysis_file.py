@@ -1,6 +1,7 @@
 import os
 import json
 import pytest
+import unittest.mock as mock
 
 import pipeline_tools.shared.submission.create_analysis_file as caf
 from pathlib import Path
@@ -64,3 +65,72 @@ class TestCreateProjectLevelAnalysisFile(object):
             desired_output = json.load(f)
 
         assert analysis_file_json == desired_output
+
+    def test_build_h5_analysis_file(self, test_data):
+        analysis_file = caf.AnalysisFile(
+            input_uuid=test_data.project_level_input_uuid,
+            input_file='hca_adapter_testing/hca_adapter_test/hca_adapter_testing.h5',
+            pipeline_type=test_data.project_level_pipeline_type,
+            workspace_version=test_data.workspace_version,
+            project_level=test_data.project_level
+        )
+        outputs = analysis_file.get_outputs_json()
+
+        assert len(outputs) == 1
+        file_core = outputs[0]['file_core']
+        assert file_core['file_name'] == 'hca_adapter_testing.h5'
+        assert file_core['format'] == 'h5'
+        assert file_core['content_description'] == [caf.AnalysisFile.LOOM_CONTENT_DESCRIPTION]
+        assert outputs[0]['provenance']['document_id'] == caf.format_map.get_file_entity_id(
+            test_data.project_level_input_uuid, 'analysis_file', '.h5'
+        )
+
+
+class TestSS2AnalysisFileBatch(object):
+    def test_build_ss2_analysis_files(self, test_data):
+        analysis_files = caf.build_ss2_analysis_files(
+            ["uuid-1", "uuid-2"],
+            ["/cromwell_root/cell_1.bam", "/cromwell_root/cell_2.bam"],
+            ["/cromwell_root/cell_1.bai", "/cromwell_root/cell_2.bai"],
+            test_data.workspace_version
+        )
+
+        assert [analysis_file.uuid for analysis_file in analysis_files] == ["uuid-1", "uuid-2"]
+        outputs = analysis_files[1].get_outputs_json()
+        assert [output["file_core"]["file_name"] for output in outputs] == ["cell_2.bam", "cell_2.bai"]
+        single = caf.AnalysisFile(
+            "uuid-2", None, "ss2", test_data.workspace_version, False,
+            "/cromwell_root/cell_2.bam", "/cromwell_root/cell_2.bai"
+        )
+        assert outputs == single.get_outputs_json()
+
+    def test_build_ss2_analysis_files_rejects_mismatched_lists(self, test_data):
+        with pytest.raises(ValueError):
+            caf.build_ss2_analysis_files(["uuid-1", "uuid-2"], ["a.bam"], ["a.bai"], test_data.workspace_version)
+
+    def test_main_writes_every_analysis_file(self, test_data, tmpdir):
+        lists = {
+            "input_uuids": ["uuid-1", "uuid-2", "uuid-3"],
+            "ss2_bam_files": [f"/cromwell_root/cell_{n}.bam" for n in range(1, 4)],
+            "ss2_bai_files": [f"/cromwell_root/cell_{n}.bai" for n in range(1, 4)],
+        }
+        args = [
+            "create-analysis-file",
+            "--pipeline_type", "SS2",
+            "--workspace_version", test_data.workspace_version,
+            "--project_level", "false",
+        ]
+        for argument, values in lists.items():
+            tmpdir.join(f"{argument}.json").write(json.dumps(values))
+            args += [f"--{argument}", str(tmpdir.join(f"{argument}.json"))]
+
+        with tmpdir.as_cwd(), mock.patch("sys.argv", args):
+            caf.main()
+
+        outputs = json.loads(tmpdir.join("outputs.json").read())
+        assert [output["file_core"]["file_name"] for output in outputs] == [
+            "cell_1.bam", "cell_1.bai", "cell_2.bam", "cell_2.bai", "cell_3.bam", "cell_3.bai"
+        ]
+        for output in outputs:
+            written = tmpdir.join(f"{output['provenance']['document_id']}_{test_data.workspace_version}.json")
+            assert json.loads(written.read()) == output
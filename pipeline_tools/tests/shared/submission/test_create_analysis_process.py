@@ -1,5 +1,7 @@
+import json
 import os
 import pytest
+import unittest.mock as mock
 from pathlib import Path
 
 import pipeline_tools.shared.submission.create_analysis_process as cap
@@ -365,3 +367,118 @@ class TestCreateProjectLevelAnalysisProcess(object):
         }
         assert analysis_process.get("inputs") == []
         assert analysis_process.get("tasks") == []
+
+
+def make_ss2_shard(index):
+    return {
+        "subWorkflowId": f"0000000{index}-aaaa-bbbb-cccc-dddddddddddd",
+        "start": "2021-07-08T16:08:06.619Z",
+        "end": f"2021-07-08T17:2{index}:57.332Z",
+        "inputs": {"fastq1": f"gs://bucket/sample_{index}_R1.fastq.gz"},
+    }
+
+
+@pytest.fixture
+def ss2_metadata_file(tmpdir):
+    metadata = {
+        "calls": {
+            "MultiSampleSmartSeq2.AggregateLoom": [
+                {
+                    "start": "2021-07-08T17:30:00.000Z",
+                    "end": "2021-07-08T17:40:00.000Z",
+                    "stdout": "gs://bucket/MultiSampleSmartSeq2/11111111-2222-3333-4444-555555555555/call-AggregateLoom/stdout",
+                }
+            ],
+            "MultiSampleSmartSeq2.sc_pe": [make_ss2_shard(index) for index in range(3)],
+        }
+    }
+    path = tmpdir.join("metadata.json")
+    path.write(json.dumps(metadata))
+    return str(path)
+
+
+class TestAnalysisProcessMetadata(object):
+    def test_metadata_is_parsed_once(self, ss2_metadata_file):
+        cap._workflow_metadata_cache.clear()
+        with mock.patch.object(
+            cap.format_map, "get_workflow_metadata", wraps=cap.format_map.get_workflow_metadata
+        ) as get_workflow_metadata:
+            analysis_process = cap.AnalysisProcess(
+                "uuid", ss2_metadata_file, "SS2", "2021-05-24T12:00:00.000000Z", [], False, 2
+            )
+            analysis_process_json = analysis_process.get_json()
+            same_file_process = cap.AnalysisProcess(
+                "uuid", ss2_metadata_file, "SS2", "2021-05-24T12:00:00.000000Z", [], False, 2
+            )
+            same_file_process.get_json()
+
+        assert get_workflow_metadata.call_count == 1
+        assert analysis_process_json["process_core"] == {
+            "process_id": "00000002-aaaa-bbbb-cccc-dddddddddddd"
+        }
+        assert analysis_process_json["timestamp_stop_utc"] == "2021-07-08T17:22:57.332Z"
+
+    def test_project_level_reads_aggregate_loom_call(self, ss2_metadata_file):
+        analysis_process = cap.AnalysisProcess(
+            "uuid", ss2_metadata_file, "SS2", "2021-05-24T12:00:00.000000Z", [], True
+        )
+        assert analysis_process.process_id == "11111111-2222-3333-4444-555555555555"
+        assert analysis_process.get_json()["timestamp_start_utc"] == "2021-07-08T17:30:00.000Z"
+
+    def test_modified_file_is_parsed_again(self, ss2_metadata_file):
+        first = cap.load_workflow_metadata(ss2_metadata_file)
+        with open(ss2_metadata_file, "w") as f:
+            json.dump({"calls": {}, "id": "changed"}, f)
+        assert cap.load_workflow_metadata(ss2_metadata_file) is not first
+        assert cap.load_workflow_metadata(ss2_metadata_file)["id"] == "changed"
+
+
+class TestSS2AllShards(object):
+    @pytest.mark.parametrize("num_workers", [1, 2])
+    def test_writes_every_shard_from_one_parse(self, ss2_metadata_file, tmpdir, num_workers):
+        cap._workflow_metadata_cache.clear()
+        output_dir = tmpdir.mkdir("analysis_process")
+        get_metadata = cap.format_map.get_workflow_metadata
+
+        def get_metadata_once(input_file, paths=None):
+            # Worker processes cannot see this mock, but any of them parsing the file again would fail
+            metadata = get_metadata(input_file, paths)
+            os.remove(input_file)
+            return metadata
+
+        with mock.patch.object(
+            cap.format_map, "get_workflow_metadata", side_effect=get_metadata_once
+        ) as get_workflow_metadata:
+            manifest = cap.write_ss2_analysis_processes(
+                "uuid", ss2_metadata_file, "2021-05-24T12:00:00.000000Z", [], str(output_dir), num_workers
+            )
+
+        assert get_workflow_metadata.call_count == 1
+        assert [entry["ss2_index"] for entry in manifest] == [0, 1, 2]
+        for index, entry in enumerate(manifest):
+            with open(entry["file"]) as f:
+                analysis_process_json = json.load(f)
+            assert entry["process_id"] == f"0000000{index}-aaaa-bbbb-cccc-dddddddddddd"
+            assert analysis_process_json["process_core"] == {"process_id": entry["process_id"]}
+            assert analysis_process_json["timestamp_stop_utc"] == f"2021-07-08T17:2{index}:57.332Z"
+            assert os.path.basename(entry["file"]) == f"{entry['process_id']}_2021-05-24T12:00:00.000000Z.json"
+
+    def test_main_writes_manifest(self, ss2_metadata_file, tmpdir):
+        manifest_file = tmpdir.join("manifest.json")
+        args = [
+            "create-analysis-process",
+            "--pipeline_type", "SS2",
+            "--workspace_version", "2021-05-24T12:00:00.000000Z",
+            "--input_uuid", "uuid",
+            "--input_file", ss2_metadata_file,
+            "--project_level", "false",
+            "--ss2_all_shards",
+            "--num_workers", "1",
+            "--manifest_file", str(manifest_file),
+        ]
+        with tmpdir.as_cwd(), mock.patch("sys.argv", args):
+            cap.main()
+
+        manifest = json.loads(manifest_file.read())
+        assert len(manifest) == 3
+        assert all(tmpdir.join(entry["file"]).check() for entry in manifest)
@@ -1,7 +1,10 @@
+import json
 import os
 import pytest
+import unittest.mock as mock
 
 import pipeline_tools.shared.submission.create_file_descriptor as cfd
+from pipeline_tools.shared import checksum_utils
 from pathlib import Path
 
 
@@ -58,3 +61,124 @@ class TestCreateDescriptor(object):
         assert file_descriptor.get('file_id') == '2beee6e4-7e7d-52b9-9180-fc052cb7791d'
         assert file_descriptor.get('file_version') == '2021-07-14T16:01:45.000000Z'
         assert file_descriptor.get('file_name') == 'path.fasta'
+
+    def test_build_file_descriptor_computes_missing_checksums(self, test_data, tmpdir):
+        file_path = tmpdir.join('path.fasta')
+        file_path.write('123456789')
+        file_descriptor = cfd.test_build_file_descriptor(
+            size=None,
+            sha256=None,
+            crc32c=None,
+            input_uuid=test_data.input_uuid,
+            file_path=str(file_path),
+            pipeline_type=test_data.pipeline_type,
+            creation_time=test_data.creation_time,
+            workspace_version=test_data.workspace_version
+        )
+
+        assert file_descriptor.get('size') == 9
+        assert (
+            file_descriptor.get('sha256')
+            == '15e2b0d3c33891ebb0f1ef609ec419420c20e320ce94c65fbc8c3312448eb225'
+        )
+        assert file_descriptor.get('crc32c') == 'e3069283'
+        assert file_descriptor.get('file_id') == '2beee6e4-7e7d-52b9-9180-fc052cb7791d'
+
+
+@pytest.fixture
+def manifest_files(tmpdir, test_data):
+    tmpdir.join('a.bam').write('123456789')
+    tmpdir.join('b.loom').write('loom content')
+    rows = [
+        {
+            'file_path': str(tmpdir.join('a.bam')),
+            'size': 9,
+            'sha256': test_data.sha256,
+            'crc32c': 'e3069283',
+            'input_uuid': 'uuid-a',
+            'creation_time': test_data.creation_time,
+        },
+        {
+            'file_path': str(tmpdir.join('b.loom')),
+            'input_uuid': 'uuid-b',
+            'creation_time': test_data.creation_time,
+        },
+    ]
+    return tmpdir, rows
+
+
+class TestDescriptorManifest(object):
+    def test_read_manifest_jsonl(self, manifest_files):
+        tmpdir, rows = manifest_files
+        manifest = tmpdir.join('manifest.jsonl')
+        manifest.write(''.join(json.dumps(row) + '\n' for row in rows))
+
+        entries = cfd.read_manifest(str(manifest))
+
+        assert entries[0] == rows[0]
+        assert entries[1]['size'] is None
+        assert entries[1]['sha256'] is None
+        assert entries[1]['input_uuid'] == 'uuid-b'
+
+    def test_read_manifest_tsv(self, manifest_files):
+        tmpdir, rows = manifest_files
+        manifest = tmpdir.join('manifest.tsv')
+        lines = ['\t'.join(cfd.MANIFEST_FIELDS)]
+        for row in rows:
+            lines.append('\t'.join(str(row.get(field, '')) for field in cfd.MANIFEST_FIELDS))
+        manifest.write('\n'.join(lines) + '\n')
+
+        entries = cfd.read_manifest(str(manifest))
+        assert entries[0] == rows[0]
+        assert entries[1]['crc32c'] is None
+
+    @pytest.mark.parametrize('extension', ['jsonl', 'tsv'])
+    def test_read_manifest_keeps_empty_file_size(self, tmpdir, extension):
+        row = {'file_path': 'empty.txt', 'size': 0, 'sha256': 'e3b0c442', 'crc32c': '00000000'}
+        manifest = tmpdir.join('manifest.' + extension)
+        if extension == 'tsv':
+            manifest.write('\t'.join(row) + '\n' + '\t'.join(str(value) for value in row.values()) + '\n')
+        else:
+            manifest.write(json.dumps(row) + '\n')
+
+        entries = cfd.read_manifest(str(manifest))
+        assert entries[0]['size'] == 0
+        assert entries[0]['input_uuid'] is None
+
+    def test_build_descriptors_computes_missing_checksums(self, manifest_files, test_data):
+        _, rows = manifest_files
+        entries = [{field: row.get(field) for field in cfd.MANIFEST_FIELDS} for row in rows]
+
+        descriptors = cfd.build_descriptors(
+            entries, test_data.pipeline_type, test_data.workspace_version, num_workers=2
+        )
+
+        assert descriptors[0].sha256 == test_data.sha256
+        assert descriptors[1].size == len('loom content')
+        assert descriptors[1].crc32c == checksum_utils.compute_checksums(rows[1]['file_path'])['crc32c']
+
+    def test_build_descriptors_rejects_remote_files_without_checksums(self, test_data):
+        entry = {field: None for field in cfd.MANIFEST_FIELDS}
+        entry.update(file_path='gs://bucket/outputs/a.loom', size=12, crc32c='0b8ea5a6')
+
+        with pytest.raises(ValueError, match='gs://bucket/outputs/a.loom'):
+            cfd.build_descriptors([entry], test_data.pipeline_type, test_data.workspace_version, num_workers=1)
+
+    def test_main_writes_every_descriptor(self, manifest_files, test_data):
+        tmpdir, rows = manifest_files
+        manifest = tmpdir.join('manifest.jsonl')
+        manifest.write(''.join(json.dumps(row) + '\n' for row in rows))
+        output_dir = tmpdir.join('descriptors')
+        args = [
+            'create-file-descriptor',
+            '--manifest', str(manifest),
+            '--pipeline_type', test_data.pipeline_type,
+            '--workspace_version', test_data.workspace_version,
+            '--output_dir', str(output_dir),
+            '--num_workers', '1',
+        ]
+        with mock.patch('sys.argv', args):
+            cfd.main()
+
+        written = [json.loads(f.read()) for f in sorted(output_dir.listdir())]
+        assert sorted(d['file_name'] for d in written) == ['a.bam', 'b.loom']
@@ -1,9 +1,11 @@
 import os
 import json
 import pytest
+import unittest.mock as mock
 from pathlib import Path
 
 import pipeline_tools.shared.submission.create_links as cl
+from pipeline_tools.shared.submission import format_map
 
 
 @pytest.fixture(scope='module')
@@ -65,3 +67,170 @@ class TestCreateProjectLevelLinks(object):
             desired_output = json.load(f)
 
         assert links_file_json == desired_output
+
+
+@pytest.fixture
+def ss2_links_file(tmpdir):
+    def _ss2_links_file(num_samples, paired_end=True, links_per_shard=None):
+        input_uuids = [f'input-{index}' for index in range(num_samples)]
+        process_ids = [f'{index:08d}-0000-4000-8000-000000000000' for index in range(num_samples)]
+        lists = {
+            'input_uuids': input_uuids,
+            'ss2_bam': [f'{uuid}.bam' for uuid in input_uuids],
+            'ss2_bai': [f'{uuid}.bam.bai' for uuid in input_uuids],
+            'ss2_fastq1': [f'{uuid}-fastq1' for uuid in input_uuids],
+            'ss2_fastq2': [f'{uuid}-fastq2' for uuid in input_uuids] if paired_end else [''],
+            'process_list': [f'analysis_process/{process_id}_2021-05-24T12:00:00.000000Z.json' for process_id in process_ids],
+            'protocol_list': ['analysis_protocol/f2cdb4e5-b439-5cdf-ac41-161ff39d5790_2021-05-24T12:00:00.000000Z.json'] * num_samples,
+            'outputs': [{
+                'describedBy': 'https://schema.humancellatlas.org/type/file/6.2.0/analysis_file',
+                'provenance': {'document_id': 'a13d652a-468a-541c-bb03-8fb521421fbd'}
+            }],
+        }
+        paths = {}
+        for name, value in lists.items():
+            paths[name] = str(tmpdir.join(f'{name}.json'))
+            with open(paths[name], 'w') as f:
+                json.dump(value, f)
+
+        return cl.LinksFile(
+            project_id='16ed4ad8-7319-46b2-8859-6fe1c1d73a82',
+            pipeline_type='SS2',
+            file_name_string='project=16ed4ad8-7319-46b2-8859-6fe1c1d73a82',
+            workspace_version='2021-05-24T12:00:00.000000Z',
+            output_file_path=paths['outputs'],
+            analysis_process_path='analysis_process/7f6c3249-2d24-407d-966f-411d84fbeba8_2021-05-24T12:00:00.000000Z.json',
+            analysis_protocol_path='analysis_protocol/432a7422-59b5-5c46-8983-a7953f196781_2021-05-24T12:00:00.000000Z.json',
+            input_uuids_path=paths['input_uuids'],
+            analysis_process_list_path=paths['process_list'],
+            analysis_protocol_list_path=paths['protocol_list'],
+            ss2_bam=paths['ss2_bam'],
+            ss2_bai=paths['ss2_bai'],
+            ss2_fastq1=paths['ss2_fastq1'],
+            ss2_fastq2=paths['ss2_fastq2'],
+            project_level=True,
+            links_per_shard=links_per_shard
+        )
+
+    return _ss2_links_file
+
+
+class TestCreateSS2Links(object):
+    def test_build_ss2_links(self, ss2_links_file):
+        links = ss2_links_file(3).get_json()['links']
+
+        assert len(links) == 4
+        bam_hash = format_map.get_file_entity_id('input-1', 'analysis_file', '.bam')
+        bai_hash = format_map.get_file_entity_id('input-1', 'analysis_file', '.bai')
+        assert links[1]['process_id'] == '00000001-0000-4000-8000-000000000000'
+        assert links[1]['protocols'][0]['protocol_id'] == 'f2cdb4e5-b439-5cdf-ac41-161ff39d5790'
+        assert [i['input_id'] for i in links[1]['inputs']] == ['input-1-fastq1', 'input-1-fastq2']
+        assert [o['output_id'] for o in links[1]['outputs']] == [bam_hash, bai_hash]
+
+        project_link = links[-1]
+        assert project_link['process_id'] == '7f6c3249-2d24-407d-966f-411d84fbeba8'
+        assert project_link['protocols'][0]['protocol_id'] == '432a7422-59b5-5c46-8983-a7953f196781'
+        assert len(project_link['inputs']) == 6
+        assert project_link['inputs'][1]['input_id'] == bam_hash
+        assert project_link['inputs'][4]['input_id'] == bai_hash
+
+    def test_build_ss2_links_single_end(self, ss2_links_file):
+        links = ss2_links_file(2, paired_end=False).get_json()['links']
+        assert [i['input_id'] for i in links[0]['inputs']] == ['input-0-fastq1']
+
+    def test_ss2_file_hashes_are_computed_once(self, ss2_links_file):
+        with mock.patch.object(format_map, 'get_file_entity_id', wraps=format_map.get_file_entity_id) as get_id:
+            ss2_links_file(10).get_json()
+        assert get_id.call_count == 20
+
+
+class TestWriteLinksJson(object):
+    @pytest.mark.parametrize('num_samples', [0, 1, 5])
+    def test_write_ss2_json_matches_json_dump(self, ss2_links_file, tmpdir, num_samples):
+        links_file = ss2_links_file(num_samples)
+        streamed = tmpdir.join('streamed.json')
+        with open(str(streamed), 'w') as f:
+            links_file.write_json(f)
+
+        assert streamed.read() == json.dumps(links_file.get_json(), indent=2, sort_keys=True)
+
+    def test_write_optimus_json_matches_json_dump(self, test_data, tmpdir):
+        outputs = tmpdir.join('outputs.json')
+        outputs.write(json.dumps([{
+            'describedBy': 'https://schema.humancellatlas.org/type/file/6.2.0/analysis_file',
+            'provenance': {'document_id': '87795ce9-03ce-51f3-b8d8-4ad6f8931fe0'}
+        }]))
+        links_file = cl.LinksFile(
+            project_id=test_data.project_id,
+            pipeline_type='Optimus',
+            file_name_string=test_data.file_name_string,
+            workspace_version=test_data.workspace_version,
+            output_file_path=str(outputs),
+            input_uuids=test_data.input_uuids,
+            analysis_process_path=test_data.analysis_process_path,
+            analysis_protocol_path=test_data.analysis_protocol_path
+        )
+        streamed = tmpdir.join('streamed.json')
+        with open(str(streamed), 'w') as f:
+            links_file.write_json(f)
+
+        assert streamed.read() == json.dumps(links_file.get_json(), indent=2, sort_keys=True)
+
+
+class TestShardedLinks(object):
+    def test_small_project_is_not_sharded(self, ss2_links_file):
+        links_file = ss2_links_file(3, links_per_shard=4)
+        assert links_file.shard_count == 1
+        assert links_file.shard_uuid(0) == links_file.uuid
+
+    @pytest.mark.parametrize('links_per_shard', [0, 1, -3])
+    def test_rejects_shards_too_small_for_a_sample(self, ss2_links_file, links_per_shard):
+        with pytest.raises(ValueError):
+            ss2_links_file(10, links_per_shard=links_per_shard)
+
+    @pytest.mark.parametrize('paired_end', [True, False])
+    def test_shards_partition_the_links(self, ss2_links_file, paired_end):
+        links_file = ss2_links_file(10, paired_end=paired_end, links_per_shard=4)
+        assert links_file.shard_count == 4
+
+        shards = [list(links_file.iter_links(shard_index)) for shard_index in range(4)]
+        assert [len(shard) for shard in shards] == [4, 4, 4, 2]
+        links = links_file.get_json()['links']
+        assert [link for shard in shards for link in shard[:-1]] == links[:-1]
+
+        # Every shard ends with the part of the project link listing the bam and bai files of its samples
+        project_link = links[-1]
+        shard_inputs = []
+        for shard in shards:
+            assert dict(shard[-1], inputs=None) == dict(project_link, inputs=None)
+            assert len(shard[-1]['inputs']) == 2 * (len(shard) - 1)
+            shard_inputs.extend(shard[-1]['inputs'])
+        assert sorted(shard_inputs, key=json.dumps) == sorted(project_link['inputs'], key=json.dumps)
+
+    def test_shard_only_holds_its_samples(self, ss2_links_file):
+        links_file = ss2_links_file(10, links_per_shard=4)
+        links_shard = links_file.shard(3)
+
+        assert links_shard.input_uuids == ['input-9']
+        assert links_shard.bam_hashes == links_file.bam_hashes[9:]
+        assert links_shard.shard_count == 1
+        assert links_shard.uuid == links_file.shard_uuid(3)
+        assert links_file.input_uuids == [f'input-{index}' for index in range(10)]
+
+    def test_shard_uuids_are_deterministic(self, ss2_links_file):
+        uuids = [ss2_links_file(10, links_per_shard=4).shard_uuid(shard_index) for shard_index in range(4)]
+        assert len(set(uuids)) == 4
+        assert uuids[1] == format_map.get_uuid5('project=16ed4ad8-7319-46b2-8859-6fe1c1d73a82;shard=1')
+        assert uuids == [ss2_links_file(10, links_per_shard=4).shard_uuid(shard_index) for shard_index in range(4)]
+
+    @pytest.mark.parametrize('num_workers', [1, 2])
+    def test_write_links_files(self, ss2_links_file, tmpdir, num_workers):
+        links_file = ss2_links_file(10, links_per_shard=4)
+        paths = cl.write_links_files(links_file, output_dir=str(tmpdir), num_workers=num_workers)
+
+        assert [os.path.basename(path) for path in paths] == [links_file.shard_file_name(n) for n in range(4)]
+        for shard_index, path in enumerate(paths):
+            with open(path) as f:
+                document = json.load(f)
+            assert document['schema_type'] == 'links'
+            assert document['links'] == list(links_file.iter_links(shard_index))
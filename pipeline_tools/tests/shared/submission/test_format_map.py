@@ -0,0 +1,242 @@
+import arrow
+import mimetypes
+import pytest
+import re
+import sys
+
+from pipeline_tools.shared.submission import format_map
+
+
+def scan_file_format(path):
+    """The original scan of EXTENSION_TO_FORMAT, which the suffix index must agree with"""
+    for ext in format_map.EXTENSION_TO_FORMAT:
+        if re.search(ext, path):
+            return format_map.EXTENSION_TO_FORMAT[ext]
+    return 'unknown'
+
+
+class TestClassify(object):
+    @pytest.mark.parametrize(
+        'path',
+        [
+            'gs://bucket/outputs/sample.bam',
+            'sample.bam.bai',
+            'heart_1k_test_v2_S1_L001.loom',
+            'sample_metrics',
+            'sample.metrics',
+            'GRCh38.primary_assembly.genome.fa',
+            'reads.csv.gz',
+            'reads.csv',
+            'matrix.zarr/expression/0.0',
+            'matrix.zarr/.zattrs.txt',
+            'matrix.zarr/cell_id.npy',
+            'sample.bam\n',
+            'sample.bam.tmp',
+            'no_extension',
+        ],
+    )
+    def test_get_file_format_matches_pattern_scan(self, path):
+        assert format_map.get_file_format(path) == scan_file_format(path)
+
+    @pytest.mark.parametrize(
+        'path, content_type',
+        [
+            ('gs://bucket/a.loom', 'application/vnd.loom'),
+            ('a.bam', 'application/octet-stream'),
+            ('a.bam.bai', 'application/octet-stream'),
+            ('ref.fa', 'application/octet-stream'),
+            ('ref.fasta', 'application/octet-stream'),
+            ('merged.h5', 'application/x-hdf5'),
+            ('summary.txt', 'text/plain'),
+            ('report.pdf', 'application/pdf'),
+            ('barcodes.tsv', 'text/tab-separated-values'),
+            ('reads.csv', 'text/csv'),
+            ('reads.csv.gz', 'text/csv'),
+        ],
+    )
+    def test_classify_keeps_descriptor_content_types(self, path, content_type):
+        assert format_map.classify(path)[2] == content_type
+
+    @pytest.mark.parametrize(
+        'path',
+        [
+            'a.loom',
+            'a.xml',
+            'README.md',
+            'sample.log',
+            'matrix.mtx',
+            'cells.npy',
+            'sample.v2.loom',
+        ],
+    )
+    def test_classify_mime_type_matches_mimetypes(self, path):
+        """Content types must not depend on the lookup going through the suffix cache"""
+        assert (
+            format_map.classify('gs://bucket/' + path)[2]
+            == mimetypes.guess_type(path)[0]
+        )
+
+    def test_classify_returns_format_entity_type_and_mime_type(self):
+        assert format_map.classify('gs://bucket/a.loom') == (
+            'loom',
+            'analysis_file',
+            'application/vnd.loom',
+        )
+        assert format_map.classify('a.bai') == (
+            'bai',
+            'analysis_file',
+            'application/octet-stream',
+        )
+        assert format_map.classify('ref.fasta') == (
+            'fasta',
+            'reference_file',
+            'application/octet-stream',
+        )
+        assert format_map.classify('merged.h5') == (
+            'h5',
+            'analysis_file',
+            'application/x-hdf5',
+        )
+        assert format_map.classify('a.csv.gz') == ('csv.gz', 'unknown', 'text/csv')
+        assert format_map.classify('dir.d/no_extension') == ('unknown', 'unknown', None)
+
+    def test_get_file_format_warns_on_unknown_format(self, capsys):
+        assert format_map.get_file_format('a.unknown') == 'unknown'
+        assert format_map.get_entity_type('a.unknown') == 'unknown'
+        assert capsys.readouterr().out.count('Warning: no known format') == 2
+
+    def test_classify_paths_preserves_order(self):
+        paths = ['a.bam', 'b.loom', 'a.bam', 'ref.fa']
+        assert format_map.classify_paths(paths) == [
+            format_map.classify(path) for path in paths
+        ]
+
+    def test_build_format_index_keeps_regexes_and_priorities(self):
+        suffixes, substrings, regexes = format_map.build_format_index(
+            {
+                '[.]bam$': 'bam',
+                '[.]zarr': 'matrix',
+                r'\d+[.]txt$': 'numbered',
+                '[.]txt$': 'txt',
+            }
+        )
+        assert suffixes == {'.bam': (0, 'bam'), '.txt': (3, 'txt')}
+        assert substrings == [(1, '.zarr', 'matrix')]
+        assert [(priority, file_format) for priority, _, file_format in regexes] == [
+            (2, 'numbered')
+        ]
+
+
+class TestFormatTimestamp(object):
+    @pytest.mark.parametrize(
+        'timestamp',
+        [
+            '2021-07-14T16:01:45.123Z',
+            '2021-07-14T16:01:45.1239Z',
+            '2021-07-14T16:01:45.1Z',
+            '2021-07-14T16:01:45Z',
+            '2021-07-14T16:01:45.5-04:00',
+            '2021-07-14T16:01:45+0530',
+            '2021-07-14T16:01:45',
+            '2020-02-29T23:59:59.999999Z',
+            '2021-07-14T16:01:45.9999996Z',
+            '2021-07-14 16:01:45.12Z',
+            '2021-07-14T24:00:00Z',
+            '2021-07-14',
+        ],
+    )
+    def test_format_timestamp_matches_arrow(self, timestamp):
+        expected = '{}Z'.format(arrow.get(timestamp).format('YYYY-MM-DDTHH:mm:ss.SSS'))
+        assert format_map.format_timestamp(timestamp) == expected
+
+    def test_format_timestamp_rejects_invalid_dates_like_arrow(self):
+        with pytest.raises(ValueError):
+            format_map.format_timestamp('2021-02-30T16:01:45.123Z')
+
+
+def make_call(shard_index=-1, attempt=1, sub_workflow_calls=None):
+    if sub_workflow_calls is not None:
+        return {
+            'shardIndex': shard_index,
+            'attempt': attempt,
+            'subWorkflowMetadata': {'calls': sub_workflow_calls},
+        }
+    return {
+        'shardIndex': shard_index,
+        'attempt': attempt,
+        'runtimeAttributes': {
+            'cpu': '1',
+            'memory': '1 GB',
+            'disks': 'local-disk 10 HDD',
+            'docker': 'image',
+            'zones': 'us-central1-b',
+        },
+        'start': '2021-07-14T16:01:45.123Z',
+        'end': '2021-07-14T16:02:45.123Z',
+        'stdout': 'stdout',
+        'stderr': 'stderr',
+    }
+
+
+@pytest.fixture
+def scattered_metadata():
+    return {
+        'calls': {
+            'wf.zeta': [make_call()],
+            'wf.scatter': [
+                make_call(0, sub_workflow_calls={'sub.align': [make_call()]}),
+                make_call(1, sub_workflow_calls={'sub.align': [make_call()]}),
+            ],
+            'wf.alpha': [
+                make_call(0),
+                make_call(1, attempt=1),
+                make_call(1, attempt=2),
+            ],
+        }
+    }
+
+
+class TestWorkflowTasks(object):
+    def test_get_workflow_tasks_describes_first_shards(self, scattered_metadata):
+        tasks = format_map.get_workflow_tasks(scattered_metadata)
+        assert [task['task_name'] for task in tasks] == ['align', 'alpha', 'zeta']
+        assert 'shard_index' not in tasks[0]
+        assert tasks[0]['start_time'] == '2021-07-14T16:01:45.123Z'
+
+    def test_iter_workflow_tasks_walks_every_shard_and_attempt(
+        self, scattered_metadata
+    ):
+        tasks = format_map.iter_workflow_tasks(scattered_metadata)
+        assert [
+            (task['task_name'], task['shard_index'], task['attempt']) for task in tasks
+        ] == [
+            ('zeta', -1, 1),
+            ('align', 0, 1),
+            ('align', 1, 1),
+            ('alpha', 0, 1),
+            ('alpha', 1, 1),
+            ('alpha', 1, 2),
+        ]
+
+    def test_iter_sorted_workflow_tasks_keeps_workflow_order_of_ties(
+        self, scattered_metadata
+    ):
+        tasks = format_map.iter_sorted_workflow_tasks(scattered_metadata)
+        assert [(task['task_name'], task['shard_index']) for task in tasks] == [
+            ('align', 0),
+            ('align', 1),
+            ('alpha', 0),
+            ('alpha', 1),
+            ('alpha', 1),
+            ('zeta', -1),
+        ]
+
+    def test_iter_workflow_tasks_is_not_limited_by_recursion(self):
+        depth = sys.getrecursionlimit() + 100
+        metadata = {'calls': {'leaf.task': [make_call()]}}
+        for _ in range(depth):
+            metadata = {
+                'calls': {'wf.sub': [make_call(sub_workflow_calls=metadata['calls'])]}
+            }
+        tasks = list(format_map.iter_workflow_tasks(metadata))
+        assert [task['task_name'] for task in tasks] == ['task']
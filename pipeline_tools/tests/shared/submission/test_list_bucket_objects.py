@@ -0,0 +1,118 @@
+import json
+import pytest
+import unittest.mock as mock
+
+import pipeline_tools.shared.submission.create_file_descriptor as cfd
+import pipeline_tools.shared.submission.list_bucket_objects as lbo
+from pipeline_tools.shared import checksum_utils
+
+
+@pytest.fixture(scope='module')
+def test_data():
+    class Data:
+        prefix = 'gs://bucket/outputs/'
+        input_uuid = 'heart_1k_test_v2_S1_L001'
+        records = {
+            'gs://bucket/outputs/': {
+                'name': 'gs://bucket/outputs/',
+                'size': 0,
+                'crc32c': 'AAAAAA==',
+                'md5_hash': None,
+                'content_type': None,
+                'time_created': '2021-07-08T17:20:00.000000+00:00',
+            },
+            'gs://bucket/outputs/b.loom': {
+                'name': 'gs://bucket/outputs/b.loom',
+                'size': 12,
+                'crc32c': checksum_utils.crc32c_to_base64(0xE598A0F6),
+                'md5_hash': None,
+                'content_type': 'application/vnd.loom',
+                'time_created': '2021-07-08T19:22:45+02:00',
+            },
+            'gs://bucket/outputs/a.bam': {
+                'name': 'gs://bucket/outputs/a.bam',
+                'size': 9,
+                'crc32c': checksum_utils.crc32c_to_base64(0xE3069283),
+                'md5_hash': 'JfnnlDI7RTiF9RgfG2JNCw==',
+                'content_type': 'application/octet-stream',
+                'time_created': '2021-07-08T17:22:45.123456+00:00',
+            },
+        }
+
+    return Data
+
+
+class TestListBucketObjects(object):
+    def test_format_creation_time_matches_bucket_date(self):
+        assert (
+            lbo.format_creation_time('2021-07-08T17:22:45.123456+00:00')
+            == '2021-07-08T17:22:45.000000Z'
+        )
+        assert (
+            lbo.format_creation_time('2021-07-08T19:22:45+02:00')
+            == '2021-07-08T17:22:45.000000Z'
+        )
+
+    def test_build_manifest(self, test_data):
+        manifest = lbo.build_manifest(
+            test_data.records, test_data.prefix, test_data.input_uuid
+        )
+        assert manifest == [
+            {
+                'file_path': 'gs://bucket/outputs/a.bam',
+                'size': 9,
+                'crc32c': 'e3069283',
+                'md5': '25f9e794323b453885f5181f1b624d0b',
+                'content_type': 'application/octet-stream',
+                'creation_time': '2021-07-08T17:22:45.000000Z',
+                'input_uuid': test_data.input_uuid,
+            },
+            {
+                'file_path': 'gs://bucket/outputs/b.loom',
+                'size': 12,
+                'crc32c': 'e598a0f6',
+                'md5': None,
+                'content_type': 'application/vnd.loom',
+                'creation_time': '2021-07-08T17:22:45.000000Z',
+                'input_uuid': test_data.input_uuid,
+            },
+        ]
+
+    def test_local_dir_replaces_prefix(self, test_data):
+        manifest = lbo.build_manifest(
+            test_data.records, test_data.prefix, local_dir='/cromwell_root/outputs'
+        )
+        assert [entry['file_path'] for entry in manifest] == [
+            '/cromwell_root/outputs/a.bam',
+            '/cromwell_root/outputs/b.loom',
+        ]
+        assert 'input_uuid' not in manifest[0]
+
+    def test_main_writes_descriptor_manifest(self, test_data, tmpdir):
+        output = tmpdir.join('manifest.jsonl')
+        args = [
+            'list-bucket-objects',
+            '--prefix',
+            test_data.prefix,
+            '--input_uuid',
+            test_data.input_uuid,
+            '--local_dir',
+            '/cromwell_root/outputs',
+            '--output',
+            str(output),
+        ]
+        backend = mock.Mock()
+        backend.list.return_value = test_data.records
+        with mock.patch('sys.argv', args), mock.patch.object(
+            lbo.storage_backends, 'get_storage_backend', return_value=backend
+        ):
+            lbo.main()
+
+        backend.list.assert_called_once_with(test_data.prefix)
+        lines = [json.loads(line) for line in output.read().splitlines()]
+        assert [line['size'] for line in lines] == [9, 12]
+        entries = cfd.read_manifest(str(output))
+        assert entries[0]['file_path'].startswith('/cromwell_root/outputs/')
+        assert entries[0]['crc32c'] == 'e3069283'
+        assert entries[0]['sha256'] is None
+        assert entries[1]['creation_time'] == '2021-07-08T17:22:45.000000Z'
@@ -0,0 +1,404 @@
+import h5py
+import loompy
+import numpy as np
+import pytest
+import re
+import scipy.sparse
+import shutil
+import unittest.mock as mock
+
+import pipeline_tools.shared.submission.merge_looms as ml
+
+
+@pytest.fixture(scope='module')
+def test_data():
+    class Data:
+        genes = np.array([f'ENSG{index:05d}' for index in range(20)])
+        library = ['10X v2 sequencing']
+        species = ['Homo sapiens']
+        organ = ['heart']
+        project_id = '16ed4ad8-7319-46b2-8859-6fe1c1d73a82'
+        project_name = 'hca_adapter_testing'
+
+    return Data
+
+
+@pytest.fixture
+def input_looms(tmpdir, test_data):
+    """Write library looms whose even cells pass the UMI filter, returning their paths and dense matrices"""
+
+    def _input_looms(count, cells=6):
+        rng = np.random.RandomState(count)
+        paths = []
+        matrices = []
+        for index in range(count):
+            matrix = rng.randint(0, 5, (len(test_data.genes), cells)).astype(np.float32)
+            col_attrs = {
+                'cell_names': np.array([f'cell{cell}' for cell in range(cells)]),
+                'n_molecules': np.array(
+                    [ml.MIN_UMIS if cell % 2 == 0 else 1 for cell in range(cells)]
+                ),
+            }
+            file_attrs = {
+                'expression_data_type': 'exonic',
+                'optimus_output_schema_version': '1.0.0',
+                'pipeline_version': f'Optimus_v{index % 2}',
+                'input_id_metadata_field': 'sequencing_process.provenance.document_id',
+                'input_name_metadata_field': 'sequencing_input.biomaterial_core.biomaterial_id',
+                'input_id': f'input-{index}',
+                'input_name': f'name-{index}',
+            }
+            path = str(tmpdir.join(f'library{index}.loom'))
+            loompy.create(
+                path,
+                matrix,
+                {'ensembl_ids': test_data.genes},
+                col_attrs,
+                file_attrs=file_attrs,
+            )
+            paths.append(path)
+            matrices.append(matrix)
+        return paths, matrices
+
+    return _input_looms
+
+
+def merge(test_data, paths, output_loom_file, **kwargs):
+    return ml.MergeLooms(
+        paths,
+        test_data.library,
+        test_data.species,
+        test_data.organ,
+        test_data.project_id,
+        test_data.project_name,
+        output_loom_file,
+        **kwargs,
+    )
+
+
+def assert_merged(output_loom_file, matrices, cells=6):
+    expected_names = [
+        f'cell{cell}-{index}'
+        for index in range(len(matrices))
+        for cell in range(0, cells, 2)
+    ]
+    with loompy.connect(output_loom_file, mode='r') as ds:
+        assert list(ds.ca['cell_names']) == expected_names
+        assert np.array_equal(
+            ds[:, :], np.hstack([matrix[:, ::2] for matrix in matrices])
+        )
+        assert ds.attrs['input_id'] == ', '.join(
+            f'input-{index}' for index in range(len(matrices))
+        )
+        assert ds.attrs['input_name'] == ', '.join(
+            f'name-{index}' for index in range(len(matrices))
+        )
+        assert set(ds.attrs['pipeline_version'].split(', ')) == {
+            f'Optimus_v{index % 2}' for index in range(len(matrices))
+        }
+        assert ds.attrs['expression_data_type'] == 'exonic'
+        assert (
+            ds.attrs['project.provenance.document_id']
+            == '16ed4ad8-7319-46b2-8859-6fe1c1d73a82'
+        )
+
+
+class TestMergeLooms(object):
+    def test_read_filtered_loom(self, input_looms, test_data):
+        paths, matrices = input_looms(1)
+        matrix, row_attrs, col_attrs, global_attrs = ml.read_filtered_loom(paths[0], 3)
+
+        assert np.array_equal(matrix.toarray(), matrices[0][:, ::2])
+        assert np.array_equal(row_attrs['ensembl_ids'], test_data.genes)
+        assert list(col_attrs['cell_names']) == ['cell0-3', 'cell2-3', 'cell4-3']
+        assert global_attrs['input_id'] == 'input-0'
+
+    def test_merge_looms(self, input_looms, test_data, tmpdir):
+        paths, matrices = input_looms(3)
+        output_loom_file = str(tmpdir.join('merged.loom'))
+        with tmpdir.as_cwd():
+            merge(test_data, paths, output_loom_file)
+            assert not tmpdir.join('intermediate.loom').check()
+
+        assert_merged(output_loom_file, matrices)
+
+    def test_merge_looms_with_mismatched_genes(self, input_looms, test_data, tmpdir):
+        paths, _ = input_looms(2)
+        with loompy.connect(paths[1]) as ds:
+            ds.ra['ensembl_ids'] = test_data.genes[::-1]
+
+        with pytest.raises(ValueError, match=re.escape(paths[1])):
+            merge(test_data, paths, str(tmpdir.join('merged.loom')))
+
+    @pytest.mark.parametrize('num_workers', [1, 3])
+    def test_read_filtered_looms_keeps_input_order(self, input_looms, num_workers):
+        paths, matrices = input_looms(4)
+        results = ml.read_filtered_looms(paths, num_workers=num_workers)
+
+        assert [global_attrs['input_id'] for _, _, _, global_attrs in results] == [
+            f'input-{index}' for index in range(4)
+        ]
+        for index, (matrix, _, col_attrs, _) in enumerate(results):
+            assert np.array_equal(matrix.toarray(), matrices[index][:, ::2])
+            assert col_attrs['cell_names'][0] == f'cell0-{index}'
+
+    def test_read_filtered_looms_starts_at_most_one_worker_per_input(self, input_looms):
+        paths, _ = input_looms(2)
+        with mock.patch.object(
+            ml.process_utils, 'process_map', return_value=[]
+        ) as process_map:
+            ml.read_filtered_looms(paths, num_workers=64)
+        assert process_map.call_args[1]['num_workers'] == 2
+
+        paths, _ = input_looms(1)
+        with mock.patch.object(ml.process_utils, 'process_map') as process_map:
+            assert len(ml.read_filtered_looms(paths, num_workers=64)) == 1
+        process_map.assert_not_called()
+
+    def test_parallel_merge_matches_serial_merge(self, input_looms, test_data, tmpdir):
+        paths, matrices = input_looms(4)
+        merge(test_data, paths, str(tmpdir.join('serial.loom')), num_workers=1)
+        merge(test_data, paths, str(tmpdir.join('parallel.loom')), num_workers=2)
+
+        assert_merged(str(tmpdir.join('parallel.loom')), matrices)
+        with loompy.connect(
+            str(tmpdir.join('serial.loom')), mode='r'
+        ) as serial, loompy.connect(
+            str(tmpdir.join('parallel.loom')), mode='r'
+        ) as parallel:
+            assert np.array_equal(serial[:, :], parallel[:, :])
+            assert np.array_equal(serial.ca['cell_names'], parallel.ca['cell_names'])
+
+
+class TestBatchedMergeLooms(object):
+    def test_get_cells_per_batch(self, input_looms):
+        paths, _ = input_looms(1)
+        with loompy.connect(paths[0], mode='r') as ds:
+            # 20 genes of float32 counts read, picked and buffered as float64 take 320 bytes per cell
+            assert ml.get_cells_per_batch(ds, 1) == 2 ** 20 // 320
+            assert ml.get_cells_per_batch(ds, 0.0001) == 1
+
+    def test_iter_filtered_counts(self, input_looms):
+        paths, matrices = input_looms(1)
+        with loompy.connect(paths[0], mode='r') as ds:
+            cells = ml.get_filtered_cells(ds)
+            batches = list(ml.iter_filtered_counts(ds, cells, 4))
+
+        assert [batch.shape[1] for batch in batches] == [2, 1]
+        assert np.array_equal(np.hstack(batches), matrices[0][:, ::2])
+
+    @pytest.mark.parametrize('max_memory_mb', [0.0001, 0.002, 100])
+    def test_batched_merge_matches_in_memory_merge(
+        self, input_looms, test_data, tmpdir, max_memory_mb
+    ):
+        paths, matrices = input_looms(3)
+        merge(test_data, paths, str(tmpdir.join('in_memory.loom')), num_workers=1)
+        merge(
+            test_data,
+            paths,
+            str(tmpdir.join('batched.loom')),
+            max_memory_mb=max_memory_mb,
+        )
+
+        assert_merged(str(tmpdir.join('batched.loom')), matrices)
+        with loompy.connect(
+            str(tmpdir.join('in_memory.loom')), mode='r'
+        ) as in_memory, loompy.connect(
+            str(tmpdir.join('batched.loom')), mode='r'
+        ) as batched:
+            assert batched.layers[''].dtype == in_memory.layers[''].dtype
+            assert np.array_equal(batched[:, :], in_memory[:, :])
+            assert np.array_equal(
+                batched.ra['ensembl_ids'], in_memory.ra['ensembl_ids']
+            )
+            for key in in_memory.ca.keys():
+                assert np.array_equal(batched.ca[key], in_memory.ca[key])
+
+
+def assert_same_loom(first_loom_file, second_loom_file):
+    with loompy.connect(first_loom_file, mode='r') as first, loompy.connect(
+        second_loom_file, mode='r'
+    ) as second:
+        assert np.array_equal(first[:, :], second[:, :])
+        assert sorted(first.ca.keys()) == sorted(second.ca.keys())
+        for key in first.ca.keys():
+            assert np.array_equal(first.ca[key], second.ca[key])
+        for key in ml.LIST_JOINED_ATTRS:
+            assert first.attrs[key] == second.attrs[key]
+        for key in ml.SET_JOINED_ATTRS:
+            assert set(first.attrs[key].split(', ')) == set(
+                second.attrs[key].split(', ')
+            )
+
+
+class TestTreeMergeLooms(object):
+    @pytest.mark.parametrize('max_memory_mb', [None, 0.002])
+    def test_tree_merge_matches_flat_merge(
+        self, input_looms, test_data, tmpdir, max_memory_mb
+    ):
+        paths, matrices = input_looms(5)
+        flat = str(tmpdir.join('flat.loom'))
+        merge(test_data, paths, flat, num_workers=1)
+
+        partials = [
+            str(tmpdir.join('partial0.loom')),
+            str(tmpdir.join('partial1.loom')),
+        ]
+        merge(
+            test_data,
+            paths[:2],
+            partials[0],
+            num_workers=1,
+            max_memory_mb=max_memory_mb,
+        )
+        merge(
+            test_data,
+            paths[2:],
+            partials[1],
+            num_workers=1,
+            max_memory_mb=max_memory_mb,
+            suffix_offset=2,
+        )
+        combined = str(tmpdir.join('combined.loom'))
+        merge(
+            test_data,
+            partials,
+            combined,
+            num_workers=1,
+            max_memory_mb=max_memory_mb,
+            combine_partials=True,
+        )
+
+        assert_merged(combined, matrices)
+        assert_same_loom(flat, combined)
+
+    def test_partial_merge_suffixes_cells_from_offset(
+        self, input_looms, test_data, tmpdir
+    ):
+        paths, _ = input_looms(2)
+        partial = str(tmpdir.join('partial.loom'))
+        merge(test_data, paths, partial, num_workers=1, suffix_offset=7)
+
+        with loompy.connect(partial, mode='r') as ds:
+            assert ds.ca['cell_names'][0] == 'cell0-7'
+            assert ds.ca['cell_names'][-1] == 'cell4-8'
+
+
+class TestAppendMergeLooms(object):
+    @pytest.mark.parametrize('max_memory_mb', [None, 0.002])
+    def test_append_matches_flat_merge(
+        self, input_looms, test_data, tmpdir, max_memory_mb
+    ):
+        paths, matrices = input_looms(5)
+        flat = str(tmpdir.join('flat.loom'))
+        merge(test_data, paths, flat, num_workers=1)
+
+        appended = str(tmpdir.join('appended.loom'))
+        merge(test_data, paths[:3], appended, num_workers=1)
+        merge(test_data, paths[3:], appended, max_memory_mb=max_memory_mb, append=True)
+
+        assert_merged(appended, matrices)
+        assert_same_loom(flat, appended)
+
+    def test_failed_append_leaves_loom_unchanged(self, input_looms, test_data, tmpdir):
+        paths, _ = input_looms(4)
+        appended = str(tmpdir.join('appended.loom'))
+        original = str(tmpdir.join('original.loom'))
+        merge(test_data, paths[:2], appended, num_workers=1)
+        shutil.copy(appended, original)
+
+        # The cells of the first new library are added before the genes of the second one are found to differ
+        with loompy.connect(paths[3]) as ds:
+            ds.ra['ensembl_ids'] = test_data.genes[::-1]
+        files = tmpdir.listdir()
+        with pytest.raises(ValueError, match=re.escape(paths[3])):
+            merge(test_data, paths[2:], appended, max_memory_mb=0.0001, append=True)
+
+        assert_same_loom(original, appended)
+        # The copy the cells were appended to is removed
+        assert tmpdir.listdir() == files
+
+    def test_append_joins_project_metadata(self, input_looms, test_data, tmpdir):
+        paths, _ = input_looms(2)
+        appended = str(tmpdir.join('appended.loom'))
+        merge(test_data, paths[:1], appended, num_workers=1)
+        ml.MergeLooms(
+            paths[1:],
+            ['Smart-seq2'],
+            test_data.species,
+            ['kidney'],
+            test_data.project_id,
+            test_data.project_name,
+            appended,
+            append=True,
+        )
+
+        with loompy.connect(appended, mode='r') as ds:
+            assert set(
+                ds.attrs[
+                    'library_preparation_protocol.library_construction_approach'
+                ].split(', ')
+            ) == {'10X v2 sequencing', 'Smart-seq2'}
+            assert ds.attrs['donor_organism.genus_species'] == 'Homo sapiens'
+            assert set(ds.attrs['specimen_from_organism.organ'].split(', ')) == {
+                'heart',
+                'kidney',
+            }
+
+
+class TestH5MergeLooms(object):
+    @pytest.mark.parametrize('max_memory_mb', [None, 0.002])
+    def test_h5_output_matches_loom_output(
+        self, input_looms, test_data, tmpdir, max_memory_mb
+    ):
+        paths, _ = input_looms(3)
+        loom_file = str(tmpdir.join('merged.loom'))
+        h5_file = str(tmpdir.join('merged.h5'))
+        merge(test_data, paths, loom_file, num_workers=1)
+        merge(
+            test_data,
+            paths,
+            h5_file,
+            num_workers=1,
+            max_memory_mb=max_memory_mb,
+            output_format='h5',
+        )
+
+        with loompy.connect(loom_file, mode='r') as ds, h5py.File(h5_file, 'r') as h5:
+            matrix = h5['matrix']
+            assert list(matrix.attrs['shape']) == list(ds.shape)
+            counts = scipy.sparse.csc_matrix(
+                (matrix['data'][:], matrix['indices'][:], matrix['indptr'][:]),
+                shape=ds.shape,
+            )
+            assert np.array_equal(counts.toarray(), ds[:, :])
+            assert matrix['data'].compression == ml.H5_COMPRESSION
+            assert matrix['data'].chunks == (ml.H5_CHUNK_SIZE,)
+
+            assert list(h5['row_attrs/ensembl_ids'].asstr()[:]) == list(
+                ds.ra['ensembl_ids']
+            )
+            assert list(h5['col_attrs/cell_names'].asstr()[:]) == list(
+                ds.ca['cell_names']
+            )
+            assert np.array_equal(h5['col_attrs/n_molecules'][:], ds.ca['n_molecules'])
+            assert h5.attrs['input_id'] == ds.attrs['input_id']
+            assert (
+                h5.attrs['project.provenance.document_id']
+                == ds.attrs['project.provenance.document_id']
+            )
+
+    def test_unsupported_output_format(self, input_looms, test_data, tmpdir):
+        paths, _ = input_looms(1)
+        with pytest.raises(ValueError):
+            merge(
+                test_data, paths, str(tmpdir.join('merged.zarr')), output_format='zarr'
+            )
+        with pytest.raises(ValueError):
+            merge(
+                test_data,
+                paths,
+                str(tmpdir.join('merged.h5')),
+                output_format='h5',
+                append=True,
+            )
@@ -0,0 +1,78 @@
+import hashlib
+import pytest
+
+from pipeline_tools.shared import checksum_utils
+
+
+@pytest.fixture(scope='module')
+def test_data():
+    class Data:
+        content = b'The quick brown fox jumps over the lazy dog' * 1000
+        # crc32c of b'123456789', the standard CRC-32C check value
+        check_value = 0xE3069283
+
+    return Data
+
+
+class TestChecksumUtils(object):
+    def test_crc32c_value_matches_check_value(self, test_data):
+        assert checksum_utils.crc32c_value(b'123456789') == test_data.check_value
+
+    def test_crc32c_value_extends_running_checksum(self, test_data):
+        crc = checksum_utils.crc32c_value(test_data.content[:100])
+        crc = checksum_utils.crc32c_value(test_data.content[100:], crc)
+        assert crc == checksum_utils.crc32c_value(test_data.content)
+
+    @pytest.mark.parametrize('split', [0, 1, 7, 4096, 43000])
+    def test_crc32c_combine_equals_checksum_of_concatenation(self, test_data, split):
+        first, second = test_data.content[:split], test_data.content[split:]
+        combined = checksum_utils.crc32c_combine(
+            checksum_utils.crc32c_value(first),
+            checksum_utils.crc32c_value(second),
+            len(second),
+        )
+        assert combined == checksum_utils.crc32c_value(test_data.content)
+
+    def test_crc32c_formats_round_trip(self, test_data):
+        encoded = checksum_utils.crc32c_to_base64(test_data.check_value)
+        assert checksum_utils.crc32c_from_base64(encoded) == test_data.check_value
+        assert checksum_utils.crc32c_to_hex(test_data.check_value) == 'e3069283'
+        assert checksum_utils.crc32c_to_hex(1) == '00000001'
+
+    def test_compute_checksums_in_one_pass(self, test_data, tmpdir):
+        path = tmpdir.join('file.bin')
+        path.write_binary(test_data.content)
+        checksums = checksum_utils.compute_checksums(
+            str(path), md5=True, read_size=4096
+        )
+        assert checksums == {
+            'size': len(test_data.content),
+            'sha256': hashlib.sha256(test_data.content).hexdigest(),
+            'crc32c': checksum_utils.crc32c_to_hex(
+                checksum_utils.crc32c_value(test_data.content)
+            ),
+            'md5': hashlib.md5(test_data.content).hexdigest(),
+        }
+        assert checksum_utils.compute_checksums(str(path), sha256=False) == {
+            'size': len(test_data.content),
+            'crc32c': checksums['crc32c'],
+        }
+
+    def test_compute_checksums_of_empty_file(self, tmpdir):
+        path = tmpdir.join('empty.bin')
+        path.write_binary(b'')
+        assert checksum_utils.compute_checksums(str(path)) == {
+            'size': 0,
+            'sha256': hashlib.sha256(b'').hexdigest(),
+            'crc32c': '00000000',
+        }
+
+    def test_compute_checksums_parallel_preserves_order(self, tmpdir):
+        paths = []
+        for n in range(5):
+            path = tmpdir.join('file{}.bin'.format(n))
+            path.write_binary(b'x' * n)
+            paths.append(str(path))
+        results = checksum_utils.compute_checksums_parallel(paths, num_workers=2)
+        assert [result['size'] for result in results] == list(range(5))
+        assert results == [checksum_utils.compute_checksums(path) for path in paths]
@@ -1,9 +1,13 @@
+import datetime
+import google.api_core.exceptions
 import google.auth.credentials
 import io
 import pytest
 import unittest.mock as mock
+from tenacity import wait_none
 
-from pipeline_tools.shared import gcs_utils
+from pipeline_tools.shared import checksum_utils, gcs_utils, transfer_utils
+from pipeline_tools.shared.exceptions import ChecksumMismatchError
 
 
 @pytest.fixture(scope='module')
@@ -20,6 +24,76 @@ def test_data():
     return Data
 
 
+@pytest.fixture
+def sliced_blob_client():
+    def _sliced_blob_client(content, crc32c=None):
+        """Build a mocked storage client whose blobs serve byte ranges of content."""
+
+        def download_to_file(file_obj, start=None, end=None):
+            file_obj.write(content[start : end + 1])
+
+        blob = mock.Mock(
+            size=len(content),
+            generation=1,
+            content_encoding=None,
+            crc32c=crc32c
+            or checksum_utils.crc32c_to_base64(checksum_utils.crc32c_value(content)),
+        )
+        blob.download_to_file.side_effect = download_to_file
+        client = mock.Mock()
+        client.bucket.return_value.blob.return_value = blob
+        gcs_client = gcs_utils.GoogleCloudStorageClient(
+            key_location="test_key", scopes=['test_scope']
+        )
+        gcs_client.storage_client = client
+        return gcs_client, blob
+
+    return _sliced_blob_client
+
+
+@pytest.fixture
+def upload_client():
+    """Build a mocked storage client whose blobs look like the response of an upload."""
+    gcs_client = gcs_utils.GoogleCloudStorageClient(
+        key_location="test_key", scopes=['test_scope']
+    )
+    gcs_client.storage_client = mock.Mock()
+    bucket = gcs_client.storage_client.bucket.return_value
+    bucket.blob.return_value = mock.Mock(
+        size=None, generation=1, time_created=None, updated=None
+    )
+    return gcs_client, bucket
+
+
+@pytest.fixture
+def listing_client():
+    def make_blob(name, size, crc32c, generation):
+        blob = mock.Mock(
+            size=size,
+            crc32c=crc32c,
+            md5_hash='md5-{}'.format(name),
+            content_type='application/octet-stream',
+            generation=generation,
+            time_created=datetime.datetime(
+                2021, 7, 8, 17, 22, 45, tzinfo=datetime.timezone.utc
+            ),
+            updated=None,
+        )
+        blob.name = name
+        return blob
+
+    gcs_client = gcs_utils.GoogleCloudStorageClient(
+        key_location="test_key", scopes=['test_scope']
+    )
+    gcs_client.storage_client = mock.Mock()
+    bucket = gcs_client.storage_client.bucket.return_value
+    bucket.list_blobs.return_value = [
+        make_blob('staging/a.json', 2, 'crc-a', 1),
+        make_blob('staging/data/b.bam', 2048, 'crc-b', 2),
+    ]
+    return gcs_client, bucket
+
+
 class TestGCSUtils(object):
     def test_get_filename_from_gs_link(self):
         """Test if get_filename_from_gs_link can get correct filename from google cloud storage link.
@@ -71,3 +145,180 @@ class TestGCSUtils(object):
         assert gcs_client is not None
         assert gcs_client.key_location == "test_key"
         assert gcs_client.scopes[0] == "test_scope"
+
+    def test_download_gcs_blob_to_file_assembles_slices(
+        self, sliced_blob_client, tmpdir
+    ):
+        """Test if download_gcs_blob_to_file writes every byte range into place and validates the crc32c."""
+        content = bytes(range(256)) * 41
+        gcs_client, blob = sliced_blob_client(content)
+        destination = str(tmpdir.join('downloaded'))
+        result = gcs_utils.download_gcs_blob_to_file(
+            gcs_client, 'BUCKET_NAME', 'test_blob', destination, slice_size=1000
+        )
+        assert result == destination
+        with open(destination, 'rb') as f:
+            assert f.read() == content
+        assert blob.download_to_file.call_count == 11
+
+    def test_download_gcs_blob_to_file_empty_blob(self, sliced_blob_client, tmpdir):
+        """Test if download_gcs_blob_to_file creates an empty file for an empty blob."""
+        gcs_client, blob = sliced_blob_client(b'')
+        destination = str(tmpdir.join('downloaded'))
+        gcs_utils.download_gcs_blob_to_file(
+            gcs_client, 'BUCKET_NAME', 'test_blob', destination
+        )
+        with open(destination, 'rb') as f:
+            assert f.read() == b''
+
+    def test_download_gcs_blob_to_file_checksum_mismatch(
+        self, sliced_blob_client, tmpdir
+    ):
+        """Test if download_gcs_blob_to_file raises and removes the file when the crc32c does not match."""
+        gcs_client, blob = sliced_blob_client(b'some content', crc32c='AAAAAA==')
+        destination = str(tmpdir.join('downloaded'))
+        with pytest.raises(ChecksumMismatchError):
+            gcs_utils.download_gcs_blob_to_file(
+                gcs_client, 'BUCKET_NAME', 'test_blob', destination, slice_size=4
+            )
+        assert not tmpdir.join('downloaded').exists()
+
+    def test_download_gcs_blob_to_file_rejects_oversized_range(
+        self, sliced_blob_client, tmpdir
+    ):
+        """Test if a range response longer than the range is refused rather than written over the next range."""
+        gcs_client, blob = sliced_blob_client(b'some content')
+        blob.download_to_file.side_effect = lambda file_obj, start, end: file_obj.write(
+            b'x' * (end - start + 2)
+        )
+        destination = str(tmpdir.join('downloaded'))
+        with pytest.raises(IOError):
+            gcs_utils.download_gcs_blob_to_file(
+                gcs_client, 'BUCKET_NAME', 'test_blob', destination, slice_size=4
+            )
+
+    def test_upload_files_reports_summary(self, upload_client, tmpdir):
+        """Test if upload_files uploads every file, uses resumable uploads for large files and sums the bytes."""
+        small, large = tmpdir.join('small.json'), tmpdir.join('large.bam')
+        small.write('{}')
+        large.write('x' * 100)
+        gcs_client, bucket = upload_client
+
+        with mock.patch.object(gcs_utils, 'RESUMABLE_UPLOAD_THRESHOLD', 50):
+            summary = gcs_utils.upload_files(
+                gcs_client,
+                [
+                    (str(small), 'gs://bucket/metadata/'),
+                    (str(large), 'gs://bucket/data/renamed.bam'),
+                ],
+            )
+
+        assert summary['files'] == 2
+        assert summary['succeeded'] == 2
+        assert summary['failed'] == 0
+        assert summary['bytes'] == 102
+        assert [t['destination'] for t in summary['transfers']] == [
+            'gs://bucket/metadata/small.json',
+            'gs://bucket/data/renamed.bam',
+        ]
+        bucket.blob.assert_any_call('metadata/small.json', chunk_size=None)
+        bucket.blob.assert_any_call(
+            'data/renamed.bam', chunk_size=gcs_utils.RESUMABLE_UPLOAD_CHUNK_SIZE
+        )
+
+    def test_upload_files_retries_transient_errors(self, upload_client, tmpdir):
+        """Test if upload_files retries a transient error and records failures without raising."""
+        source = tmpdir.join('small.json')
+        source.write('{}')
+        gcs_client, bucket = upload_client
+        blob = bucket.blob.return_value
+        blob.upload_from_filename.side_effect = [
+            google.api_core.exceptions.ServiceUnavailable('try again'),
+            None,
+        ]
+
+        with mock.patch.object(
+            transfer_utils, 'wait_exponential', return_value=wait_none()
+        ):
+            summary = gcs_utils.upload_files(
+                gcs_client,
+                [
+                    (str(source), 'gs://bucket/metadata/'),
+                    (str(tmpdir.join('missing.json')), 'gs://bucket/metadata/'),
+                ],
+            )
+
+        assert summary['succeeded'] == 1
+        assert summary['failed'] == 1
+        assert summary['transfers'][0]['attempts'] == 2
+        assert summary['transfers'][0]['error'] is None
+        assert summary['transfers'][1]['attempts'] == 1
+        assert 'FileNotFoundError' in summary['transfers'][1]['error']
+
+    def test_copy_blob_rewrites_until_done(self, upload_client):
+        """Test if copy_blob keeps calling rewrite with the returned token until the copy is complete."""
+        gcs_client, bucket = upload_client
+        blob = bucket.blob.return_value
+        blob.name = 'staging/a.bam'
+        blob.crc32c = 'crc'
+        blob.rewrite.side_effect = [('token', 10, 20), (None, 20, 20)]
+
+        record = gcs_utils.copy_blob(
+            gcs_client, 'gs://source/outputs/a.bam', 'gs://bucket/staging/a.bam'
+        )
+
+        assert record['name'] == 'gs://bucket/staging/a.bam'
+        assert record['crc32c'] == 'crc'
+        assert blob.rewrite.call_count == 2
+        assert blob.rewrite.call_args == mock.call(blob, token='token')
+        gcs_client.storage_client.bucket.assert_any_call('source')
+        bucket.blob.assert_any_call('outputs/a.bam')
+
+    def test_list_blob_metadata_fills_cache(self, listing_client):
+        """Test if list_blob_metadata returns a record per object and answers later lookups from the cache."""
+        gcs_client, bucket = listing_client
+        cache = gcs_utils.BlobMetadataCache()
+
+        records = gcs_utils.list_blob_metadata(
+            gcs_client, 'gs://bucket/staging/', cache=cache
+        )
+
+        assert sorted(records) == [
+            'gs://bucket/staging/a.json',
+            'gs://bucket/staging/data/b.bam',
+        ]
+        record = records['gs://bucket/staging/data/b.bam']
+        assert record['size'] == 2048
+        assert record['crc32c'] == 'crc-b'
+        assert record['generation'] == 2
+        assert record['time_created'] == '2021-07-08T17:22:45+00:00'
+        bucket.list_blobs.assert_called_once_with(
+            prefix='staging/', fields=gcs_utils.LIST_BLOB_FIELDS
+        )
+
+        assert (
+            gcs_utils.get_blob_metadata(
+                gcs_client, 'gs://bucket/staging/a.json', cache=cache
+            )
+            == records['gs://bucket/staging/a.json']
+        )
+        assert (
+            gcs_utils.get_blob_metadata(
+                gcs_client, 'gs://bucket/staging/missing.json', cache=cache
+            )
+            is None
+        )
+        bucket.get_blob.assert_not_called()
+
+    def test_blob_metadata_cache_drops_deleted_objects(self):
+        """Test if listing a prefix again forgets cached objects that are no longer listed."""
+        cache = gcs_utils.BlobMetadataCache()
+        cache.update(
+            [
+                {'name': 'gs://bucket/staging/a.json', 'generation': 1},
+                {'name': 'gs://bucket/other/c.json', 'generation': 1},
+            ]
+        )
+        cache.update([], listed_prefix='gs://bucket/staging/')
+        assert cache.get('gs://bucket/staging/a.json') is None
+        assert cache.get('gs://bucket/other/c.json')
@@ -0,0 +1,96 @@
+import json
+import os
+import pytest
+from pathlib import Path
+
+from pipeline_tools.shared import json_utils
+
+
+@pytest.fixture(scope='module')
+def test_data():
+    class Data:
+        document = {
+            'start': '2021-07-14T16:01:45.123Z',
+            'inputs': {'fasta': 'gs://ref.fa', 'version': 3},
+            'calls': {
+                'wf.a': [
+                    {'shardIndex': 0, 'inputs': {'x': 'brackets ]}[{ and "quotes"'}},
+                    {'shardIndex': 1, 'inputs': {'x': 'unicode é', 'y': [1, 2.5e3]}},
+                ],
+                'wf.b': [],
+                'wf.ésc"aped': [{'shardIndex': 0, 'outputs': None}],
+            },
+            'end': None,
+        }
+
+    return Data
+
+
+@pytest.fixture
+def json_file(tmpdir, test_data):
+    path = tmpdir.join('metadata.json')
+    path.write(json.dumps(test_data.document, indent=2))
+    return str(path)
+
+
+class TestReadJsonPaths(object):
+    def test_reads_selected_values_only(self, json_file, test_data):
+        metadata = json_utils.read_json_paths(
+            json_file,
+            [('start',), ('inputs', '*'), ('calls', 'wf.a', 1, 'inputs', 'y')],
+        )
+        assert metadata == {
+            'start': test_data.document['start'],
+            'inputs': test_data.document['inputs'],
+            'calls': {'wf.a': {1: {'inputs': {'y': [1, 2.5e3]}}}},
+        }
+
+    def test_wildcard_keeps_arrays_as_lists(self, json_file, test_data):
+        metadata = json_utils.read_json_paths(
+            json_file, [('calls', '*', '*', 'shardIndex')]
+        )
+        assert metadata['calls']['wf.a'] == [{'shardIndex': 0}, {'shardIndex': 1}]
+        assert metadata['calls']['wf.b'] == []
+        assert metadata['calls']['wf.ésc"aped'] == [{'shardIndex': 0}]
+
+    def test_merges_wildcard_and_specific_paths(self, json_file, test_data):
+        metadata = json_utils.read_json_paths(
+            json_file, [('calls', 'wf.a', 0), ('calls', '*', 1, 'shardIndex')]
+        )
+        assert metadata['calls']['wf.a'] == {
+            0: test_data.document['calls']['wf.a'][0],
+            1: {'shardIndex': 1},
+        }
+        assert metadata['calls']['wf.b'] == {}
+
+    def test_missing_paths_are_left_out(self, json_file):
+        metadata = json_utils.read_json_paths(
+            json_file, [('missing',), ('calls', 'wf.a', 5), ('end', 'deeper')]
+        )
+        assert metadata == {'calls': {'wf.a': {}}, 'end': None}
+
+    def test_empty_path_reads_whole_document(self, json_file, test_data):
+        assert json_utils.read_json_paths(json_file, [()]) == test_data.document
+
+    def test_matches_full_load_of_workflow_metadata(self):
+        metadata_json = (
+            f'{Path(os.path.split(__file__)[0]).absolute().parents[0]}'
+            '/data/metadata/ss2_vx/multisample_metadata.json'
+        )
+        with open(metadata_json) as f:
+            expected = json.load(f)
+        metadata = json_utils.read_json_paths(
+            metadata_json, [('inputs', '*'), ('calls', '*', '*', 'outputs'), ('end',)]
+        )
+        assert metadata['inputs'] == expected['inputs']
+        assert metadata['end'] == expected['end']
+        for name, shards in expected['calls'].items():
+            assert metadata['calls'][name] == [
+                {'outputs': shard['outputs']} for shard in shards
+            ]
+
+    def test_rejects_malformed_documents(self, tmpdir):
+        path = tmpdir.join('malformed.json')
+        path.write('{"inputs": {"a": 1} "start": 2}')
+        with pytest.raises(ValueError):
+            json_utils.read_json_paths(str(path), [('start',)])
@@ -0,0 +1,32 @@
+import os
+import pytest
+
+from pipeline_tools.shared import process_utils
+
+
+def _square(value):
+    return value * value
+
+
+def _worker_pid(_):
+    return os.getpid()
+
+
+def _fail(value):
+    raise ValueError(value)
+
+
+class TestProcessMap(object):
+    def test_process_map_keeps_item_order(self):
+        assert process_utils.process_map(_square, range(10), num_workers=3) == [
+            value * value for value in range(10)
+        ]
+
+    def test_process_map_runs_in_worker_processes(self):
+        assert os.getpid() not in process_utils.process_map(
+            _worker_pid, range(4), num_workers=2
+        )
+
+    def test_process_map_raises_worker_errors(self):
+        with pytest.raises(ValueError):
+            process_utils.process_map(_fail, [1, 2], num_workers=2)
@@ -0,0 +1,283 @@
+import pytest
+import unittest.mock as mock
+
+from pipeline_tools.shared import checksum_utils, gcs_utils, storage_backends
+from pipeline_tools.shared.exceptions import ChecksumMismatchError
+
+
+@pytest.fixture
+def local_tree(tmpdir):
+    tmpdir.join('staging', 'metadata', 'a.json').write('{}', ensure=True)
+    tmpdir.join('staging', 'data', 'b.bam').write('bam content', ensure=True)
+    tmpdir.join('other', 'c.json').write('{}', ensure=True)
+    return tmpdir
+
+
+class TestLocalStorageBackend(object):
+    def test_read_and_read_range(self, local_tree):
+        backend = storage_backends.LocalStorageBackend()
+        url = str(local_tree.join('staging', 'data', 'b.bam'))
+        assert backend.read(url) == b'bam content'
+        assert backend.read_range(url, 4, 10) == b'content'
+        assert backend.read('file://' + url) == b'bam content'
+
+    def test_write_creates_directories_and_returns_record(self, tmpdir):
+        backend = storage_backends.LocalStorageBackend()
+        url = str(tmpdir.join('new', 'dir', 'file.json'))
+        record = backend.write(url, b'123456789')
+        assert tmpdir.join('new', 'dir', 'file.json').read() == '123456789'
+        assert record['name'] == url
+        assert record['size'] == 9
+        assert record['crc32c'] == checksum_utils.crc32c_to_base64(0xE3069283)
+        assert record['md5_hash'] == 'JfnnlDI7RTiF9RgfG2JNCw=='
+
+    def test_upload_creates_directories_and_returns_record(self, tmpdir):
+        backend = storage_backends.LocalStorageBackend()
+        source = tmpdir.join('source.json')
+        source.write('123456789')
+        url = str(tmpdir.join('new', 'dir', 'file.json'))
+        record = backend.upload(str(source), url)
+        assert tmpdir.join('new', 'dir', 'file.json').read() == '123456789'
+        assert record['name'] == url
+        assert record['size'] == 9
+        assert record['crc32c'] == checksum_utils.crc32c_to_base64(0xE3069283)
+        assert record['md5_hash'] == 'JfnnlDI7RTiF9RgfG2JNCw=='
+        assert tmpdir.join('new', 'dir').listdir() == [
+            tmpdir.join('new', 'dir', 'file.json')
+        ]
+
+    def test_upload_and_download(self, local_tree, tmpdir):
+        backend = storage_backends.LocalStorageBackend()
+        source = str(local_tree.join('staging', 'data', 'b.bam'))
+        url = 'file://' + str(tmpdir.join('copies', 'b.bam'))
+        record = backend.upload(source, url)
+        assert record['name'] == url
+        assert record['size'] == len('bam content')
+
+        destination = str(tmpdir.join('downloaded.bam'))
+        backend.download(url, destination)
+        assert tmpdir.join('downloaded.bam').read() == 'bam content'
+
+    def test_list_uses_string_prefixes(self, local_tree):
+        backend = storage_backends.LocalStorageBackend()
+        prefix = 'file://' + str(local_tree.join('staging')) + '/'
+        records = backend.list(prefix)
+        assert sorted(records) == [prefix + 'data/b.bam', prefix + 'metadata/a.json']
+        assert records[prefix + 'data/b.bam']['size'] == len('bam content')
+
+        partial_prefix = str(local_tree.join('staging', 'me'))
+        assert list(backend.list(partial_prefix)) == [
+            str(local_tree.join('staging', 'metadata', 'a.json'))
+        ]
+        assert backend.list(str(local_tree.join('missing')) + '/') == {}
+
+    def test_list_computes_checksums_on_first_read(self, local_tree):
+        backend = storage_backends.LocalStorageBackend()
+        with mock.patch.object(
+            storage_backends.checksum_utils,
+            'compute_checksums',
+            wraps=checksum_utils.compute_checksums,
+        ) as compute_checksums:
+            path = str(local_tree.join('staging', 'metadata', 'a.json'))
+            record = backend.list(str(local_tree.join('staging')) + '/')[path]
+            assert record['size'] == 2
+            compute_checksums.assert_not_called()
+
+            assert record['crc32c'] == checksum_utils.crc32c_to_base64(
+                checksum_utils.file_crc32c(path)
+            )
+            assert record.get('md5_hash') == 'mZFLkyvTelC5g8XnyQrpOw=='
+            compute_checksums.assert_called_once()
+
+    def test_stat(self, local_tree):
+        backend = storage_backends.LocalStorageBackend()
+        assert backend.stat(str(local_tree.join('other', 'c.json')))['size'] == 2
+        assert backend.stat(str(local_tree.join('other', 'missing.json'))) is None
+        assert backend.stat(str(local_tree.join('other'))) is None
+
+
+class TestGCSStorageBackend(object):
+    def test_upload_records_metadata_in_cache(self, tmpdir):
+        source = tmpdir.join('a.json')
+        source.write('{}')
+        gcs_client = gcs_utils.GoogleCloudStorageClient(
+            key_location="test_key", scopes=['test_scope']
+        )
+        gcs_client.storage_client = mock.Mock()
+        blob = mock.Mock(
+            size=None, crc32c='crc', generation=3, time_created=None, updated=None
+        )
+        blob.name = 'staging/a.json'
+        gcs_client.storage_client.bucket.return_value.blob.return_value = blob
+        backend = storage_backends.GCSStorageBackend(gcs_client)
+
+        record = backend.upload(str(source), 'gs://bucket/staging/a.json')
+
+        assert record['name'] == 'gs://bucket/staging/a.json'
+        assert record['size'] == 2
+        assert backend.cache.get('gs://bucket/staging/a.json') == record
+
+    def test_read_and_read_range(self):
+        gcs_client = mock.Mock()
+        blob = gcs_client.storage_client.bucket.return_value.blob.return_value
+        blob.download_to_file.side_effect = lambda f, start=None, end=None: f.write(
+            b'bam content'[start or 0 : None if end is None else end + 1]
+        )
+        backend = storage_backends.GCSStorageBackend(gcs_client)
+
+        assert backend.read('gs://bucket/staging/b.bam') == b'bam content'
+        assert backend.read_range('gs://bucket/staging/b.bam', 4, 10) == b'content'
+        gcs_client.storage_client.bucket.assert_called_with('bucket')
+        gcs_client.storage_client.bucket.return_value.blob.assert_called_with(
+            'staging/b.bam'
+        )
+
+    def test_write_records_metadata_in_cache(self):
+        gcs_client = mock.Mock()
+        blob = mock.Mock(
+            size=None, crc32c='crc', generation=3, time_created=None, updated=None
+        )
+        blob.name = 'staging/a.json'
+        gcs_client.storage_client.bucket.return_value.blob.return_value = blob
+        backend = storage_backends.GCSStorageBackend(gcs_client)
+
+        record = backend.write('gs://bucket/staging/a.json', b'{}')
+
+        blob.upload_from_string.assert_called_once_with(b'{}')
+        assert record['name'] == 'gs://bucket/staging/a.json'
+        assert record['size'] == 2
+        assert backend.cache.get('gs://bucket/staging/a.json') == record
+
+
+class TestGetStorageBackend(object):
+    def test_storage_backend_is_abstract(self):
+        with pytest.raises(TypeError):
+            storage_backends.StorageBackend()
+
+    def test_selects_backend_by_scheme(self):
+        gcs_client = mock.Mock()
+        backend = storage_backends.get_storage_backend('gs://bucket/path', gcs_client)
+        assert isinstance(backend, storage_backends.GCSStorageBackend)
+        assert backend.gcs_client is gcs_client
+        assert isinstance(
+            storage_backends.get_storage_backend('file:///tmp/path'),
+            storage_backends.LocalStorageBackend,
+        )
+        assert isinstance(
+            storage_backends.get_storage_backend('relative/path'),
+            storage_backends.LocalStorageBackend,
+        )
+
+    def test_rejects_unknown_scheme(self):
+        with pytest.raises(ValueError):
+            storage_backends.get_storage_backend('s3://bucket/path')
+
+
+class TestCopyFiles(object):
+    def test_copy_files_between_local_directories(self, local_tree, tmpdir):
+        destination_root = str(tmpdir.join('copied'))
+        transfers = [
+            (
+                str(local_tree.join('staging', 'data', 'b.bam')),
+                destination_root + '/data/b.bam',
+            ),
+            (
+                str(local_tree.join('staging', 'metadata', 'a.json')),
+                'file://' + destination_root + '/metadata/a.json',
+            ),
+        ]
+        summary = storage_backends.copy_files(transfers)
+        assert summary['succeeded'] == 2
+        assert summary['bytes'] == len('bam content') + 2
+        assert tmpdir.join('copied', 'data', 'b.bam').read() == 'bam content'
+        assert tmpdir.join('copied', 'metadata', 'a.json').read() == '{}'
+
+    def test_copy_object_detects_checksum_mismatch(self, local_tree):
+        destination_backend = mock.Mock()
+        destination_backend.upload.return_value = {'crc32c': 'AAAAAA==', 'size': 2}
+        with pytest.raises(ChecksumMismatchError):
+            storage_backends.copy_object(
+                storage_backends.LocalStorageBackend(),
+                str(local_tree.join('other', 'c.json')),
+                destination_backend,
+                'gs://bucket/c.json',
+            )
+
+    def test_copy_object_between_gs_links_stays_on_server(self):
+        backend = storage_backends.GCSStorageBackend(mock.Mock())
+        record = {'name': 'gs://bucket/staging/a.bam', 'crc32c': 'crc', 'size': 20}
+        with mock.patch.object(
+            storage_backends.gcs_utils, 'copy_blob', return_value=record
+        ) as copy_blob, mock.patch.object(
+            backend, 'stat', return_value={'crc32c': 'crc'}
+        ), mock.patch.object(
+            backend, 'download'
+        ) as download:
+            size = storage_backends.copy_object(
+                backend, 'gs://source/a.bam', backend, 'gs://bucket/staging/a.bam'
+            )
+        assert size == 20
+        copy_blob.assert_called_once_with(
+            backend.gcs_client, 'gs://source/a.bam', 'gs://bucket/staging/a.bam'
+        )
+        download.assert_not_called()
+        assert backend.cache.get('gs://bucket/staging/a.bam') == record
+
+    def test_copy_object_between_gs_links_detects_checksum_mismatch(self):
+        backend = storage_backends.GCSStorageBackend(mock.Mock())
+        record = {'name': 'gs://bucket/staging/a.bam', 'crc32c': 'crc', 'size': 20}
+        with mock.patch.object(
+            storage_backends.gcs_utils, 'copy_blob', return_value=record
+        ), mock.patch.object(backend, 'stat', return_value={'crc32c': 'other'}):
+            with pytest.raises(ChecksumMismatchError):
+                storage_backends.copy_object(
+                    backend, 'gs://source/a.bam', backend, 'gs://bucket/staging/a.bam'
+                )
+
+    def test_copy_files_skips_unchanged_destinations(self, local_tree, tmpdir):
+        source = local_tree.join('staging', 'data')
+        source.join('c.bam').write('new content')
+        tmpdir.join('copied', 'b.bam').write('bam content', ensure=True)
+        tmpdir.join('copied', 'c.bam').write('old content')
+        transfers = [
+            (str(source.join(name)), str(tmpdir.join('copied', name)))
+            for name in ['b.bam', 'c.bam', 'd.bam']
+        ]
+        source.join('d.bam').write('missing at destination')
+
+        summary = storage_backends.copy_files(transfers, skip_unchanged=True)
+
+        assert summary['files'] == 3
+        assert summary['skipped'] == 1
+        assert summary['succeeded'] == 2
+        assert [t['skipped'] for t in summary['transfers']] == [True, False, False]
+        assert [t['source'] for t in summary['transfers']] == [s for s, _ in transfers]
+        assert tmpdir.join('copied', 'c.bam').read() == 'new content'
+        assert tmpdir.join('copied', 'd.bam').read() == 'missing at destination'
+
+    def test_copy_files_stats_destinations_without_directory(self, local_tree, tmpdir):
+        source = str(local_tree.join('other', 'c.json'))
+        tmpdir.join('work', 'c.json').write('{}', ensure=True)
+        with tmpdir.join('work').as_cwd(), mock.patch.object(
+            storage_backends.LocalStorageBackend, 'list'
+        ) as list_prefix:
+            summary = storage_backends.copy_files(
+                [(source, 'c.json'), (source, 'd.json')], skip_unchanged=True
+            )
+        list_prefix.assert_not_called()
+        assert [t['skipped'] for t in summary['transfers']] == [True, False]
+        assert tmpdir.join('work', 'd.json').read() == '{}'
+
+    def test_is_unchanged_compares_size_before_reading(self, local_tree):
+        backend = storage_backends.LocalStorageBackend()
+        source = str(local_tree.join('other', 'c.json'))
+        record = backend.stat(source)
+        assert storage_backends.is_unchanged(backend, source, record)
+        assert not storage_backends.is_unchanged(backend, source, None)
+        with mock.patch.object(
+            storage_backends.checksum_utils, 'file_crc32c'
+        ) as file_crc32c:
+            assert not storage_backends.is_unchanged(
+                backend, source, dict(record, size=3)
+            )
+            file_crc32c.assert_not_called()
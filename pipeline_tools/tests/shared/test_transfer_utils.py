@@ -0,0 +1,73 @@
+import google.api_core.exceptions
+import json
+import pytest
+import unittest.mock as mock
+from tenacity import wait_none
+
+from pipeline_tools.shared import transfer_utils
+
+
+@pytest.fixture
+def no_wait():
+    with mock.patch.object(
+        transfer_utils, 'wait_exponential', return_value=wait_none()
+    ):
+        yield
+
+
+class TestTransferUtils(object):
+    def test_run_transfers_keeps_input_order(self):
+        transfers = [
+            ('source-{}'.format(i), 'destination-{}'.format(i)) for i in range(50)
+        ]
+        summary = transfer_utils.run_transfers(
+            transfers, lambda source, destination: len(source), num_workers=8
+        )
+        assert summary['files'] == 50
+        assert summary['succeeded'] == 50
+        assert summary['failed'] == 0
+        assert summary['bytes'] == sum(len(source) for source, _ in transfers)
+        assert [
+            (t['source'], t['destination']) for t in summary['transfers']
+        ] == transfers
+
+    def test_run_transfers_retries_transient_errors(self, no_wait):
+        transfer_fn = mock.Mock(
+            side_effect=[google.api_core.exceptions.ServiceUnavailable('retry'), 10]
+        )
+        summary = transfer_utils.run_transfers([('a', 'b')], transfer_fn)
+        assert summary['succeeded'] == 1
+        assert summary['transfers'][0]['attempts'] == 2
+        assert summary['transfers'][0]['bytes'] == 10
+
+    def test_run_transfers_records_failures(self, no_wait):
+        def transfer_fn(source, destination):
+            if source == 'missing':
+                raise FileNotFoundError(source)
+            raise google.api_core.exceptions.ServiceUnavailable('down')
+
+        summary = transfer_utils.run_transfers(
+            [('missing', 'b'), ('flaky', 'c')], transfer_fn, max_attempts=3
+        )
+        assert summary['succeeded'] == 0
+        assert summary['failed'] == 2
+        assert summary['transfers'][0]['attempts'] == 1
+        assert 'FileNotFoundError' in summary['transfers'][0]['error']
+        assert summary['transfers'][1]['attempts'] == 3
+
+    def test_is_retryable_transfer_error(self):
+        assert transfer_utils.is_retryable_transfer_error(IOError('connection reset'))
+        assert transfer_utils.is_retryable_transfer_error(
+            google.api_core.exceptions.TooManyRequests('slow down')
+        )
+        assert not transfer_utils.is_retryable_transfer_error(
+            google.api_core.exceptions.Forbidden('no access')
+        )
+        assert not transfer_utils.is_retryable_transfer_error(PermissionError('no'))
+
+    def test_write_summary(self, tmpdir):
+        summary = transfer_utils.run_transfers([('a', 'b')], lambda s, d: 1)
+        summary_file = str(tmpdir.join('summary.json'))
+        transfer_utils.write_summary(summary, summary_file)
+        with open(summary_file) as f:
+            assert json.load(f) == summary
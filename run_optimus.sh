@@ -61,19 +61,16 @@ python3 pipeline_tools/shared/submission/create_analysis_protocol.py \
   --workspace_version $WORKSPACE_VERSION \
   --pipeline_version $PIPELINE_VERSION
 
-# Create intermediate bam/loom descriptor files
+# Create intermediate bam/loom descriptor files, all from one manifest
 for f in "${INTERMEDIATE_RUN_OUTPUT_FILES[@]}"
 do
-  python3 pipeline_tools/shared/submission/create_file_descriptor.py \
-    --size $SIZE \
-    --sha256 $SHA256 \
-    --crc32c $CRC32C \
-    --pipeline_type "Optimus" \
-    --file_path $f \
-    --input_uuid $INPUT_UUID \
-    --creation_time $CREATION_TIME \
-    --workspace_version $WORKSPACE_VERSION
-done
+  echo "{\"file_path\": \"$f\", \"size\": $SIZE, \"sha256\": \"$SHA256\", \"crc32c\": \"$CRC32C\", \"input_uuid\": \"$INPUT_UUID\", \"creation_time\": \"$CREATION_TIME\"}"
+done > descriptor_manifest.jsonl
+
+python3 pipeline_tools/shared/submission/create_file_descriptor.py \
+  --manifest descriptor_manifest.jsonl \
+  --pipeline_type "Optimus" \
+  --workspace_version $WORKSPACE_VERSION
 
 # Create intermediate links file
 python3 pipeline_tools/shared/submission/create_links.py \
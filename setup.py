@@ -17,6 +17,7 @@ setup(
         'arrow>=0.12.1',
         'google-auth>=1.6.1,<2',
         'google-cloud-storage>=1.10.0,<2',
+        'google-crc32c>=1.0.0,<2',
         'hca>=7.0.0,<8',
         'loompy==3.0.6',
         'mock>=2.0.0,<3',
@@ -45,7 +46,8 @@ setup(
             'merge-looms=pipeline_tools.shared.submission.merge_looms:main',
             'get-reference-file-details=pipeline_tools.shared.submission.get_reference_details:main',
             'get-process-input-ids=pipeline_tools.shared.submission.get_process_input_ids:main',
-            'copy-adapter-outputs=pipeline_tools.shared.submission.copy_adapter_outputs:main'
+            'copy-adapter-outputs=pipeline_tools.shared.submission.copy_adapter_outputs:main',
+            'list-bucket-objects=pipeline_tools.shared.submission.list_bucket_objects:main'
         ]
     },
     include_package_data=True,